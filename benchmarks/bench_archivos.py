@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Benchmark: recepción de un FILE_CHUNK de 10MB (CPU + bytes en el cable).
+#
+# Compara:
+#   legacy  -> base64 + JSON (empaquetar) + LectorTramas + desempaquetar + b64decode + write
+#   binario -> trama 0x01 (cabecera JSON + bytes crudos) + LectorTramas(binario) + write por trozo
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_archivos.py [n_chunks]
+
+import base64
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core.protocolo import empaquetar, desempaquetar
+from ghostwhisperchat.core.tramas import (LectorTramas, EventoBinario, BIN_DATOS,
+                                          enmarcar, enmarcar_binario)
+
+TAM_CHUNK = 10 * 1024 * 1024
+FRAGMENTO = 64 * 1024
+ORIGEN = {"uid": "0123456789abcdef", "nick": "bench", "ip": "10.0.0.1", "port_priv": 44494, "proto": 4}
+
+
+def alimentar(lector, stream):
+    mv = memoryview(stream)
+    for i in range(0, len(mv), FRAGMENTO):
+        lector.alimentar(mv[i:i + FRAGMENTO])
+        yield
+
+
+def bench_legacy(raw, destino):
+    t0 = time.perf_counter()
+    pkg = empaquetar("FILE_CHUNK", {"filename": "x.bin", "chunk_id": 1, "total_chunks": 1,
+                                    "data": base64.b64encode(raw).decode('ascii')}, ORIGEN)
+    stream = enmarcar(pkg)
+    lector = LectorTramas()
+    with open(destino, 'wb') as f:
+        for _ in alimentar(lector, stream):
+            for trama in lector.tramas():
+                ok, data = desempaquetar(trama)
+                f.write(base64.b64decode(data["payload"]["data"]))
+    return time.perf_counter() - t0, len(stream)
+
+
+def bench_binario(raw, destino):
+    t0 = time.perf_counter()
+    cab = empaquetar("FILE_CHUNK", {"filename": "x.bin", "chunk_id": 1, "total_chunks": 1,
+                                    "offset": 0, "largo": len(raw), "bin": True}, ORIGEN)
+    stream = enmarcar_binario(cab, len(raw)) + raw
+    lector = LectorTramas(binario=True)
+    with open(destino, 'wb') as f:
+        for _ in alimentar(lector, stream):
+            for ev in lector.tramas():
+                if isinstance(ev, EventoBinario) and ev.tipo == BIN_DATOS:
+                    f.write(ev.datos)
+    return time.perf_counter() - t0, len(stream)
+
+
+def medir(fn, raw, destino):
+    tracemalloc.start()
+    dt, cable = fn(raw, destino)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt, cable, pico
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    raw = os.urandom(TAM_CHUNK)
+    destino = os.path.join(tempfile.mkdtemp(), "chunk.bin")
+
+    print(f"{n} chunks de {TAM_CHUNK // (1024 * 1024)}MB, fragmentos de {FRAGMENTO // 1024}KB\n")
+    print(f"{'modo':>8} | {'MB/s':>8} | {'cable (MB)':>10} | {'pico RAM extra (MB)':>20}")
+    print("-" * 56)
+    for nombre, fn in (("legacy", bench_legacy), ("binario", bench_binario)):
+        total, cable, pico = 0.0, 0, 0
+        for _ in range(n):
+            dt, cable, p = medir(fn, raw, destino)
+            total += dt
+            pico = max(pico, p)
+        with open(destino, 'rb') as f:
+            assert f.read() == raw
+        mb = TAM_CHUNK * n / (1024 * 1024)
+        print(f"{nombre:>8} | {mb / total:>8.1f} | {cable / (1024 * 1024):>10.2f} | {pico / (1024 * 1024):>20.1f}")
+    os.unlink(destino)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Benchmark: búsqueda difusa de nicks (buscar_contacto_fuzzy) y de comandos.
+#
+# "legacy": copia de toda la agenda + peers y difflib.SequenceMatcher contra
+#           cada nick normalizado por consulta (comportamiento previo).
+# "índice": candidatos desde las listas de trigramas (core/indices.py) y
+#           difflib solo sobre los mejores.
+# Reporta ms por consulta (el índice, el mejor de REPETICIONES pasadas) y
+# cuántos de los 3 primeros de legacy aparecen en los 3 primeros del índice
+# (recall@3), e indica si cada caso de nicks queda bajo OBJETIVO_MS.
+# Comandos: la lista completa de sugerencias (top-3) contra get_close_matches
+# sobre los alias sin repetir (COMMAND_MAP repite '--priv' y '-i'; antes salían
+# dos veces en las sugerencias).
+#
+# Usa un HOME temporal.
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_fuzzy.py [entradas]
+
+import os
+import sys
+import time
+import random
+import difflib
+import tempfile
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gwc_bench_")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core.indices import tabla_contactos, tabla_peers
+from ghostwhisperchat.core.utilidades import normalize_text
+from ghostwhisperchat.datos.recursos import COMMAND_MAP
+from ghostwhisperchat.logica.comandos import sugerir_comandos
+
+NOMBRES = ["Ana", "Omar", "Sofía", "Mateo", "Lucía", "Benjamín", "Valentina", "Tomás", "Martina", "Agustín",
+           "Isidora", "Joaquín", "Florencia", "Vicente", "Catalina", "Maximiliano", "Antonella", "Cristóbal",
+           "Javiera", "Sebastián", "Renata", "Ignacio", "Emilia", "Matías", "Josefa", "Diego", "Fernanda"]
+OBJETIVO_MS = 1.0       # Por consulta completa (contactos + peers)
+REPETICIONES = 5
+APELLIDOS = ["Sáez", "González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez",
+             "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Hernández", "Torres", "Araya", "Flores"]
+
+
+def nick_aleatorio(rnd):
+    forma = rnd.randrange(4)
+    n, a = rnd.choice(NOMBRES), rnd.choice(APELLIDOS)
+    if forma == 0: return f"{n} {a}"
+    if forma == 1: return f"{n.lower()}_{rnd.randrange(1000)}"
+    if forma == 2: return f"{n[:3]}{a}{rnd.randrange(100)}"
+    return f"{a}{n}"
+
+
+def con_error(rnd, texto):
+    """Una letra cambiada, quitada o duplicada (typo)."""
+    i = rnd.randrange(len(texto))
+    op = rnd.randrange(3)
+    if op == 0: return texto[:i] + rnd.choice("aeiourstnm") + texto[i + 1:]
+    if op == 1: return texto[:i] + texto[i + 1:]
+    return texto[:i] + texto[i] + texto[i:]
+
+
+def fuzzy_legacy(contactos, peers, query):
+    query_norm = normalize_text(query)
+    all_users = {}
+    for uid, c in contactos.items():
+        all_users[uid] = dict(c, source='CONTACTO')
+    for uid, p in peers.items():
+        all_users[uid] = dict(p, source='RED (Scan)')
+    res = []
+    for uid, data in all_users.items():
+        nick_norm = normalize_text(data.get('nick', 'UNK'))
+        if query_norm == nick_norm: data['ratio'] = 1.0
+        elif query_norm in nick_norm: data['ratio'] = 0.9
+        else:
+            ratio = difflib.SequenceMatcher(None, query_norm, nick_norm).ratio()
+            if ratio < 0.55: continue
+            data['ratio'] = ratio
+        res.append(data)
+    res.sort(key=lambda x: x['ratio'], reverse=True)
+    return res
+
+
+def fuzzy_indice(contactos, peers, query):
+    query_norm = normalize_text(query)
+    res = {}
+    for tabla, source in ((contactos, 'CONTACTO'), (peers, 'RED (Scan)')):
+        for ratio, uid in tabla.similares(query_norm, limite=5):
+            res[uid] = dict(tabla[uid], source=source, ratio=ratio)
+    return sorted(res.values(), key=lambda x: x['ratio'], reverse=True)
+
+
+def medir(fn, consultas, *args, repeticiones=1):
+    mejor = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        salidas = [fn(*args, q) for q in consultas]
+        ms = (time.perf_counter() - t0) / len(consultas) * 1000
+        mejor = ms if mejor is None else min(mejor, ms)
+    return mejor, salidas
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rnd = random.Random(7)
+    datos = {f"{i:016x}": {"uid": f"{i:016x}", "nick": nick_aleatorio(rnd), "last_seen": i} for i in range(n)}
+    uids = list(datos)
+    contactos_dict = dict(datos)
+    peers_dict = {uid: dict(datos[uid], ip="10.0.0.1") for uid in uids[:n // 10]}
+
+    t0 = time.perf_counter()
+    contactos, peers = tabla_contactos(contactos_dict), tabla_peers(peers_dict)
+    print(f"{n} contactos + {len(peers)} peers, indexado en {(time.perf_counter() - t0) * 1000:.0f} ms\n")
+
+    casos = {
+        "typo de un nick": [con_error(rnd, datos[rnd.choice(uids)]["nick"]) for _ in range(30)],
+        "prefijo (3-5 letras)": [normalize_text(datos[rnd.choice(uids)]["nick"])[:rnd.randrange(3, 6)] for _ in range(30)],
+        "sin parecidos": [f"zzq{rnd.randrange(10**6)}x" for _ in range(30)],
+    }
+    print(f"{'consulta':<22} | {'legacy ms':>9} | {'índice ms':>9} | {'recall@3':>8} | < {OBJETIVO_MS:g} ms")
+    print("-" * 70)
+    for nombre, consultas in casos.items():
+        ms_a, ref = medir(fuzzy_legacy, consultas, contactos_dict, peers_dict)
+        ms_b, out = medir(fuzzy_indice, consultas, contactos, peers, repeticiones=REPETICIONES)
+        total = aciertos = 0
+        for r, o in zip(ref, out):
+            # Ratios empatados: se compara el puntaje, no el uid
+            top_ref = sorted((x['ratio'] for x in r), reverse=True)[:3]
+            top_out = sorted((x['ratio'] for x in o), reverse=True)[:3]
+            total += len(top_ref)
+            aciertos += sum(1 for a, b in zip(top_ref, top_out) if abs(a - b) < 1e-9)
+        recall = aciertos / total if total else 1.0
+        cumple = "sí" if ms_b < OBJETIVO_MS else "NO"
+        print(f"{nombre:<22} | {ms_a:>9.2f} | {ms_b:>9.3f} | {recall:>8.0%} | {cumple}")
+
+    todos = list(dict.fromkeys(a for aliases in COMMAND_MAP.values() for a in aliases))
+    consultas = [con_error(rnd, rnd.choice(todos)) for _ in range(200)]
+    ms_a, ref = medir(lambda q: difflib.get_close_matches(q, todos, n=3, cutoff=0.55), consultas)
+    ms_b, out = medir(lambda q: sugerir_comandos(q, n=3), consultas, repeticiones=REPETICIONES)
+    iguales = sum(1 for r, o in zip(ref, out) if r == o)
+    print(f"{f'comandos ({len(todos)} alias)':<22} | {ms_a:>9.2f} | {ms_b:>9.3f} | {iguales / len(consultas):>8.0%} | (top-3 igual)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Simulación: difusión de MSG de grupo en malla completa vs gossip (logica/difusion.py).
+#
+# Modelo (eventos discretos, sin red real):
+#   - Cada nodo tiene un enlace de subida serial de SUBIDA_KBPS: las copias de un
+#     mismo nodo salen una detrás de otra (es lo que sufre el emisor en malla).
+#   - Cada copia tarda además una latencia de red: LAN ~ 2-8 ms, Tor ~ 0.4-1.5 s.
+#   - malla:  el autor sube n-1 copias; nadie reenvía.
+#   - gossip: el autor sube fanout copias; cada nodo, al ver un mid por primera
+#             vez (CacheVistos), reenvía a fanout miembros al azar (sin el autor).
+# Tamaño de copia: un MSG real de empaquetar() con un texto corto.
+#
+# Reporta por tamaño de grupo: latencia de entrega p50/p99/máx (hasta que el
+# último miembro lo tiene), % entregado, KB subidos por el autor, KB subidos
+# por el nodo que más sube y KB totales en la red, promediado sobre M mensajes.
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_gossip.py [mensajes] [lan|tor]
+
+import os
+import sys
+import heapq
+import random
+import tempfile
+import statistics
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gwc_bench_")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core.protocolo import empaquetar
+from ghostwhisperchat.logica import difusion
+
+TAMANOS = [10, 25, 50, 100, 200, 500]
+SUBIDA_KBPS = {"lan": 10_000, "tor": 60}
+LATENCIA = {"lan": (0.002, 0.008), "tor": (0.4, 1.5)}
+
+
+def tamano_msg():
+    origen = {"nick": "Usuario", "uid": "0123456789abcdef", "sys_user": "usuario", "status_msg": "en la oficina",
+              "port_priv": 44494, "port_group": 44496, "ip": "192.168.1.20", "privacy_policy": "AMBOS",
+              "onion": "a" * 56 + ".onion", "proto": 4}
+    payload = {"text": "hola a todos, ¿cómo va?", "gid": "f" * 64, "mid": difusion.nuevo_mid()}
+    return len(empaquetar("MSG", payload, origen)) + 1
+
+
+def simular(n, modo, red, bytes_msg, rnd):
+    """Un mensaje del nodo 0 en un grupo de n. Retorna (latencias, subidos_por_nodo)."""
+    t_copia = bytes_msg / (SUBIDA_KBPS[red] * 1024)
+    lat_min, lat_max = LATENCIA[red]
+    libre = [0.0] * n              # Momento en que el enlace de subida de cada nodo queda libre
+    subidos = [0] * n
+    recibido = {0: 0.0}
+    vistos = difusion.CacheVistos()
+    mid = difusion.nuevo_mid()
+    eventos = []                   # (t_llegada, seq, destino)
+    seq = 0
+
+    def enviar(desde, t, destinos):
+        nonlocal seq
+        for d in destinos:
+            libre[desde] = max(libre[desde], t) + t_copia
+            subidos[desde] += bytes_msg
+            heapq.heappush(eventos, (libre[desde] + rnd.uniform(lat_min, lat_max), seq, d))
+            seq += 1
+
+    otros = range(1, n)
+    vistos.registrar(0, mid)
+    if modo == "malla":
+        enviar(0, 0.0, otros)
+    else:
+        enviar(0, 0.0, difusion.elegir_vecinos(otros, difusion.fanout_para(n - 1), rnd))
+
+    while eventos:
+        t, _, nodo = heapq.heappop(eventos)
+        if modo == "malla":
+            recibido.setdefault(nodo, t)
+            continue
+        # Cada nodo tiene su propia caché: se simula con la clave (nodo, mid)
+        if not vistos.registrar(nodo, mid):
+            continue
+        recibido[nodo] = t
+        candidatos = [x for x in range(1, n) if x != nodo]
+        enviar(nodo, t, difusion.elegir_vecinos(candidatos, difusion.fanout_para(n - 1), rnd))
+
+    return [recibido[i] for i in otros if i in recibido], subidos
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100 * len(valores)))]
+
+
+def main():
+    mensajes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    red = sys.argv[2] if len(sys.argv) > 2 else "tor"
+    rnd = random.Random(1)
+    bytes_msg = tamano_msg()
+    unidad = "ms" if red == "lan" else "s"
+    escala = 1000 if red == "lan" else 1
+
+    print(f"red={red}  MSG={bytes_msg} B  subida={SUBIDA_KBPS[red]} KB/s  mensajes={mensajes}\n")
+    print(f"{'n':>4} {'modo':<6} {'fanout':>6} | {'p50':>7} {'p99':>7} {'máx':>7} ({unidad}) | "
+          f"{'entreg.':>7} | {'KB autor':>8} {'KB máx':>7} {'KB red':>8}")
+    print("-" * 92)
+    for n in TAMANOS:
+        for modo in ("malla", "gossip"):
+            lats, maximos, entregas, autor, pico, total = [], [], [], [], [], []
+            for _ in range(mensajes):
+                l, subidos = simular(n, modo, red, bytes_msg, rnd)
+                lats.extend(l)
+                maximos.append(max(l) if l else 0.0)
+                entregas.append(len(l) / (n - 1))
+                autor.append(subidos[0])
+                pico.append(max(subidos))
+                total.append(sum(subidos))
+            fanout = n - 1 if modo == "malla" else difusion.fanout_para(n - 1)
+            print(f"{n:>4} {modo:<6} {fanout:>6} | {percentil(lats, 50) * escala:>7.2f} "
+                  f"{percentil(lats, 99) * escala:>7.2f} {statistics.mean(maximos) * escala:>7.2f}      | "
+                  f"{statistics.mean(entregas) * 100:>6.2f}% | {statistics.mean(autor) / 1024:>8.1f} "
+                  f"{statistics.mean(pico) / 1024:>7.1f} {statistics.mean(total) / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
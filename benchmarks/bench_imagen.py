@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Benchmark: render_ascii (Half-Block ANSI) a distintos anchos.
+#
+# Compara:
+#   legacy -> pixels[x, y] por pixel + res += f"..." + color completo en cada celda
+#   pillow -> tobytes() + bucle por celda, secuencia solo si el color cambia
+#   numpy  -> cuantizado y run-length vectorizados + join
+# Para cada modo de color (truecolor / 256 / 16) reporta ms y bytes emitidos.
+# Mide solo el armado de la salida (el resize es igual en todos).
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_imagen.py [repeticiones]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from PIL import Image
+from ghostwhisperchat.core import imagen_ascii
+
+ANCHOS = [60, 120, 190]
+
+
+def salida_legacy(img, width, height):
+    pixels = img.load()
+    res = ""
+    for y in range(0, height, 2):
+        for x in range(width):
+            r1, g1, b1 = pixels[x, y]
+            if y+1 < height: r2, g2, b2 = pixels[x, y+1]
+            else: r2, g2, b2 = 0,0,0
+            res += f"\033[38;2;{r1};{g1};{b1}m\033[48;2;{r2};{g2};{b2}m▀"
+        res += "\033[0m\n"
+    return res
+
+
+def imagen_prueba(width):
+    """Imagen sintética 4:3 tipo foto: degradados + zonas planas + algo de ruido."""
+    height = int(width * 0.75)
+    if height % 2: height += 1
+    base = 256
+    r = Image.linear_gradient("L").resize((base, base))
+    g = Image.radial_gradient("L").resize((base, base))
+    b = Image.linear_gradient("L").rotate(90).resize((base, base))
+    img = Image.merge("RGB", (r, g, b))
+    # Bloques planos (cielo, paredes...) y ruido leve
+    img.paste((30, 90, 200), (0, 0, base, base // 4))
+    img.paste((240, 240, 235), (base // 2, base // 2, base, base))
+    ruido = Image.effect_noise((base, base), 12).convert("RGB")
+    img = Image.blend(img, ruido, 0.04)
+    return img.resize((width, height), Image.Resampling.LANCZOS), height
+
+
+def medir(fn, n, *args):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        out = fn(*args)
+    return (time.perf_counter() - t0) / n * 1000, out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rutas = [("pillow", imagen_ascii._salida_pillow)]
+    if imagen_ascii.NUMPY_AVAILABLE:
+        rutas.append(("numpy", imagen_ascii._salida_numpy))
+
+    print(f"{n} repeticiones por caso (ms por imagen, KB emitidos)\n")
+    print(f"{'ancho':>6} | {'modo':>9} | {'ruta':>6} | {'ms':>8} | {'KB':>8} | {'vs legacy':>9}")
+    print("-" * 62)
+    for width in ANCHOS:
+        img, height = imagen_prueba(width)
+        ms, ref = medir(salida_legacy, n, img, width, height)
+        kb_ref = len(ref.encode()) / 1024
+        print(f"{width:>6} | {'truecolor':>9} | {'legacy':>6} | {ms:>8.2f} | {kb_ref:>8.1f} | {'100%':>9}")
+        for modo in imagen_ascii.MODOS:
+            salidas = []
+            for nombre, fn in rutas:
+                ms, out = medir(fn, n, img, width, height, modo)
+                salidas.append(out)
+                kb = len(out.encode()) / 1024
+                print(f"{width:>6} | {modo:>9} | {nombre:>6} | {ms:>8.2f} | {kb:>8.1f} | {kb * 100 / kb_ref:>8.0f}%")
+            if modo == imagen_ascii.MODO_TRUECOLOR:
+                # Mismos colores que legacy, solo sin secuencias repetidas
+                assert all(s == salidas[0] for s in salidas)
+        print("-" * 62)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Benchmark: overhead del bucle principal con N sockets inactivos.
+#
+# Compara el patrón antiguo (reconstruir lista + select.select + dispatch por
+# comparación) contra el Reactor (selectors/epoll, registro único, O(listos)).
+# En cada vuelta hay exactamente 1 socket activo y N inactivos.
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_reactor.py [iteraciones]
+
+import os
+import select
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core.reactor import Reactor, TIPO_PEER_TCP
+
+TAMANOS = [10, 100, 1000]
+
+
+def crear_pares(n):
+    pares = []
+    for _ in range(n):
+        a, b = socket.socketpair()
+        a.setblocking(False)
+        pares.append((a, b))
+    return pares
+
+
+def bench_legacy(inactivos, activo, iteraciones):
+    """Réplica del bucle previo: lista nueva por vuelta + select.select + `in` lineal."""
+    lectura, escritura = activo
+    sockets_red = [a for a, _ in inactivos] + [lectura]
+    sockets_ui = []
+    ipc = object()
+
+    t0 = time.perf_counter()
+    for _ in range(iteraciones):
+        escritura.send(b"x")
+        rlist = list(sockets_red) + sockets_ui
+        readable, _, _ = select.select(rlist, [], [], 2.0)
+        for s in readable:
+            if s == ipc:
+                pass
+            elif s in sockets_ui:
+                pass
+            else:
+                s.recv(4096)
+    return time.perf_counter() - t0
+
+
+def bench_reactor(inactivos, activo, iteraciones):
+    lectura, escritura = activo
+    r = Reactor()
+
+    def handler(s):
+        s.recv(4096)
+
+    for a, _ in inactivos:
+        r.registrar(a, TIPO_PEER_TCP, handler)
+    r.registrar(lectura, TIPO_PEER_TCP, handler)
+
+    t0 = time.perf_counter()
+    for _ in range(iteraciones):
+        escritura.send(b"x")
+        r.procesar_eventos(2.0)
+    dt = time.perf_counter() - t0
+    r.cerrar()
+    return dt
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"Iteraciones por escenario: {iteraciones} (1 socket activo + N inactivos)\n")
+    print(f"{'N inactivos':>12} | {'legacy select (us/vuelta)':>26} | {'reactor (us/vuelta)':>20} | {'mejora':>7}")
+    print("-" * 76)
+
+    for n in TAMANOS:
+        inactivos = crear_pares(n)
+        activo = crear_pares(1)[0]
+        try:
+            try:
+                t_old = bench_legacy(inactivos, activo, iteraciones)
+                old_us = t_old / iteraciones * 1e6
+                old_txt = f"{old_us:.2f}"
+            except ValueError:
+                # select.select no admite fds >= FD_SETSIZE (1024)
+                old_us = None
+                old_txt = "N/A (fd>=FD_SETSIZE)"
+            t_new = bench_reactor(inactivos, activo, iteraciones)
+            new_us = t_new / iteraciones * 1e6
+            mejora = f"{old_us / new_us:.1f}x" if old_us else "-"
+            print(f"{n:>12} | {old_txt:>26} | {new_us:>20.2f} | {mejora:>7}")
+        finally:
+            for a, b in inactivos + [activo]:
+                a.close()
+                b.close()
+
+
+if __name__ == "__main__":
+    main()
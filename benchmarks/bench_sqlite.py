@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# Benchmark: backend de archivos vs backend SQLite (GWC_BACKEND=sqlite).
+#
+# Agenda (N contactos):
+#   carga       -> leer contacts.json completo vs SELECT de la tabla
+#   1 cambio    -> flush tras modificar un contacto: JSON entero vs upsert de 1 fila
+#   onion/nick  -> recorrido lineal de la agenda vs índice
+# Vault (N entradas):
+#   1 cambio    -> re-cifrar el vault.enc entero vs cifrar 1 fila
+# Historial (L líneas repartidas en C chats):
+#   inserción   -> agregar() línea a línea (archivos) vs executemany
+#   últimas 15  -> instancia en frío (sin ring) para un chat
+#
+# Usa un HOME temporal. Requiere python3-cryptography (igual que el demonio).
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_sqlite.py [contactos] [lineas_historial]
+
+import os
+import sys
+import random
+import tempfile
+import time
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gwc_bench_")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core import cripto_vault as cv
+from ghostwhisperchat.core import historial
+from ghostwhisperchat.core.utilidades import normalize_text
+from ghostwhisperchat.datos import contactos
+from ghostwhisperchat.datos.base_sqlite import BaseSQLite
+
+N_CHATS = 20
+
+
+def ms(t0):
+    return (time.perf_counter() - t0) * 1000
+
+
+def fila(titulo, a, b):
+    print(f"{titulo:<28} | {a:>10.2f} | {b:>10.2f} | {a / b if b else 0:>7.1f}x")
+
+
+def agenda_prueba(n):
+    return {f"{i:016x}": {"nick": f"Usuario{i}", "last_ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                          "onion": f"{'b' * 40}{i:016d}.onion", "last_seen": time.time(),
+                          "trusted": False, "blocked": False} for i in range(n)}
+
+
+def bench_contactos(n, db):
+    agenda = agenda_prueba(n)
+    ruta = os.path.join(os.environ["HOME"], "contacts.json")
+    alm_json = contactos.AlmacenContactos(ruta)
+    alm_json.reemplazar(agenda); alm_json.flush()
+    alm_sql = contactos.AlmacenContactosSQLite(db)
+    alm_sql.reemplazar(agenda); alm_sql.flush()
+
+    t0 = time.perf_counter(); contactos.AlmacenContactos(ruta); a = ms(t0)
+    t0 = time.perf_counter(); contactos.AlmacenContactosSQLite(db); b = ms(t0)
+    fila(f"carga agenda ({n})", a, b)
+
+    uids = random.sample(list(agenda), 50)
+    resultados = []
+    for alm in (alm_json, alm_sql):
+        t0 = time.perf_counter()
+        for uid in uids:
+            alm.actualizar(uid, dict(alm.obtener(uid), nick="Renombrado"))
+            alm.flush()
+        resultados.append(ms(t0) / len(uids))
+    fila("flush 1 contacto", *resultados)
+
+    objetivos = [agenda[uid]["onion"] for uid in uids]
+    t0 = time.perf_counter()
+    for onion in objetivos:
+        next(u for u, d in alm_json.datos.items() if d.get("onion") == onion)
+    a = ms(t0) / len(objetivos)
+    t0 = time.perf_counter()
+    for onion in objetivos:
+        db.buscar_contacto_onion(onion)
+    fila("buscar por onion", a, ms(t0) / len(objetivos))
+
+    nicks = [normalize_text(f"Usuario{random.randrange(n)}") for _ in range(50)]
+    t0 = time.perf_counter()
+    for nick in nicks:
+        [u for u, d in alm_json.datos.items() if normalize_text(d.get("nick", "")) == nick]
+    a = ms(t0) / len(nicks)
+    t0 = time.perf_counter()
+    for nick in nicks:
+        db.buscar_contactos_nick(nick)
+    fila("buscar por nick", a, ms(t0) / len(nicks))
+
+
+def bench_vault(n, db):
+    vault = {f"{i:016x}": {"ip": f"10.0.{i >> 8 & 255}.{i & 255}", "onion": f"{'c' * 40}{i:016d}.onion"}
+             for i in range(n)}
+    cv._escribir_archivo(vault)
+    db.guardar_vault([cv._cifrar_fila(uid, e) for uid, e in vault.items()], reemplazar=True)
+    uids = random.sample(list(vault), 20)
+
+    t0 = time.perf_counter()
+    for uid in uids:
+        vault[uid] = {"ip": "192.168.1.1", "onion": vault[uid]["onion"]}
+        cv._escribir_archivo(vault)
+    a = ms(t0) / len(uids)
+    t0 = time.perf_counter()
+    for uid in uids:
+        db.guardar_vault([cv._cifrar_fila(uid, vault[uid])])
+    fila(f"vault 1 entrada ({n})", a, ms(t0) / len(uids))
+
+
+def bench_historial(lineas, db):
+    directorio = os.path.join(os.environ["HOME"], "history")
+    chats = [f"chat{i:02d}" for i in range(N_CHATS)]
+    # Sin compactación durante la carga: se mide el costo de escritura
+    retencion, historial.RETENCION_LINEAS = historial.RETENCION_LINEAS, 10 ** 9
+
+    hist = historial.HistorialChats(directorio)
+    t0 = time.perf_counter()
+    for i in range(lineas):
+        hist.agregar(chats[i % N_CHATS], f"2026-01-01 00:00|Usuario|mensaje número {i}")
+    a = ms(t0)
+    t0 = time.perf_counter()
+    lote, ts = 50_000, time.time()
+    for ini in range(0, lineas, lote):
+        with db.transaccion() as c:
+            c.executemany("INSERT INTO historial (chat_id, ts, linea) VALUES (?, ?, ?)",
+                          [(chats[i % N_CHATS], ts + i, f"2026-01-01 00:00|Usuario|mensaje número {i}")
+                           for i in range(ini, min(ini + lote, lineas))])
+    fila(f"inserción ({lineas} líneas)", a, ms(t0))
+    historial.RETENCION_LINEAS = retencion
+
+    t0 = time.perf_counter()
+    for chat in chats:
+        historial.HistorialChats(directorio).ultimas(chat, 15)
+    a = ms(t0) / len(chats)
+    t0 = time.perf_counter()
+    for chat in chats:
+        db.ultimas_historial(chat, 15)
+    fila("últimas 15 (en frío)", a, ms(t0) / len(chats))
+    assert db.ultimas_historial(chats[0], 15) == historial.HistorialChats(directorio).ultimas(chats[0], 15)[0]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    lineas = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    random.seed(1)
+    db = BaseSQLite(os.path.join(os.environ["HOME"], "gwc.db"))
+
+    print(f"{'caso':<28} | {'archivos':>10} | {'sqlite':>10} | {'mejora':>8}")
+    print(f"{'':<28} | {'(ms)':>10} | {'(ms)':>10} |")
+    print("-" * 66)
+    bench_contactos(n, db)
+    bench_vault(n, db)
+    bench_historial(lineas, db)
+    print(f"\ngwc.db: {os.path.getsize(db.ruta) / 1024 / 1024:.1f} MB "
+          f"(+ WAL {os.path.getsize(db.ruta + '-wal') / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
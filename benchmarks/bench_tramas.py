@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# Benchmark: recepción de tramas de 10MB llegando en fragmentos pequeños.
+#
+# Compara:
+#   legacy    -> bytes += recv() + split(b'\n', 1)  (buffers previos del Motor)
+#   lector v2 -> LectorTramas con newline (recv_into + find incremental)
+#   lector v3 -> LectorTramas con prefijo de largo (recv_into + reserva exacta)
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_tramas.py [n_tramas]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core.tramas import LectorTramas, enmarcar, enmarcar_linea
+
+TAM_TRAMA = 10 * 1024 * 1024
+FRAGMENTOS = [64 * 1024, 16 * 1024]
+
+
+class SocketSimulado:
+    """Entrega un stream pregrabado en fragmentos fijos (recv y recv_into)."""
+
+    def __init__(self, stream, fragmento):
+        self._mv = memoryview(stream)
+        self._pos = 0
+        self._frag = fragmento
+
+    def recv(self, n):
+        n = min(n, self._frag, len(self._mv) - self._pos)
+        data = bytes(self._mv[self._pos:self._pos + n])
+        self._pos += n
+        return data
+
+    def recv_into(self, destino):
+        n = min(len(destino), self._frag, len(self._mv) - self._pos)
+        destino[:n] = self._mv[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+def bench_legacy(stream, fragmento):
+    sock = SocketSimulado(stream, fragmento)
+    buf = b""
+    tramas = 0
+    t0 = time.perf_counter()
+    while True:
+        data = sock.recv(16777216)
+        if not data:
+            break
+        buf += data
+        while b'\n' in buf:
+            line, buf = buf.split(b'\n', 1)
+            if line:
+                tramas += 1
+    return time.perf_counter() - t0, tramas
+
+
+def bench_lector(stream, fragmento):
+    sock = SocketSimulado(stream, fragmento)
+    lector = LectorTramas()
+    tramas = 0
+    t0 = time.perf_counter()
+    while lector.recibir(sock):
+        for _ in lector.tramas():
+            tramas += 1
+    return time.perf_counter() - t0, tramas
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    # Payload tipo base64 (sin '\n'), como un FILE_CHUNK
+    payload = b'{"tipo": "FILE_CHUNK", "data": "' + b"A" * (TAM_TRAMA - 40) + b'"}'
+    stream_v2 = enmarcar_linea(payload) * n
+    stream_v3 = enmarcar(payload) * n
+    total_mb = len(payload) * n / (1024 * 1024)
+
+    print(f"{n} tramas de {len(payload) / (1024 * 1024):.1f}MB ({total_mb:.0f}MB totales)\n")
+    print(f"{'fragmento':>10} | {'legacy (MB/s)':>14} | {'lector v2 (MB/s)':>17} | {'lector v3 (MB/s)':>17}")
+    print("-" * 68)
+    for frag in FRAGMENTOS:
+        t_old, c_old = bench_legacy(stream_v2, frag)
+        t_v2, c_v2 = bench_lector(stream_v2, frag)
+        t_v3, c_v3 = bench_lector(stream_v3, frag)
+        assert c_old == c_v2 == c_v3 == n
+        print(f"{frag // 1024:>8}KB | {total_mb / t_old:>14.1f} | {total_mb / t_v2:>17.1f} | {total_mb / t_v3:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
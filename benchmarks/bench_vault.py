@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Benchmark: paquetes/segundo a través de Motor.manejar_paquete_tcp.
+#
+# "antes": cada paquete deriva la clave PBKDF2 (100k iter) y hace load+save
+#          completo del vault cifrado (comportamiento previo de registrar_contacto).
+# "después": clave cacheada por proceso + vault en RAM con flush diferido.
+#
+# Usa un HOME temporal para no tocar la agenda/vault reales.
+# Requiere python3-cryptography (igual que el demonio).
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/bench_vault.py [paquetes]
+
+import io
+import os
+import sys
+import tempfile
+import time
+import contextlib
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gwc_bench_")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core import cripto_vault as cv
+from ghostwhisperchat.core.protocolo import empaquetar
+from ghostwhisperchat.logica.motor import Motor
+
+N_PEERS = 20
+
+
+def construir_paquetes(n):
+    paquetes = []
+    for i in range(n):
+        k = i % N_PEERS
+        origen = {
+            "nick": f"peer{k}", "uid": f"{k:016x}", "sys_user": "bench", "status_msg": "",
+            "port_priv": 44494, "port_group": 44496, "ip": f"10.0.0.{k + 2}",
+            "privacy_policy": "AMBOS", "onion": f"{'a' * 40}{k:016d}.onion",
+        }
+        paquetes.append(empaquetar("TYPING", {"status": False}, origen))
+    return paquetes
+
+
+def medir(motor, paquetes):
+    silencio = io.StringIO()
+    with contextlib.redirect_stderr(silencio), contextlib.redirect_stdout(silencio):
+        t0 = time.perf_counter()
+        for pkg in paquetes:
+            motor.manejar_paquete_tcp(pkg, None)
+        cv.flush_vault()
+        dt = time.perf_counter() - t0
+    return len(paquetes) / dt
+
+
+def modo_legacy():
+    """Reinstala el camino previo: derivar clave y leer/escribir el vault completo por paquete."""
+    originales = (cv._get_key, cv.get_vault_entry, cv.set_vault_entry)
+
+    def legacy_get(uid):
+        return cv._leer_disco().get(uid, {})
+
+    def legacy_set(uid, entry):
+        vault = cv._leer_disco()
+        if entry:
+            vault[uid] = entry
+        else:
+            vault.pop(uid, None)
+        cv._escribir_disco(vault)
+
+    cv._get_key = cv._derivar_key
+    cv.get_vault_entry = legacy_get
+    cv.set_vault_entry = legacy_set
+    return originales
+
+
+def restaurar(originales):
+    cv._get_key, cv.get_vault_entry, cv.set_vault_entry = originales
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()):
+        motor = Motor()
+    paquetes = construir_paquetes(n)
+
+    originales = modo_legacy()
+    try:
+        pps_antes = medir(motor, paquetes)
+    finally:
+        restaurar(originales)
+
+    pps_despues = medir(motor, paquetes)
+
+    print(f"Paquetes TCP procesados: {n} ({N_PEERS} peers distintos)")
+    print(f"  antes   (PBKDF2 + load/save por paquete): {pps_antes:10.1f} pkt/s")
+    print(f"  después (clave cacheada + vault en RAM):  {pps_despues:10.1f} pkt/s")
+    print(f"  mejora: {pps_despues / pps_antes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Prueba: relay gossip de varios saltos con sesiones por conexión (proto v5).
+#
+# A -> B -> C -> D, cada salto por una conexión del pool (socketpair) que ya
+# compacta (handshake hecho). B es un Motor real: recibe el MSG compacto de A,
+# lo reenvía (despachador capturado) y su pool lo manda a C. C y D decodifican
+# con sus propias sesiones y reenvían con protocolo.reenviable, como el Motor.
+# En cada salto el MSG debe llegar válido y con el origen del autor (A).
+#
+# Uso (desde la raíz del repo):
+#   python3 benchmarks/prueba_relay_gossip.py
+
+import os
+import sys
+import socket
+import tempfile
+
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gwc_bench_")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ghostwhisperchat_pkg", "usr", "lib"))
+
+from ghostwhisperchat.core.estado import MemoriaGlobal
+from ghostwhisperchat.core.protocolo import empaquetar, desempaquetar, reenviable
+from ghostwhisperchat.core.tramas import LectorTramas
+from ghostwhisperchat.core.transporte import GestorRed
+from ghostwhisperchat.logica import difusion
+from ghostwhisperchat.logica.motor import Motor
+
+GID = "g" * 64
+PUERTO = 44496
+NODOS = {"A": ("ua", "10.0.0.1"), "B": ("ub", "10.0.0.2"), "C": ("uc", "10.0.0.3"), "D": ("ud", "10.0.0.4")}
+
+
+def ser(nombre):
+    """La memoria es única por proceso: se 'cambia de nodo' antes de empaquetar."""
+    m = MemoriaGlobal()
+    m.mi_uid, m.mi_ip = NODOS[nombre]
+    m.mi_nick = nombre
+    m.mi_onion = None
+
+
+def enlace(red, destino):
+    """Conexión del pool de `red` hacia `destino` (v5). Retorna el extremo receptor."""
+    emisor, receptor = socket.socketpair()
+    red.proto_peers[(NODOS[destino][1], PUERTO)] = 5
+    red._pool_devolver(NODOS[destino][1], PUERTO, emisor)
+    return receptor
+
+
+def recibir(sock, sesiones):
+    lector = LectorTramas()
+    sock.settimeout(2)
+    lector.alimentar(sock.recv(1 << 20))
+    return [(bytes(t), desempaquetar(t, sesiones)) for t in lector.tramas()]
+
+
+def enviar(red, nombre_origen, destino, pkg):
+    ser(nombre_origen)
+    assert red.enviar_tcp_priv(NODOS[destino][1], pkg, port=PUERTO)
+
+
+def main():
+    # --- A -> B: handshake (PING) y luego el MSG ya compacto ---
+    red_a = GestorRed()
+    rx_b = enlace(red_a, "B")
+    ser("A")
+    enviar(red_a, "A", "B", empaquetar("PING", {}, MemoriaGlobal().get_origen()))
+    msg = empaquetar("MSG", {"text": "hola", "gid": GID, "mid": difusion.nuevo_mid()}, MemoriaGlobal().get_origen())
+    enviar(red_a, "A", "B", msg)
+
+    # --- B: Motor real (miembros C y D), el relay se captura del despachador ---
+    ser("B")
+    motor = Motor()
+    miembros = {NODOS[n][0]: {"uid": NODOS[n][0], "nick": n, "ip": NODOS[n][1], "port_group": PUERTO}
+                for n in "ACD"}
+    motor.memoria.grupos_activos[GID] = {"nombre": "prueba", "miembros": miembros, "gossip": True}
+    encolados = []
+    motor.despachador.encolar = lambda host, port, data, **kw: encolados.append((host, data))
+    tramas = recibir(rx_b, motor.sesiones_rx.setdefault(rx_b, {}))
+    assert b'"origen"' not in tramas[1][0], "el MSG de A debía llegar compacto"
+    for cruda, _ in tramas:
+        motor.manejar_paquete_tcp(cruda, rx_b)
+    relay_c = [data for host, data in encolados if host == NODOS["C"][1]]
+    assert relay_c, f"B no reenvió a C: {encolados}"
+
+    # --- B -> C por su pool (handshake propio primero, así la conexión compacta) ---
+    rx_c = enlace(motor.red, "C")
+    enviar(motor.red, "B", "C", empaquetar("PING", {}, MemoriaGlobal().get_origen()))
+    enviar(motor.red, "B", "C", relay_c[0])
+    sesiones_c = {}
+    (_, (ok, ping)), (_, (ok_msg, msg_c)) = recibir(rx_c, sesiones_c)
+    assert ok and ok_msg, msg_c
+    assert msg_c["origen"]["uid"] == NODOS["A"][0], msg_c["origen"]
+
+    # --- C -> D: mismo relay que el Motor (reenviable) ---
+    red_c = GestorRed()
+    rx_d = enlace(red_c, "D")
+    enviar(red_c, "C", "D", empaquetar("PING", {}, MemoriaGlobal().get_origen()))
+    enviar(red_c, "C", "D", reenviable(msg_c))
+    (_, (ok, _)), (_, (ok_msg, msg_d)) = recibir(rx_d, {})
+    assert ok and ok_msg, msg_d
+    assert msg_d["origen"]["uid"] == NODOS["A"][0] and msg_d["payload"]["mid"] == msg.payload["mid"]
+    assert "sid" not in msg_d and "compacto" not in msg_d
+
+    print("OK: A -> B -> C -> D, el MSG llega válido y con el origen del autor en cada salto")
+
+
+if __name__ == "__main__":
+    main()
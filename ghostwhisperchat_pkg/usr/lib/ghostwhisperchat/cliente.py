@@ -12,9 +12,9 @@ import termios # Raw mode input
 import tty     # Raw mode utility
 import shutil
 import argparse
-import difflib # Autocompletado Inteligente
 from ghostwhisperchat.datos.recursos import Colores as C, BANNER
 from ghostwhisperchat.core import imagen_ascii # Modulo ASCII Art
+from ghostwhisperchat.core.tramas import LectorTramas
 
 IPC_SOCK_PATH = os.path.expanduser("~/.ghostwhisperchat/gwc.sock")
 
@@ -176,20 +176,20 @@ class GestorInput:
                     img_path = self.pending_native_img
                     self.pending_native_img = None
                     
-                    import shutil, subprocess
-                    if shutil.which("kitty"):
-                        try:
+                    kitty_ok = False
+                    if imagen_ascii.soporta_kitty():
+                        # Protocolo gráfico en proceso (sin lanzar el kitten icat)
+                        res = imagen_ascii.render_kitty(img_path, 60)
+                        if not res.startswith("ERROR:"):
                             self.print_incoming(f"{C.CYAN}[IMAGEN NATIVA]{C.RESET}")
                             self._limpiar_linea()
-                            subprocess.run(["kitty", "+kitten", "icat", "--unicode-placeholder", "--align", "left", img_path])
-                            sys.stdout.write("\r\n")
+                            sys.stdout.write(res + "\r\n")
                             sys.stdout.flush()
                             self._pintar_linea()
-                        except: pass
-                    else:
+                            kitty_ok = True
+                    if not kitty_ok:
                         try:
                             self.print_incoming(f"{C.CYAN}[IMAGEN ASCII]{C.RESET}")
-                            from ghostwhisperchat.core import imagen_ascii
                             res = imagen_ascii.render_ascii(img_path, 60)
                             if not res.startswith("ERROR:"):
                                 self._limpiar_linea()
@@ -356,19 +356,17 @@ class GestorInput:
                  
                  # Renderizar Localmente (Sender)
                  self.print_incoming(f"{C.YELLOW}[*] Procesando imagen localmente...{C.RESET}")
-                 import subprocess, shutil
                  kitty_success = False
-                 if shutil.which("kitty"):
-                     try:
-                         # Render Native Kitty
+                 if imagen_ascii.soporta_kitty():
+                     # Render Native Kitty (protocolo gráfico en proceso, sin kitten icat)
+                     res = imagen_ascii.render_kitty(im_path, im_width)
+                     if not res.startswith("ERROR:"):
                          self.print_incoming(f"{C.CYAN}[IMAGEN NATIVA] {os.path.basename(im_path)}{C.RESET}")
                          self._limpiar_linea()
-                         subprocess.run(["kitty", "+kitten", "icat", "--unicode-placeholder", "--align", "left", im_path])
-                         sys.stdout.write("\r\n")
+                         sys.stdout.write(res + "\r\n")
                          sys.stdout.flush()
                          self._pintar_linea()
                          kitty_success = True
-                     except: pass
                      
                  if not kitty_success:
                      try:
@@ -432,18 +430,15 @@ class GestorInput:
         if not target_word: return 
         
         suggestions = []
-        from ghostwhisperchat.datos.recursos import COMMAND_MAP
+        from ghostwhisperchat.logica.comandos import comandos_con_prefijo, sugerir_comandos
         
         # --- CASO 1: COMANDOS ---
         if target_word.startswith("-"):
-             all_cmds = []
-             for key, aliases in COMMAND_MAP.items():
-                 all_cmds.extend(aliases)
-             # Exact prefix match
-             suggestions = [c for c in all_cmds if c.startswith(target_word)]
-             # Fuzzy fallback
+             # Exact prefix match (índice de prefijos sobre los alias)
+             suggestions = comandos_con_prefijo(target_word)
+             # Fuzzy fallback (índice de trigramas)
              if not suggestions:
-                  suggestions = difflib.get_close_matches(target_word, all_cmds, n=3, cutoff=0.55)
+                  suggestions = sugerir_comandos(target_word, n=3, minimo=0.55)
 
         # --- CASO 2: MENCIONES (@) ---
         elif target_word.startswith("@"):
@@ -560,25 +555,20 @@ def modo_ui_chat(target_id, es_grupo):
 
     # 2. Thread de Lectura (Incoming Messages)
     def escuchar():
-        buffer_bytes = b""
+        lector = LectorTramas()
         while helper.running:
             try:
                 # FIX v2.153: Buffer Acumulativo Real (Stream Handling)
-                chunk = s.recv(262144) 
-                if not chunk:
+                # recv_into sobre buffer preasignado (sin concatenar bytes)
+                if not lector.recibir(s):
                     helper.running = False
                     break
                 
-                buffer_bytes += chunk
-                
                 # Procesar mensajes completos (terminados en \n)
-                while b'\n' in buffer_bytes:
-                    line_bytes, buffer_bytes = buffer_bytes.split(b'\n', 1)
-                    if not line_bytes: continue
-                    
+                for line_bytes in lector.tramas():
                     line = ""
                     try:
-                        line = line_bytes.decode('utf-8').strip()
+                        line = str(line_bytes, 'utf-8').strip()
                     except Exception as e:
                         helper.print_incoming(f"[ERROR RX] {e}")
                         continue
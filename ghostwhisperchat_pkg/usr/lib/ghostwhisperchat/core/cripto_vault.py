@@ -1,5 +1,8 @@
 import os
+import sys
 import json
+import atexit
+import threading
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -8,6 +11,22 @@ VAULT_DIR = os.path.expanduser("~/.config/gwc")
 VAULT_FILE = os.path.join(VAULT_DIR, "vault.enc")
 SALT_FILE = os.path.join(VAULT_DIR, ".vault.salt")
 
+# Write-behind: los cambios se agrupan y se escriben a disco tras este retardo
+FLUSH_DEBOUNCE = 2.0
+
+# --- Estado en memoria (por proceso) ---
+# La clave PBKDF2 (100k iteraciones) se deriva UNA vez por proceso.
+# El vault descifrado vive en RAM; los cambios marcan uids sucios y un timer
+# los persiste en bloque. Al apagar se hace flush final (atexit / Motor).
+_key_cache = None
+_key_lock = threading.Lock()
+
+_vault = None           # { uid: {ip, onion} } (None = aún no cargado)
+_sucios = set()         # uids modificados pendientes de flush
+_vault_lock = threading.RLock()
+_flush_lock = threading.Lock()   # serializa escrituras a disco
+_flush_timer = None
+
 def _get_machine_id():
     for path in ["/etc/machine-id", "/var/lib/dbus/machine-id"]:
         if os.path.exists(path):
@@ -15,7 +34,7 @@ def _get_machine_id():
                 return f.read().strip()
     return "unknown-machine-id"
 
-def _get_key():
+def _derivar_key():
     os.makedirs(VAULT_DIR, mode=0o700, exist_ok=True)
     if not os.path.exists(SALT_FILE):
         salt = os.urandom(32)
@@ -39,7 +58,16 @@ def _get_key():
     # Return AES-256-GCM key (32 bytes)
     return kdf.derive(password)
 
-def load_vault():
+def _get_key():
+    """Clave AES-256 derivada una sola vez por proceso (PBKDF2 es caro a propósito)."""
+    global _key_cache
+    if _key_cache is None:
+        with _key_lock:
+            if _key_cache is None:
+                _key_cache = _derivar_key()
+    return _key_cache
+
+def _leer_archivo():
     if not os.path.exists(VAULT_FILE):
         return {}
     try:
@@ -58,7 +86,7 @@ def load_vault():
     except Exception:
         return {}
 
-def save_vault(data):
+def _escribir_archivo(data):
     try:
         key = _get_key()
         aesgcm = AESGCM(key)
@@ -71,32 +99,152 @@ def save_vault(data):
             file.write(nonce + ciphertext)
             
         os.chmod(VAULT_FILE, 0o600)
+        return True
+    except Exception as e:
+        print(f"[VAULT] Error guardando {VAULT_FILE}: {e}", file=sys.stderr)
+        return False
+
+# --- Backend SQLite (GWC_BACKEND=sqlite): una fila cifrada por uid ---
+
+def _cifrar_fila(uid, entry):
+    """(uid, nonce, cifrado) con AES-GCM; el uid va como AAD (una fila no se puede mover a otro uid)."""
+    nonce = os.urandom(12)
+    cifrado = AESGCM(_get_key()).encrypt(nonce, json.dumps(entry).encode('utf-8'), uid.encode('utf-8'))
+    return (uid, nonce, cifrado)
+
+def _descifrar_fila(uid, nonce, cifrado):
+    return json.loads(AESGCM(_get_key()).decrypt(nonce, cifrado, uid.encode('utf-8')).decode('utf-8'))
+
+def _leer_disco():
+    from ghostwhisperchat.datos.base_sqlite import usar_sqlite, base
+    if not usar_sqlite():
+        return _leer_archivo()
+    data = {}
+    for uid, nonce, cifrado in base().cargar_vault():
+        try:
+            data[uid] = _descifrar_fila(uid, nonce, cifrado)
+        except Exception:
+            pass  # Fila corrupta o de otra máquina: se ignora como el archivo ilegible
+    return data
+
+def _escribir_disco(data, sucios=None):
+    """sucios=None: reemplazar todo. Con SQLite solo se reescriben las filas de `sucios`."""
+    from ghostwhisperchat.datos.base_sqlite import usar_sqlite, base
+    if not usar_sqlite():
+        return _escribir_archivo(data)
+    try:
+        if sucios is None:
+            base().guardar_vault([_cifrar_fila(uid, e) for uid, e in data.items()], reemplazar=True)
+        else:
+            base().guardar_vault([_cifrar_fila(uid, data[uid]) for uid in sucios if uid in data],
+                                 [uid for uid in sucios if uid not in data])
+        return True
     except Exception as e:
-        pass
+        print(f"[VAULT] Error guardando en SQLite: {e}", file=sys.stderr)
+        return False
+
+def _asegurar_cargado():
+    global _vault
+    if _vault is None:
+        _vault = _leer_disco()
+    return _vault
+
+def _programar_flush():
+    """Agenda un flush diferido (si ya hay uno pendiente, se agrupa con él)."""
+    global _flush_timer
+    if _flush_timer is not None:
+        return
+    _flush_timer = threading.Timer(FLUSH_DEBOUNCE, flush_vault)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+def flush_vault():
+    """Persiste los cambios pendientes. Llamar al apagar (también registrado en atexit)."""
+    global _flush_timer
+    with _flush_lock:
+        with _vault_lock:
+            _flush_timer = None
+            if not _sucios or _vault is None:
+                return
+            snapshot = {uid: dict(e) for uid, e in _vault.items()}
+            pendientes = set(_sucios)
+            _sucios.clear()
+        if not _escribir_disco(snapshot, pendientes):
+            # Reintentar en el próximo flush
+            with _vault_lock:
+                _sucios.update(pendientes)
+                _programar_flush()
+
+def load_vault():
+    """Copia del vault descifrado (desde RAM)."""
+    with _vault_lock:
+        return {uid: dict(e) for uid, e in _asegurar_cargado().items()}
+
+def save_vault(data):
+    """Reemplaza el vault completo y lo escribe a disco de inmediato."""
+    global _vault
+    with _flush_lock:
+        with _vault_lock:
+            _vault = {uid: dict(e) for uid, e in data.items()}
+            _sucios.clear()
+            snapshot = {uid: dict(e) for uid, e in _vault.items()}
+        _escribir_disco(snapshot)
 
 def get_vault_entry(uid):
-    vault = load_vault()
-    return vault.get(uid, {})
+    with _vault_lock:
+        return dict(_asegurar_cargado().get(uid, {}))
+
+def get_vault_entries(uids=None):
+    """
+    Lookup en bloque para dashboards (GLOBAL_STATUS, LS, CONTACTS).
+    Retorna { uid: entry } con una sola toma del lock. uids=None -> todo el vault.
+    """
+    with _vault_lock:
+        vault = _asegurar_cargado()
+        if uids is None:
+            return {uid: dict(e) for uid, e in vault.items()}
+        return {uid: dict(vault[uid]) for uid in uids if uid in vault}
+
+def set_vault_entry(uid, entry):
+    """Reemplaza la entrada de un uid (vacía = borrar). Persistencia diferida."""
+    with _vault_lock:
+        vault = _asegurar_cargado()
+        actual = vault.get(uid)
+        if entry:
+            if actual == entry:
+                return  # Sin cambios: nada que escribir
+            vault[uid] = dict(entry)
+        else:
+            if actual is None:
+                return
+            del vault[uid]
+        _sucios.add(uid)
+        _programar_flush()
 
 def update_vault_entry(uid, ip=None, onion=None):
-    vault = load_vault()
-    entry = vault.get(uid, {})
-    
-    # Do not overwrite with None if already present
-    if ip is not None:
-        entry["ip"] = ip
-    if onion is not None:
-        entry["onion"] = onion
+    with _vault_lock:
+        entry = dict(_asegurar_cargado().get(uid, {}))
         
-    if entry:
-        vault[uid] = entry
-        save_vault(vault)
+        # Do not overwrite with None if already present
+        if ip is not None:
+            entry["ip"] = ip
+        if onion is not None:
+            entry["onion"] = onion
+            
+        if entry:
+            set_vault_entry(uid, entry)
 
 def delete_vault_entry(uid):
-    vault = load_vault()
-    if uid in vault:
+    # Borrado explícito de datos privados: se persiste al instante
+    with _vault_lock:
+        vault = _asegurar_cargado()
+        if uid not in vault:
+            return
         del vault[uid]
-        save_vault(vault)
+        _sucios.add(uid)
+    flush_vault()
 
 def clear_vault():
     save_vault({})
+
+atexit.register(flush_vault)
@@ -0,0 +1,214 @@
+# /usr/lib/ghostwhisperchat/core/despachador.py
+# Despachador de Salida: pool acotado de hilos + cola FIFO por destino
+#
+# Reemplaza el patrón "un threading.Thread por paquete" del Motor.
+# - Cada destino (host, port) tiene su propia cola FIFO y la atiende UN solo
+#   worker a la vez: el orden por peer se conserva (MSG, TYPING, LEAVE...).
+# - Dos carriles independientes (LAN / TOR), cada uno con sus propios workers:
+#   un peer .onion lento nunca deja sin hilos a los peers de la LAN.
+# - Los destinos listos se atienden en ronda (1 paquete por turno), así un
+#   destino con mucha cola no acapara a los workers de su carril.
+# - Colas acotadas: al llenarse se descarta primero lo descartable (TYPING,
+#   CHAT_KEEP) y luego el paquete nuevo. Todo se cuenta en estadisticas().
+# - Señales efímeras (typing, presencia) pueden pedir solo_si_libre: si el
+#   destino ya tiene algo en cola se descartan en vez de esperar detrás.
+
+import sys
+import threading
+import collections
+
+HILOS_LAN = 4               # Workers máximos del carril LAN
+HILOS_TOR = 4               # Workers máximos del carril Tor (cada envío puede tardar segundos)
+MAX_COLA_DESTINO = 256      # Paquetes pendientes máximos por (host, port)
+
+CARRIL_LAN = "LAN"
+CARRIL_TOR = "TOR"
+
+
+class _Envio:
+    __slots__ = ("data", "on_done", "force_new", "descartable")
+
+    def __init__(self, data, on_done, force_new, descartable):
+        self.data = data
+        self.on_done = on_done
+        self.force_new = force_new
+        self.descartable = descartable
+
+
+class _Carril:
+    def __init__(self, nombre, max_hilos):
+        self.nombre = nombre
+        self.max_hilos = max_hilos
+        self.colas = {}                        # (host, port) -> deque[_Envio]
+        self.listos = collections.deque()      # Destinos con cola y sin worker asignado
+        self.ocupados = set()                  # Destinos siendo atendidos ahora
+        self.hilos = []
+        self.cond = threading.Condition()
+
+    def profundidad(self):
+        return sum(len(q) for q in self.colas.values())
+
+
+class DespachadorSalida:
+    def __init__(self, red, hilos_lan=HILOS_LAN, hilos_tor=HILOS_TOR, max_cola=MAX_COLA_DESTINO, al_fallar=None):
+        self.red = red
+        self.al_fallar = al_fallar     # al_fallar(host, port): ej. invalidar la ruta cacheada
+        self.max_cola = max_cola
+        self._carriles = {
+            CARRIL_LAN: _Carril(CARRIL_LAN, hilos_lan),
+            CARRIL_TOR: _Carril(CARRIL_TOR, hilos_tor),
+        }
+        self._cerrando = False
+        self._stats_lock = threading.Lock()
+        self.stats = {"encolados": 0, "enviados": 0, "fallidos": 0, "descartados": 0, "pico_cola": 0}
+
+    @staticmethod
+    def _carril_de(host):
+        return CARRIL_TOR if str(host).endswith(".onion") else CARRIL_LAN
+
+    def _contar(self, clave, n=1):
+        with self._stats_lock:
+            self.stats[clave] += n
+
+    # --- API ---
+
+    def encolar(self, host, port, data, on_done=None, force_new=False, descartable=False, solo_si_libre=False):
+        """
+        Encola `data` hacia (host, port). Retorna False si se descartó por cola llena.
+        on_done(ok) se llama desde el worker al terminar el envío (o con False si se descarta).
+        descartable=True: paquetes efímeros (TYPING, CHAT_KEEP) que ceden lugar si la cola se llena.
+        solo_si_libre=True: se descarta si el destino ya tiene envíos pendientes o uno en curso.
+        """
+        if not host or self._cerrando:
+            return False
+        carril = self._carriles[self._carril_de(host)]
+        clave = (host, port)
+        envio = _Envio(data, on_done, force_new, descartable)
+        expulsado = None
+
+        with carril.cond:
+            cola = carril.colas.get(clave)
+            if cola is None:
+                cola = carril.colas[clave] = collections.deque()
+
+            if solo_si_libre and (cola or clave in carril.ocupados):
+                envio, expulsado = None, envio
+            elif len(cola) >= self.max_cola:
+                if not descartable:
+                    # Ceder el lugar del descartable más antiguo, si hay
+                    for previo in cola:
+                        if previo.descartable:
+                            expulsado = previo
+                            break
+                if expulsado is None:
+                    envio, expulsado = None, envio
+                else:
+                    cola.remove(expulsado)
+
+            if envio is not None:
+                cola.append(envio)
+                if clave not in carril.ocupados and len(cola) == 1:
+                    carril.listos.append(clave)
+                self._asegurar_hilos(carril)
+                carril.cond.notify()
+            profundidad = len(cola)
+
+        with self._stats_lock:
+            if envio is not None:
+                self.stats["encolados"] += 1
+                if profundidad > self.stats["pico_cola"]:
+                    self.stats["pico_cola"] = profundidad
+            if expulsado is not None:
+                self.stats["descartados"] += 1
+
+        if expulsado is not None:
+            if not expulsado.descartable:
+                print(f"[DESPACHO] Cola llena hacia {host}:{port}, paquete descartado", file=sys.stderr)
+            self._notificar(expulsado, False)
+        return envio is not None
+
+    def profundidad(self, host=None, port=None):
+        """Paquetes pendientes totales, o hacia un destino concreto."""
+        if host is None:
+            return sum(c.profundidad() for c in self._carriles.values())
+        carril = self._carriles[self._carril_de(host)]
+        with carril.cond:
+            return len(carril.colas.get((host, port), ()))
+
+    def estadisticas(self):
+        """Snapshot de contadores y colas (para el dashboard)."""
+        with self._stats_lock:
+            res = dict(self.stats)
+        for nombre, carril in self._carriles.items():
+            with carril.cond:
+                res[nombre] = {
+                    "cola": carril.profundidad(),
+                    "destinos": len(carril.colas),
+                    "hilos": len(carril.hilos),
+                    "activos": len(carril.ocupados),
+                }
+        return res
+
+    def cerrar(self, timeout=2.0):
+        """Deja de aceptar envíos y espera (hasta `timeout`) que se vacíen las colas."""
+        import time
+        self._cerrando = True
+        limite = time.time() + timeout
+        for carril in self._carriles.values():
+            with carril.cond:
+                while (carril.colas or carril.ocupados) and time.time() < limite:
+                    carril.cond.wait(max(0.0, limite - time.time()))
+                carril.cond.notify_all()
+
+    # --- Workers ---
+
+    def _asegurar_hilos(self, carril):
+        """Crea workers bajo demanda hasta el máximo del carril (llamar con cond tomado)."""
+        if len(carril.hilos) < carril.max_hilos and len(carril.hilos) < len(carril.listos) + len(carril.ocupados):
+            t = threading.Thread(target=self._worker, args=(carril,), daemon=True,
+                                 name=f"despacho-{carril.nombre}-{len(carril.hilos)}")
+            carril.hilos.append(t)
+            t.start()
+
+    def _worker(self, carril):
+        while True:
+            with carril.cond:
+                while not carril.listos:
+                    if self._cerrando and not carril.colas:
+                        return
+                    carril.cond.wait(1.0)
+                clave = carril.listos.popleft()
+                envio = carril.colas[clave].popleft()
+                carril.ocupados.add(clave)
+
+            host, port = clave
+            ok = False
+            try:
+                ok = bool(self.red.enviar_tcp_priv(host, envio.data, port=port, force_new=envio.force_new))
+            except Exception as e:
+                print(f"[DESPACHO] Error enviando a {host}:{port}: {e}", file=sys.stderr)
+            self._contar("enviados" if ok else "fallidos")
+            if not ok and self.al_fallar:
+                try: self.al_fallar(host, port)
+                except Exception: pass
+            self._notificar(envio, ok)
+
+            with carril.cond:
+                carril.ocupados.discard(clave)
+                cola = carril.colas.get(clave)
+                if cola:
+                    # Vuelve al final de la ronda: los demás destinos no esperan a este
+                    carril.listos.append(clave)
+                    carril.cond.notify()
+                else:
+                    carril.colas.pop(clave, None)
+                    if self._cerrando:
+                        carril.cond.notify_all()
+
+    @staticmethod
+    def _notificar(envio, ok):
+        if envio.on_done:
+            try:
+                envio.on_done(ok)
+            except Exception as e:
+                print(f"[DESPACHO] Error en callback: {e}", file=sys.stderr)
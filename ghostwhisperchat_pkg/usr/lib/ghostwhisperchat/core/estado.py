@@ -6,9 +6,12 @@ import json
 import hashlib
 import getpass
 from ghostwhisperchat.datos.recursos import APP_VERSION
+from ghostwhisperchat.core.historial import HistorialChats
+from ghostwhisperchat.core.tramas import PROTO_TRAMAS
 
 CONFIG_FILE = os.path.expanduser("~/.ghostwhisperchat/config.json")
 HISTORY_DIR = os.path.expanduser("~/.ghostwhisperchat/history")
+PEER_TIMEOUT = 86400  # Segundos sin señales de vida antes de olvidar un peer
 
 class MemoriaGlobal:
     _instance = None
@@ -38,6 +41,16 @@ class MemoriaGlobal:
         self.auto_download = False
         self.version = APP_VERSION
         
+        # Historial segmentado append-only (ver core/historial.py),
+        # o tabla indexada en gwc.db con GWC_BACKEND=sqlite
+        from ghostwhisperchat.datos.base_sqlite import usar_sqlite
+        if usar_sqlite():
+            from ghostwhisperchat.core.historial import HistorialSQLite
+            from ghostwhisperchat.datos.base_sqlite import base
+            self.historial = HistorialSQLite(base())
+        else:
+            self.historial = HistorialChats(HISTORY_DIR)
+        
         # Cargar Persistencia
         self._cargar_configuracion()
         self._cargar_contactos()
@@ -82,8 +95,9 @@ class MemoriaGlobal:
 
         self.guardar_configuracion() # Persist current Choice
 
-        # Tablas de Red
-        self.peers = {} 
+        # Tablas de Red (dicts con índices por nick, prefijo, onion e IP; ver core/indices.py)
+        from ghostwhisperchat.core.indices import tabla_peers, tabla_grupos
+        self.peers = tabla_peers()
         # Estructura PEERS: 
         # { 
         #   "UID": { 
@@ -95,9 +109,13 @@ class MemoriaGlobal:
         #       "last_seen": timestamp 
         #   } 
         # }
+        # Hook opcional: al_cambiar_ip(uid, onion, ip_anterior, ip_nueva)
+        self.al_cambiar_ip = None
+        # Hook opcional: al_nuevo_peer(uid) cuando un uid entra a la tabla (ej: agendar su expiración)
+        self.al_nuevo_peer = None
 
-        # Grupos
-        self.grupos_activos = {}
+        # Grupos (índice por nombre)
+        self.grupos_activos = tabla_grupos()
         
         # Ignorados temporales (para que al eliminar un contacto no vuelva a aparecer al instante por un ping)
         self.contactos_ignorados = set()
@@ -148,22 +166,20 @@ class MemoriaGlobal:
              print(f"[!] Error guardando config: {e}")
 
     # --- PERSISTENCIA CONTACTOS ---
+    # La agenda vive en RAM en datos/contactos.AlmacenContactos (flush diferido).
+    # self.contactos ES el dict del almacén: leerlo no toca disco.
     def _cargar_contactos(self):
-        cfile = os.path.expanduser("~/.ghostwhisperchat/contacts.json")
-        if os.path.exists(cfile):
-            try:
-                with open(cfile, 'r') as f:
-                    self.contactos = json.load(f)
-            except: self.contactos = {}
-        else:
-            self.contactos = {}
+        from ghostwhisperchat.datos.contactos import almacen
+        self.almacen_contactos = almacen()
+        self.contactos = self.almacen_contactos.datos
 
     def guardar_contactos(self):
-        cfile = os.path.expanduser("~/.ghostwhisperchat/contacts.json")
-        try:
-            with open(cfile, 'w') as f:
-                json.dump(self.contactos, f)
-        except: pass
+        """Marca la agenda como modificada; se persiste en el próximo flush diferido."""
+        self.almacen_contactos.marcar_sucio()
+
+    def flush_contactos(self):
+        """Persistencia inmediata (apagado)."""
+        self.almacen_contactos.flush()
 
     def registrar_contacto(self, uid, nick, ip, onion=None, sys_user=None, status_msg=None, remote_privacy="AMBOS"):
         """Registra un contacto persistente (historial de interaccion) sin guardar IP/Onion en JSON"""
@@ -173,7 +189,7 @@ class MemoriaGlobal:
         if hasattr(self, 'contactos_ignorados') and uid in self.contactos_ignorados:
             return # Ignorar auto-registro si fue eliminado en esta sesion
 
-        from ghostwhisperchat.core.cripto_vault import update_vault_entry
+        from ghostwhisperchat.core.cripto_vault import get_vault_entry, set_vault_entry
         with self._lock:
             contacto_previo = self.contactos.get(uid, {})
             sys_user_final = sys_user if sys_user else contacto_previo.get("sys_user", "?")
@@ -182,19 +198,19 @@ class MemoriaGlobal:
             status_msg_final = status_msg if status_msg is not None else contacto_previo.get("status_msg", "")
             
             # Update public metadata in contacts.json
-            self.contactos[uid] = {
+            # (si solo cambió last_seen el almacén agrupa el flush en una ventana larga)
+            self.almacen_contactos.actualizar(uid, {
                 "uid": uid,
                 "nick": nick,
                 "sys_user": sys_user_final,
                 "status_msg": status_msg_final,
                 "last_seen": time.time(),
                 "privacy_policy": remote_privacy
-            }
+            })
             
             # Store private data in vault respetando la privacidad del otro
-            from ghostwhisperchat.core.cripto_vault import load_vault, save_vault, delete_vault_entry
-            vault = load_vault()
-            entry = vault.get(uid, {})
+            # (vault en RAM; la escritura a disco es diferida, ver cripto_vault)
+            entry = get_vault_entry(uid)
             
             # Remove keys if the remote privacy forbids them
             if remote_privacy not in ["AMBOS", "IP", "SOLO-LOCAL"] and "ip" in entry:
@@ -208,71 +224,35 @@ class MemoriaGlobal:
             if remote_privacy in ["AMBOS", "TOR", "SOLO-GLOBAL"] and onion:
                  entry["onion"] = onion
                  
-            if entry:
-                 vault[uid] = entry
-                 save_vault(vault)
-            else:
-                 delete_vault_entry(uid)
-
-        self.guardar_contactos()
+            set_vault_entry(uid, entry)
         
-    def buscar_contacto_fuzzy(self, query):
+    def buscar_contacto_fuzzy(self, query, limite=5):
         """
         Busca en contactos y peers activos.
         Retorna lista de sugerencias [ {nick, ip, match_ratio, source} ]
+        Los candidatos salen del índice de trigramas de cada tabla (core/indices.py):
+        no se copia ni se compara toda la agenda por consulta.
+        Retorna como máximo `limite` sugerencias (antes eran todas las que pasaban
+        0.55); los llamadores del motor solo muestran las 3 primeras.
         """
-        import difflib
         from ghostwhisperchat.core.utilidades import normalize_text
         
         query_norm = normalize_text(query)
-        candidates = {}
         
-        # 1. Merge sources (Active Peers + Persistent Contacts)
-        # Peers have priority on IP info
-        all_users = {} 
-        
-        with self._lock:
-            # Load contacts first
-            for uid, c in self.contactos.items():
-                all_users[uid] = c.copy()
-                all_users[uid]['source'] = 'CONTACTO'
-                
-            # Overwrite/Add active peers (more recent status)
-            for ip, p in self.peers.items():
-                uid = p.get('uid')
-                if uid:
-                    p_data = p.copy()
-                    p_data['ip'] = ip
-                    p_data['source'] = 'RED (Scan)'
-                    all_users[uid] = p_data
-
-        suggestions = []
-        
-        for uid, data in all_users.items():
-            nick = data.get('nick', 'UNK')
-            nick_norm = normalize_text(nick)
-            
-            # Exact Match (already checked elsewhere usually, but good to have)
-            if query_norm == nick_norm:
-                data['ratio'] = 1.0
-                suggestions.append(data)
-                continue
-                
-            # Contains
-            if query_norm in nick_norm:
-                data['ratio'] = 0.9
-                suggestions.append(data)
-                continue
-            
-            # Fuzzy
-            ratio = difflib.SequenceMatcher(None, query_norm, nick_norm).ratio()
-            if ratio >= 0.55: # User requested 55%
+        # Peers have priority on IP info (se procesan después y pisan al contacto)
+        all_users = {}
+        for tabla, source in ((self.contactos, 'CONTACTO'), (self.peers, 'RED (Scan)')):
+            for ratio, uid in tabla.similares(query_norm, minimo=0.55, limite=limite):
+                d = tabla.get(uid)
+                if not isinstance(d, dict): continue
+                data = d.copy()
+                data['source'] = source
                 data['ratio'] = ratio
-                suggestions.append(data)
-        
+                all_users[uid] = data
+
         # Sort by ratio
-        suggestions.sort(key=lambda x: x['ratio'], reverse=True)
-        return suggestions
+        suggestions = sorted(all_users.values(), key=lambda x: x['ratio'], reverse=True)
+        return suggestions[:limite]
 
     def set_identidad(self, uid, nick, ip, port_priv=None, port_group=None, onion=None):
         # Este metodo se suele llamar al inicio desde motor para setear IP, Onion y Puertos
@@ -285,8 +265,7 @@ class MemoriaGlobal:
 
     def actualizar_peer(self, ip, uid, nick, status="ONLINE", port_priv=None, port_group=None, sys_user=None, status_msg=None, onion=None, remote_privacy="AMBOS"):
         with self._lock:
-            if uid not in self.peers:
-                self.peers[uid] = {}
+            ip_anterior = (self.peers.get(uid) or {}).get('ip')
             
             update_data = {
                 "uid": uid,
@@ -299,18 +278,51 @@ class MemoriaGlobal:
             if sys_user: update_data['sys_user'] = sys_user
             if status_msg is not None: update_data['status_msg'] = status_msg
             if onion: update_data['onion'] = onion
+            if port_priv: update_data['port_priv'] = port_priv
+            if port_group: update_data['port_group'] = port_group
             
-            self.peers[uid].update(update_data)
-            if port_priv: self.peers[uid]['port_priv'] = port_priv
-            if port_group: self.peers[uid]['port_group'] = port_group
+            # Datos e índices (nick/onion/IP) en un solo paso
+            self.refrescar_peer(uid, update_data)
             
             # Persistencia Automatica
             self.registrar_contacto(uid, nick, ip, onion=onion, sys_user=sys_user, status_msg=status_msg, remote_privacy=remote_privacy)
 
+        # Aviso de cambio de IP (ej: invalidar la ruta LAN/Onion cacheada del peer)
+        if ip_anterior and ip_anterior != ip and self.al_cambiar_ip:
+            try: self.al_cambiar_ip(uid, self.peers[uid].get('onion'), ip_anterior, ip)
+            except Exception as e:
+                print(f"[Estado] Error en hook de cambio de IP: {e}", file=sys.stderr)
+
+    def refrescar_peer(self, uid, campos):
+        """Actualiza (o crea) la entrada del peer con sus índices; avisa a al_nuevo_peer si es nuevo."""
+        with self._lock:
+            nuevo = uid not in self.peers
+            entrada = self.peers.actualizar(uid, campos)
+        if nuevo and self.al_nuevo_peer:
+            try: self.al_nuevo_peer(uid)
+            except Exception as e:
+                print(f"[Estado] Error en hook de nuevo peer: {e}", file=sys.stderr)
+        return entrada
+
     def obtener_peer(self, uid):
         return self.peers.get(uid)
 
-    def limpiar_peers_antiguos(self, timeout_segundos=86400):
+    def expirar_peer(self, uid, timeout_segundos=PEER_TIMEOUT):
+        """
+        Borra el peer si venció. Si tuvo señales de vida retorna los segundos que le
+        quedan (para re-agendar su temporizador); None si ya no está.
+        """
+        with self._lock:
+            data = self.peers.get(uid)
+            if data is None:
+                return None
+            restante = data.get('last_seen', 0) + timeout_segundos - time.time()
+            if restante > 0:
+                return restante
+            del self.peers[uid]
+            return None
+
+    def limpiar_peers_antiguos(self, timeout_segundos=PEER_TIMEOUT):
         """Elimina peers que no han dado señales de vida"""
         ahora = time.time()
         with self._lock:
@@ -344,13 +356,17 @@ class MemoriaGlobal:
                 }
 
     def buscar_peer(self, query):
-        """Busca un peer por Nick (comienzo), UID exacto o dirección .onion."""
+        """Busca un peer por Nick, UID exacto o dirección .onion (vía índices, sin recorrer peers)."""
+        from ghostwhisperchat.core.utilidades import normalize_text
         query = query.lower()
-        candidates = []
         with self._lock:
-            for uid, p in self.peers.items():
-                if p.get('nick', '').lower() == query or uid == query or p.get('onion', '').lower() == query:
-                    candidates.append(p)
+            uids = self.peers.uids("onion", query)
+            if query in self.peers:
+                uids.add(query)
+            # El índice es por nick normalizado; se conserva la comparación exacta (lower)
+            uids.update(uid for uid in self.peers.uids("nick", normalize_text(query))
+                        if self.peers[uid].get('nick', '').lower() == query)
+            candidates = [self.peers[uid] for uid in uids]
         
         if not candidates:
             return None
@@ -369,7 +385,8 @@ class MemoriaGlobal:
             "port_priv": getattr(self, 'mi_port_priv', 44494),
             "port_group": getattr(self, 'mi_port_group', 44496),
             "ip": self.mi_ip,
-            "privacy_policy": getattr(self, 'privacy_policy', "AMBOS")
+            "privacy_policy": getattr(self, 'privacy_policy', "AMBOS"),
+            "proto": PROTO_TRAMAS
         }
         
         if self.mi_onion:
@@ -388,7 +405,6 @@ class MemoriaGlobal:
         """
         try:
             os.makedirs(HISTORY_DIR, exist_ok=True)
-            log_path = os.path.join(HISTORY_DIR, f"{chat_id}.log")
             
             from datetime import datetime
             now = datetime.now()
@@ -403,23 +419,11 @@ class MemoriaGlobal:
             # But to insert "HOY", we need the date. So let's store:
             # YYYY-MM-DD HH:MM|Nick|Msg
             
-            line = f"{ts_str}|{nick_display}|{mensaje}\n"
-            
-            with open(log_path, 'a', encoding='utf-8') as f:
-                f.write(line)
+            line = f"{ts_str}|{nick_display}|{mensaje}"
             
-            # FIX v2.168: Rotacion de Logs (Mantener Max 20 lineas)
-            # El usuario solicito que el historial no crezca infinitamente.
-            try:
-                msg_limit = 20
-                with open(log_path, 'r', encoding='utf-8') as fr:
-                    lines = fr.readlines()
-                
-                if len(lines) > msg_limit:
-                    keep = lines[-msg_limit:]
-                    with open(log_path, 'w', encoding='utf-8') as fw:
-                        fw.writelines(keep)
-            except: pass
+            # Append-only segmentado (sin reescribir el archivo por mensaje).
+            # La retención ya no es de 20 líneas: se compacta en segundo plano.
+            self.historial.agregar(chat_id, line)
                 
         except Exception as e:
             print(f"[X] Error guardando historial: {e}", file=sys.stderr)
@@ -429,18 +433,12 @@ class MemoriaGlobal:
         Recupera las últimas líneas formateadas con separadores de fecha.
         Retorna una cadena lista para imprimir.
         """
-        log_path = os.path.join(HISTORY_DIR, f"{chat_id}.log")
-        if not os.path.exists(log_path):
-            return ""
-            
         lines = []
         try:
-            # Read all (lightweight enough for text logs usually) or tail
-            with open(log_path, 'r', encoding='utf-8') as f:
-                raw_lines = f.readlines()
-                
-            # Take last N
-            chunk = raw_lines[-limit:] if len(raw_lines) > limit else raw_lines
+            # Cola servida desde el ring en RAM (o seek desde el final del log)
+            chunk, total = self.historial.ultimas(chat_id, limit)
+            if not total:
+                return ""
             
             from datetime import datetime
             from ghostwhisperchat.datos.recursos import Colores
@@ -450,8 +448,8 @@ class MemoriaGlobal:
             today = datetime.now().strftime("%Y-%m-%d")
             
             # Header
-            if raw_lines:
-                res += f"{Colores.GREY}--- Cargar historial previo ({len(chunk)}/{len(raw_lines)}) ---{Colores.RESET}\n"
+            if total:
+                res += f"{Colores.GREY}--- Cargar historial previo ({len(chunk)}/{total}) ---{Colores.RESET}\n"
 
             for line in chunk:
                 parts = line.strip().split('|', 2)
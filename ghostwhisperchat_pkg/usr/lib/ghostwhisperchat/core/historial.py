@@ -0,0 +1,280 @@
+# /usr/lib/ghostwhisperchat/core/historial.py
+# Historial de Chat: log segmentado append-only por chat + índice pequeño
+#
+# Estructura en disco:
+#   ~/.ghostwhisperchat/history/<chat_id>/seg_00000001.log   (segmentos sellados)
+#   ~/.ghostwhisperchat/history/<chat_id>/seg_00000002.log   (segmento activo, solo append)
+#   ~/.ghostwhisperchat/history/<chat_id>/index.json         ([num, lineas, bytes] de sellados)
+#
+# - Escribir = 1 append (sin leer ni reescribir el archivo).
+# - Leer la cola = seek desde el final del segmento (y anteriores si hace falta).
+# - Retención/compactación (borrar segmentos viejos) corre en un hilo de fondo.
+# - Ring en RAM con las últimas líneas por chat: la inyección de historial en
+#   __REGISTER_UI__ de un chat activo no toca el disco.
+
+import os
+import sys
+import json
+import threading
+import collections
+
+SEGMENTO_MAX_LINEAS = 500        # Sellar segmento al llegar a N líneas...
+SEGMENTO_MAX_BYTES = 256 * 1024  # ...o a este tamaño
+RETENCION_LINEAS = 5000          # Líneas mínimas a conservar por chat (granularidad: segmento)
+RING_MAX = 50                    # Líneas recientes en RAM por chat
+INTERVALO_COMPACTACION = 60.0    # Segundos entre pasadas del hilo de fondo
+
+INDEX_FILE = "index.json"
+
+
+def _nombre_segmento(num):
+    return f"seg_{num:08d}.log"
+
+
+def _leer_cola(path, n, bloque=8192):
+    """Lee las últimas n líneas de un archivo haciendo seek desde el final."""
+    if n <= 0:
+        return []
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            datos = b""
+            # n líneas completas requieren n+1 saltos (o llegar al inicio)
+            while pos > 0 and datos.count(b'\n') <= n:
+                leer = min(bloque, pos)
+                pos -= leer
+                f.seek(pos)
+                datos = f.read(leer) + datos
+    except OSError:
+        return []
+    # Cortar solo en b'\n' (como readlines): splitlines también corta en \r, \x0b,
+    # \x0c, \x1c-\x1e, \x85, \u2028... que un mensaje puede traer dentro de su línea
+    lineas = datos.split(b'\n')
+    if lineas and not lineas[-1]:
+        lineas.pop()
+    return [l.decode('utf-8', errors='replace') for l in lineas[-n:]]
+
+
+class _EstadoChat:
+    __slots__ = ("dir", "sellados", "activo", "lineas_activo", "bytes_activo", "ring", "compactar")
+
+    def __init__(self, directorio):
+        self.dir = directorio
+        self.sellados = []        # [[num, lineas, bytes], ...] en orden
+        self.activo = 1
+        self.lineas_activo = 0
+        self.bytes_activo = 0
+        self.ring = collections.deque(maxlen=RING_MAX)
+        self.compactar = False
+
+    def total(self):
+        return sum(s[1] for s in self.sellados) + self.lineas_activo
+
+    def ruta(self, num):
+        return os.path.join(self.dir, _nombre_segmento(num))
+
+
+class HistorialChats:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._chats = {}   # chat_id -> _EstadoChat
+        self._lock = threading.RLock()
+        self._hilo = None
+
+    # --- Carga / Migración ---
+
+    def _abrir(self, chat_id):
+        """Carga (una vez por proceso) el índice y el segmento activo de un chat."""
+        st = self._chats.get(chat_id)
+        if st is not None:
+            return st
+
+        directorio = os.path.join(self.base_dir, chat_id)
+        st = _EstadoChat(directorio)
+        legacy = os.path.join(self.base_dir, f"{chat_id}.log")
+
+        if not os.path.isdir(directorio) and os.path.exists(legacy):
+            # Migrar formato anterior (<chat_id>.log) -> primer segmento
+            try:
+                os.makedirs(directorio, exist_ok=True)
+                os.rename(legacy, st.ruta(1))
+            except OSError as e:
+                print(f"[HIST] No se pudo migrar {legacy}: {e}", file=sys.stderr)
+
+        if os.path.isdir(directorio):
+            try:
+                with open(os.path.join(directorio, INDEX_FILE), 'r', encoding='utf-8') as f:
+                    st.sellados = [list(s) for s in json.load(f).get("segmentos", [])]
+            except (OSError, ValueError):
+                st.sellados = []
+            st.activo = (st.sellados[-1][0] + 1) if st.sellados else 1
+
+            # Contar el segmento activo (acotado por SEGMENTO_MAX_BYTES)
+            ruta_activo = st.ruta(st.activo)
+            try:
+                with open(ruta_activo, 'rb') as f:
+                    contenido = f.read()
+                st.lineas_activo = contenido.count(b'\n')
+                st.bytes_activo = len(contenido)
+            except OSError:
+                pass
+
+            # Precargar ring con la cola
+            st.ring.extend(self._leer_ultimas_disco(st, RING_MAX))
+            if st.sellados and st.total() - st.sellados[0][1] >= RETENCION_LINEAS:
+                st.compactar = True
+
+        self._chats[chat_id] = st
+        return st
+
+    def _guardar_indice(self, st):
+        ruta = os.path.join(st.dir, INDEX_FILE)
+        tmp = ruta + ".tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"segmentos": st.sellados}, f)
+            os.replace(tmp, ruta)
+        except OSError as e:
+            print(f"[HIST] Error guardando índice {ruta}: {e}", file=sys.stderr)
+
+    # --- API ---
+
+    def agregar(self, chat_id, linea):
+        """Append de una línea (sin salto) al segmento activo del chat."""
+        data = (linea.replace('\n', ' ') + '\n').encode('utf-8')
+        with self._lock:
+            st = self._abrir(chat_id)
+            os.makedirs(st.dir, exist_ok=True)
+            with open(st.ruta(st.activo), 'ab') as f:
+                f.write(data)
+            st.lineas_activo += 1
+            st.bytes_activo += len(data)
+            st.ring.append(linea)
+
+            if st.lineas_activo >= SEGMENTO_MAX_LINEAS or st.bytes_activo >= SEGMENTO_MAX_BYTES:
+                # Sellar: el índice solo se reescribe al rotar (no por mensaje)
+                st.sellados.append([st.activo, st.lineas_activo, st.bytes_activo])
+                st.activo += 1
+                st.lineas_activo = 0
+                st.bytes_activo = 0
+                self._guardar_indice(st)
+                if st.total() - st.sellados[0][1] >= RETENCION_LINEAS:
+                    st.compactar = True
+
+        self._asegurar_hilo()
+
+    def ultimas(self, chat_id, n):
+        """Retorna (lineas, total) con las últimas n líneas del chat."""
+        with self._lock:
+            st = self._abrir(chat_id)
+            total = st.total()
+            if n <= len(st.ring) or len(st.ring) >= total:
+                # Servido desde RAM
+                return list(st.ring)[-n:], total
+            return self._leer_ultimas_disco(st, n), total
+
+    def _leer_ultimas_disco(self, st, n):
+        """Tail multi-segmento: usa el índice para saber cuántos segmentos retroceder."""
+        resultado = _leer_cola(st.ruta(st.activo), min(n, st.lineas_activo)) if st.lineas_activo else []
+        faltan = n - len(resultado)
+        for num, lineas, _ in reversed(st.sellados):
+            if faltan <= 0:
+                break
+            previas = _leer_cola(st.ruta(num), min(faltan, lineas))
+            resultado = previas + resultado
+            faltan -= len(previas)
+        return resultado
+
+    # --- Retención en segundo plano ---
+
+    def _asegurar_hilo(self):
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._hilo_compactacion, daemon=True)
+                    self._hilo.start()
+
+    def _hilo_compactacion(self):
+        import time
+        while True:
+            time.sleep(INTERVALO_COMPACTACION)
+            try:
+                self.compactar()
+            except Exception as e:
+                print(f"[HIST] Error en compactación: {e}", file=sys.stderr)
+
+    def compactar(self):
+        """Borra segmentos sellados más allá de la retención."""
+        with self._lock:
+            pendientes = [st for st in self._chats.values() if st.compactar]
+        for st in pendientes:
+            borrar = []
+            with self._lock:
+                st.compactar = False
+                while st.sellados and st.total() - st.sellados[0][1] >= RETENCION_LINEAS:
+                    borrar.append(st.sellados.pop(0)[0])
+                if borrar:
+                    self._guardar_indice(st)
+            for num in borrar:
+                try: os.unlink(st.ruta(num))
+                except OSError: pass
+
+
+class HistorialSQLite:
+    """
+    Misma API que HistorialChats sobre la tabla `historial` de gwc.db
+    (GWC_BACKEND=sqlite). Índice (chat_id, ts); ring en RAM por chat igual
+    que el backend de archivos; misma retención por chat.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self._chats = {}   # chat_id -> [ring, total, compactar]
+        self._lock = threading.RLock()
+        self._hilo = None
+
+    def _abrir(self, chat_id):
+        st = self._chats.get(chat_id)
+        if st is None:
+            total = self.base.total_historial(chat_id)
+            ring = collections.deque(self.base.ultimas_historial(chat_id, RING_MAX), maxlen=RING_MAX)
+            st = self._chats[chat_id] = [ring, total, total > RETENCION_LINEAS]
+        return st
+
+    def agregar(self, chat_id, linea):
+        linea = linea.replace('\n', ' ')
+        with self._lock:
+            st = self._abrir(chat_id)
+            self.base.agregar_historial(chat_id, linea)
+            st[0].append(linea)
+            st[1] += 1
+            if st[1] > RETENCION_LINEAS + SEGMENTO_MAX_LINEAS:
+                st[2] = True
+        self._asegurar_hilo()
+
+    def ultimas(self, chat_id, n):
+        with self._lock:
+            ring, total, _ = self._abrir(chat_id)
+            if n <= len(ring) or len(ring) >= total:
+                return list(ring)[-n:], total
+        return self.base.ultimas_historial(chat_id, n), total
+
+    def _asegurar_hilo(self):
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self._hilo_compactacion, daemon=True)
+                    self._hilo.start()
+
+    _hilo_compactacion = HistorialChats._hilo_compactacion
+
+    def compactar(self):
+        """Borra las líneas más viejas más allá de la retención."""
+        with self._lock:
+            pendientes = [(cid, st) for cid, st in self._chats.items() if st[2]]
+        for chat_id, st in pendientes:
+            borradas = self.base.recortar_historial(chat_id, RETENCION_LINEAS)
+            with self._lock:
+                st[1] -= borradas
+                st[2] = False
@@ -1,5 +1,10 @@
 import sys
 import os
+import zlib
+import base64
+import hashlib
+import threading
+import collections
 
 try:
     from PIL import Image
@@ -7,10 +12,404 @@ try:
 except ImportError:
     PIL_AVAILABLE = False
 
-def render_ascii(image_path, width=60):
+# NumPy es opcional: acelera cuantizado y armado de la salida.
+# Sin NumPy se usa Pillow puro (tobytes + bucle por celda), misma salida.
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Modos de color de la salida
+MODO_TRUECOLOR = "truecolor"   # 24 bits: ESC[38;2;r;g;bm
+MODO_256 = "256"               # Cubo 6x6x6 + rampa de grises: ESC[38;5;nm
+MODO_16 = "16"                 # Paleta ANSI básica: ESC[3Xm / ESC[9Xm
+MODOS = (MODO_TRUECOLOR, MODO_256, MODO_16)
+
+# Caché de imágenes ya renderizadas: clave (ruta, mtime, tamaño, ancho, modo)
+CACHE_MEMORIA_MAX = 8 * 1024 * 1024              # Caracteres totales en RAM (LRU)
+CACHE_DISCO_DIR = os.path.expanduser("~/.ghostwhisperchat/cache_imagenes")
+CACHE_DISCO_MAX = 64 * 1024 * 1024               # Bytes totales en disco (se borran los más viejos)
+
+# Protocolo gráfico de kitty (APC ESC_G...ESC\\), sin lanzar `kitty +kitten icat`
+KITTY_CHUNK = 4096                               # Bytes base64 por escape (máximo del protocolo)
+KITTY_MAX_PX = 1280                              # Lado mayor enviado al terminal (raw RGB)
+KITTY_PNG_DIRECTO = 4 * 1024 * 1024              # PNG hasta este tamaño se mandan tal cual (f=100)
+
+MEDIO_BLOQUE = "▀"             # Frente = pixel superior, fondo = pixel inferior
+FIN_FILA = "\033[0m\n"
+
+# Dithering ordenado (Bayer 4x4), umbrales en [-0.5, 0.5)
+BAYER_4 = [[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]
+UMBRALES = [(v + 0.5) / 16 - 0.5 for fila in BAYER_4 for v in fila]   # Índice (y & 3) * 4 + (x & 3)
+
+CORTES_CUBO = (48, 115, 155, 195, 235)       # Cortes entre niveles del cubo xterm (0,95,135,175,215,255)
+AMPLITUD_256 = 40                            # Separación típica entre niveles del cubo
+AMPLITUD_GRIS = 10                           # Separación de la rampa 232..255
+UMBRAL_GRIS = 16                             # max-min de canales bajo el cual se usa la rampa
+AMPLITUD_16 = 64
+
+PALETA_16 = (
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+    (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+    (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+)
+
+# Desplazamientos enteros por posición de Bayer: ambas rutas dan la misma salida
+DESP_256 = [round(u * AMPLITUD_256) for u in UMBRALES]
+DESP_GRIS = [round(u * AMPLITUD_GRIS * 3) for u in UMBRALES]   # Sobre r+g+b
+DESP_16 = [round(u * AMPLITUD_16) for u in UMBRALES]
+
+# Nivel del cubo (0..5) por posición de Bayer y valor de canal
+NIVEL_256 = [[sum(1 for c in CORTES_CUBO if v + d >= c) for v in range(256)] for d in DESP_256]
+
+
+def _paleta_16_cercana():
+    """Color de la paleta 16 más cercano para cada rgb reducido a 5 bits por canal (32K entradas)."""
+    if NUMPY_AVAILABLE:
+        i = np.arange(32 * 32 * 32)
+        rgb = np.stack((((i >> 10) << 3) + 4, (((i >> 5) & 31) << 3) + 4, ((i & 31) << 3) + 4), axis=1)
+        dist = ((rgb[:, None, :] - np.array(PALETA_16)) ** 2).sum(axis=2)
+        return dist.argmin(axis=1).tolist()
+    tabla = []
+    for i in range(32 * 32 * 32):
+        r, g, b = ((i >> 10) << 3) + 4, (((i >> 5) & 31) << 3) + 4, ((i & 31) << 3) + 4
+        tabla.append(min(range(16), key=lambda k: (r - PALETA_16[k][0]) ** 2 +
+                         (g - PALETA_16[k][1]) ** 2 + (b - PALETA_16[k][2]) ** 2))
+    return tabla
+
+
+_CERCANA_16 = None   # Se arma al primer uso del modo 16
+
+# Secuencias preformateadas de los modos con paleta
+ESC_256 = ([f"\033[38;5;{i}m" for i in range(256)], [f"\033[48;5;{i}m" for i in range(256)])
+ESC_16 = ([f"\033[{30 + i if i < 8 else 82 + i}m" for i in range(16)],
+          [f"\033[{40 + i if i < 8 else 92 + i}m" for i in range(16)])
+
+
+def detectar_modo_color():
+    """
+    Modo según la capacidad del terminal:
+    GWC_COLORES (forzado) > COLORTERM=truecolor/24bit > TERM=*256color* > 16 colores.
+    """
+    forzado = os.environ.get("GWC_COLORES", "").strip().lower()
+    if forzado in MODOS:
+        return forzado
+    if os.environ.get("COLORTERM", "").lower() in ("truecolor", "24bit"):
+        return MODO_TRUECOLOR
+    term = os.environ.get("TERM", "")
+    if "kitty" in term or "direct" in term:
+        return MODO_TRUECOLOR
+    if "256" in term:
+        return MODO_256
+    return MODO_16
+
+
+if NUMPY_AVAILABLE:
+    _NUMEROS = np.array([str(i) for i in range(256)], dtype=object)
+
+
+def _escape_truecolor(clave, fondo):
+    return f"\033[{48 if fondo else 38};2;{clave >> 16};{(clave >> 8) & 255};{clave & 255}m"
+
+
+# --- Ruta NumPy ---
+
+def _cuantizar_numpy(pix, modo):
+    """(alto, ancho, 3) uint8 -> (alto, ancho) claves de color (rgb empaquetado o índice de paleta)."""
+    if modo == MODO_TRUECOLOR:
+        p = pix.astype(np.uint32)
+        return (p[..., 0] << 16) | (p[..., 1] << 8) | p[..., 2]
+
+    alto, ancho = pix.shape[:2]
+    fila = (np.arange(alto) & 3)[:, None] * 4
+    pos = fila + (np.arange(ancho) & 3)[None, :]   # Posición de Bayer de cada pixel
+    p = pix.astype(np.int32)
+
+    if modo == MODO_256:
+        q = np.asarray(NIVEL_256, dtype=np.int32)[pos[..., None], p]
+        cubo = 16 + 36 * q[..., 0] + 6 * q[..., 1] + q[..., 2]
+        suma = p.sum(axis=2) + np.asarray(DESP_GRIS, dtype=np.int32)[pos]
+        gris = 232 + np.clip((suma - 24 + 15) // 30, 0, 23)
+        grisaceo = (p.max(axis=2) - p.min(axis=2)) < UMBRAL_GRIS
+        return np.where(grisaceo, gris, cubo)
+
+    # 16 colores: paleta más cercana tras el desplazamiento de Bayer (tabla de 5 bits por canal)
+    global _CERCANA_16
+    if _CERCANA_16 is None:
+        _CERCANA_16 = _paleta_16_cercana()
+    q = np.clip(p + np.asarray(DESP_16, dtype=np.int32)[pos][..., None], 0, 255) >> 3
+    return np.asarray(_CERCANA_16, dtype=np.int32)[(q[..., 0] << 10) | (q[..., 1] << 5) | q[..., 2]]
+
+
+def _escapes_numpy(claves, cambia, modo, fondo):
+    """Array object con la secuencia de color solo donde el color cambia ("" en el resto)."""
+    out = np.full(claves.shape, "", dtype=object)
+    if modo == MODO_TRUECOLOR:
+        c = claves[cambia]
+        prefijo = "\033[48;2;" if fondo else "\033[38;2;"
+        out[cambia] = prefijo + _NUMEROS[c >> 16] + ";" + _NUMEROS[(c >> 8) & 255] + ";" + _NUMEROS[c & 255] + "m"
+    else:
+        tabla = np.array((ESC_256 if modo == MODO_256 else ESC_16)[1 if fondo else 0], dtype=object)
+        out[cambia] = tabla[claves[cambia]]
+    return out
+
+
+def _salida_numpy(img, width, height, modo=MODO_TRUECOLOR):
+    filas = height // 2
+    claves = _cuantizar_numpy(np.asarray(img, dtype=np.uint8), modo).reshape(filas, 2, width)
+    arriba, abajo = claves[:, 0], claves[:, 1]
+
+    # Run-length: la secuencia se emite solo si el color difiere de la celda anterior.
+    # Cada fila termina con reset, así que la primera celda de la fila siempre la emite.
+    cambia_fg = np.ones((filas, width), dtype=bool)
+    cambia_bg = np.ones((filas, width), dtype=bool)
+    cambia_fg[:, 1:] = arriba[:, 1:] != arriba[:, :-1]
+    cambia_bg[:, 1:] = abajo[:, 1:] != abajo[:, :-1]
+
+    out = np.empty((filas, width, 3), dtype=object)
+    out[:, :, 0] = _escapes_numpy(arriba, cambia_fg, modo, False)
+    out[:, :, 1] = _escapes_numpy(abajo, cambia_bg, modo, True)
+    out[:, :, 2] = MEDIO_BLOQUE
+    return "".join(["".join(fila) + FIN_FILA for fila in out.reshape(filas, width * 3).tolist()])
+
+
+# --- Ruta Pillow pura ---
+
+def _clave_py(r, g, b, pos, modo):
+    if modo == MODO_256:
+        if max(r, g, b) - min(r, g, b) < UMBRAL_GRIS:
+            return 232 + min(23, max(0, (r + g + b + DESP_GRIS[pos] - 24 + 15) // 30))
+        nivel = NIVEL_256[pos]
+        return 16 + 36 * nivel[r] + 6 * nivel[g] + nivel[b]
+    d = DESP_16[pos]
+    r, g, b = (min(255, max(0, v + d)) >> 3 for v in (r, g, b))
+    return _CERCANA_16[(r << 10) | (g << 5) | b]
+
+
+def _salida_pillow(img, width, height, modo=MODO_TRUECOLOR):
+    global _CERCANA_16
+    data = img.tobytes()
+    paso = width * 3
+    if modo == MODO_TRUECOLOR:
+        escape = _escape_truecolor
+    else:
+        tablas = ESC_256 if modo == MODO_256 else ESC_16
+        escape = lambda clave, fondo: tablas[1 if fondo else 0][clave]
+        if modo == MODO_16 and _CERCANA_16 is None:
+            _CERCANA_16 = _paleta_16_cercana()
+
+    def clave(y, x):
+        i = y * paso + 3 * x
+        r, g, b = data[i], data[i + 1], data[i + 2]
+        if modo == MODO_TRUECOLOR:
+            return (r << 16) | (g << 8) | b
+        return _clave_py(r, g, b, (y & 3) * 4 + (x & 3), modo)
+
+    partes = []
+    for y in range(0, height, 2):
+        fg_prev = bg_prev = None
+        for x in range(width):
+            fg, bg = clave(y, x), clave(y + 1, x)
+            if fg != fg_prev:
+                partes.append(escape(fg, False))
+                fg_prev = fg
+            if bg != bg_prev:
+                partes.append(escape(bg, True))
+                bg_prev = bg
+            partes.append(MEDIO_BLOQUE)
+        partes.append(FIN_FILA)
+    return "".join(partes)
+
+
+class CacheRender:
+    """LRU en memoria (acotado por tamaño total) + copia en disco que sobrevive reinicios."""
+
+    def __init__(self, max_memoria=CACHE_MEMORIA_MAX, directorio=CACHE_DISCO_DIR, max_disco=CACHE_DISCO_MAX):
+        self.max_memoria = max_memoria
+        self.directorio = directorio
+        self.max_disco = max_disco
+        self._lru = collections.OrderedDict()   # clave -> str
+        self._tam = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "hits_disco": 0, "misses": 0}
+
+    @staticmethod
+    def clave(image_path, width, modo):
+        """None si el archivo no existe (no se cachea)."""
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            return None
+        return (os.path.realpath(image_path), st.st_mtime_ns, st.st_size, width, modo)
+
+    def _archivo(self, clave):
+        return os.path.join(self.directorio, hashlib.sha1(repr(clave).encode()).hexdigest() + ".ansi")
+
+    def obtener(self, clave):
+        with self._lock:
+            res = self._lru.get(clave)
+            if res is not None:
+                self._lru.move_to_end(clave)
+                self.stats["hits"] += 1
+                return res
+        try:
+            with open(self._archivo(clave), 'r', encoding='utf-8') as f:
+                res = f.read()
+        except OSError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits_disco"] += 1
+        self._guardar_memoria(clave, res)
+        return res
+
+    def guardar(self, clave, res):
+        self._guardar_memoria(clave, res)
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            ruta = self._archivo(clave)
+            tmp = ruta + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(res)
+            os.replace(tmp, ruta)
+            self._podar_disco()
+        except OSError as e:
+            print(f"[IMAGEN] No se pudo guardar en caché: {e}", file=sys.stderr)
+
+    def _guardar_memoria(self, clave, res):
+        if len(res) > self.max_memoria:
+            return
+        with self._lock:
+            previo = self._lru.pop(clave, None)
+            if previo is not None:
+                self._tam -= len(previo)
+            self._lru[clave] = res
+            self._tam += len(res)
+            while self._tam > self.max_memoria:
+                _, viejo = self._lru.popitem(last=False)
+                self._tam -= len(viejo)
+
+    def _podar_disco(self):
+        archivos = []
+        with os.scandir(self.directorio) as it:
+            for e in it:
+                if e.name.endswith(".ansi"):
+                    st = e.stat()
+                    archivos.append((st.st_mtime, st.st_size, e.path))
+        total = sum(a[1] for a in archivos)
+        for _, tam, ruta in sorted(archivos):
+            if total <= self.max_disco:
+                break
+            try: os.unlink(ruta)
+            except OSError: pass
+            total -= tam
+
+
+cache_render = CacheRender()
+
+
+def _abrir_reducida(image_path, width):
+    """
+    Abre la imagen decodificando ya reducida: JPEG con draft() (escala DCT 1/2..1/8),
+    el resto con reduce() entero. Se deja >= 2x el tamaño final para que LANCZOS
+    conserve calidad. Retorna (img, alto_final).
+    """
+    img = Image.open(image_path)
+    aspect_ratio = img.height / img.width
+    new_height = int(width * aspect_ratio)
+    if new_height % 2 != 0: new_height += 1
+
+    objetivo = (width * 2, max(2, new_height * 2))
+    if img.format == "JPEG":
+        img.draft('RGB', objetivo)
+    factor = min(img.width // objetivo[0], img.height // objetivo[1])
+    if factor >= 2 and hasattr(img, 'reduce'):
+        img = img.reduce(factor)
+    return img, new_height
+
+
+# --- Protocolo gráfico de kitty ---
+
+_kitty_transmitidas = set()   # IDs ya cargados en el terminal de este proceso
+
+
+def soporta_kitty():
+    """
+    Terminal con protocolo gráfico de kitty: GWC_GRAFICOS=kitty|no (forzado),
+    si no, kitty / WezTerm / Ghostty por sus variables de entorno.
+    """
+    forzado = os.environ.get("GWC_GRAFICOS", "").strip().lower()
+    if forzado:
+        return forzado == "kitty"
+    if os.environ.get("KITTY_WINDOW_ID") or os.environ.get("TERM", "") == "xterm-kitty":
+        return True
+    return os.environ.get("TERM_PROGRAM", "") in ("WezTerm", "ghostty")
+
+
+def _kitty_apc(control, datos):
+    """Escapes APC con el payload en base64 troceado (m=1 en todos menos el último)."""
+    b64 = base64.standard_b64encode(datos)
+    partes = []
+    for i in range(0, max(1, len(b64)), KITTY_CHUNK):
+        trozo = b64[i:i + KITTY_CHUNK].decode('ascii')
+        mas = 1 if i + KITTY_CHUNK < len(b64) else 0
+        cabecera = f"{control},m={mas}" if i == 0 else f"m={mas}"
+        partes.append(f"\033_G{cabecera};{trozo}\033\\")
+    return "".join(partes)
+
+
+def _kitty_transmitir(image_path, kid):
+    """a=t (solo cargar): PNG chico tal cual, el resto como RGB crudo reducido + zlib."""
+    if image_path.lower().endswith(".png") and os.path.getsize(image_path) <= KITTY_PNG_DIRECTO:
+        with open(image_path, 'rb') as f:
+            return _kitty_apc(f"a=t,f=100,i={kid},q=2", f.read())
+
+    img = Image.open(image_path)
+    escala = KITTY_MAX_PX / max(img.width, img.height)
+    if escala < 1:
+        destino = (max(1, int(img.width * escala)), max(1, int(img.height * escala)))
+        if img.format == "JPEG":
+            img.draft('RGB', destino)
+        img = img.convert('RGB').resize(destino)
+    else:
+        img = img.convert('RGB')
+    datos = zlib.compress(img.tobytes(), 1)
+    return _kitty_apc(f"a=t,f=24,o=z,s={img.width},v={img.height},i={kid},q=2", datos)
+
+
+def render_kitty(image_path, columnas=60):
+    """
+    Secuencias para mostrar la imagen en el terminal (protocolo gráfico de kitty).
+    La imagen se transmite una sola vez por ID (derivado de ruta + mtime + tamaño);
+    las siguientes veces solo se coloca (a=p). Retorna "ERROR: ..." si falla.
+    """
+    if not PIL_AVAILABLE:
+        return "ERROR: Libreria 'Pillow' no instalada. Instale con: sudo apt install python3-pil"
+    clave = CacheRender.clave(image_path, 0, "kitty")
+    if clave is None:
+        return f"ERROR: Archivo no encontrado: {image_path}"
+
+    kid = int.from_bytes(hashlib.sha1(repr(clave).encode()).digest()[:4], 'big') & 0x7FFFFFFF or 1
+    res = ""
+    if kid not in _kitty_transmitidas:
+        try:
+            res = _kitty_transmitir(image_path, kid)
+        except Exception as e:
+            return f"ERROR: No se pudo abrir la imagen. {str(e)}"
+        _kitty_transmitidas.add(kid)
+    # Colocación: ancho en celdas (el alto sale de la proporción), cursor queda debajo
+    return res + f"\033_Ga=p,i={kid},c={max(1, int(columnas))},q=2\033\\"
+
+
+def render_ascii(image_path, width=60, modo=None, usar_cache=True):
     """
     Convierte una imagen a ASCII Art (Half-Block ANSI).
     Rango width: 10 - 190. Clamp automatico.
+    modo: truecolor / 256 / 16 (None = según el terminal, ver detectar_modo_color).
+    usar_cache: reutiliza el render previo de la misma imagen (memoria + disco).
     Retorna string multilinea (con \n).
     """
     if not PIL_AVAILABLE:
@@ -24,19 +423,24 @@ def render_ascii(image_path, width=60):
         width = int(width)
     except ValueError:
         width = 60
-        
+
     width = max(10, min(width, 190)) # HD Widescreen Limit
+    if modo not in MODOS:
+        modo = detectar_modo_color()
+
+    # La misma foto (preview del emisor, __NATIVE_IMG__ del receptor...) no se re-renderiza
+    clave = cache_render.clave(image_path, width, modo) if usar_cache else None
+    if clave:
+        res = cache_render.obtener(clave)
+        if res is not None:
+            return res
 
     try:
-        img = Image.open(image_path)
+        # Algoritmo V1 (Half-Block)
+        img, new_height = _abrir_reducida(image_path, width)
     except Exception as e:
         return f"ERROR: No se pudo abrir la imagen. {str(e)}"
 
-    # Algoritmo V1 (Half-Block)
-    aspect_ratio = img.height / img.width
-    new_height = int(width * aspect_ratio) 
-    if new_height % 2 != 0: new_height += 1
-    
     # Compatibilidad Pillow < 9
     if hasattr(Image, 'Resampling'):
         resample_filter = Image.Resampling.LANCZOS
@@ -44,19 +448,15 @@ def render_ascii(image_path, width=60):
         resample_filter = Image.LANCZOS
     else:
         resample_filter = Image.ANTIALIAS
-    
+
     img = img.resize((width, new_height), resample_filter)
     img = img.convert('RGB')
-    pixels = img.load()
-    
-    res = ""
-    for y in range(0, new_height, 2):
-        for x in range(width):
-            r1, g1, b1 = pixels[x, y]
-            if y+1 < new_height: r2, g2, b2 = pixels[x, y+1]
-            else: r2, g2, b2 = 0,0,0
-            
-            res += f"\033[38;2;{r1};{g1};{b1}m\033[48;2;{r2};{g2};{b2}m▀"
-        res += "\033[0m\n"
-        
+
+    # Secuencias de color solo cuando cambian (run-length) + un solo join (O(n))
+    if NUMPY_AVAILABLE:
+        res = _salida_numpy(img, width, new_height, modo)
+    else:
+        res = _salida_pillow(img, width, new_height, modo)
+    if clave:
+        cache_render.guardar(clave, res)
     return res
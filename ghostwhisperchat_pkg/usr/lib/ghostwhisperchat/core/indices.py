@@ -0,0 +1,300 @@
+# /usr/lib/ghostwhisperchat/core/indices.py
+# Tablas en RAM con índices secundarios (peers, agenda, grupos)
+#
+# TablaIndexada es un dict (uid -> datos) que además mantiene índices
+# clave -> {uids} actualizados en cada escritura. Así buscar por nick, prefijo
+# de nick, onion, IP o nombre de grupo no recorre la tabla ni normaliza cada
+# entrada por consulta: normalize_text se calcula una vez, al escribir.
+#
+# Las lecturas siguen siendo las de un dict (get, items, in...). Las escrituras
+# deben pasar por la tabla (t[uid] = ..., actualizar, pop, clear). Quien
+# modifique el dict interno de una entrada en un campo indexado debe llamar a
+# reindexar(uid).
+#
+# Búsqueda difusa: el índice "trigrama" guarda los trigramas del nick
+# normalizado y similares() saca de ahí los candidatos (trigramas en común,
+# empezando por los más raros) antes de puntuar con difflib solo a unos pocos.
+
+import heapq
+import difflib
+import itertools
+import threading
+import collections
+
+from ghostwhisperchat.core.utilidades import normalize_text
+
+
+def nick_normalizado(d):
+    return normalize_text(d.get('nick', '')) if isinstance(d, dict) else ""
+
+
+def clave_nick(d):
+    n = nick_normalizado(d)
+    return (n,) if n else ()
+
+
+def prefijos_nick(d):
+    n = nick_normalizado(d)
+    return tuple(n[:i] for i in range(1, len(n) + 1))
+
+
+def trigramas(texto):
+    """Trigramas con relleno al estilo pg_trgm: '  ab ' -> {'  a', ' ab', 'ab '}."""
+    if not texto:
+        return frozenset()
+    t = f"  {texto} "
+    return frozenset(t[i:i + 3] for i in range(len(t) - 2))
+
+
+def trigramas_nick(d):
+    return trigramas(nick_normalizado(d))
+
+
+def clave_onion(d):
+    onion = d.get('onion') if isinstance(d, dict) else None
+    return (onion.lower(),) if isinstance(onion, str) and onion else ()
+
+
+def clave_ip(d):
+    if not isinstance(d, dict):
+        return ()
+    return tuple({ip for ip in (d.get('ip'), d.get('last_ip')) if isinstance(ip, str) and ip})
+
+
+def clave_nombre(d):
+    nombre = d.get('nombre') if isinstance(d, dict) else None
+    return (nombre,) if isinstance(nombre, str) and nombre else ()
+
+
+DICE_MINIMO = 0.25              # Parecido mínimo en trigramas para pasar a difflib
+FACTOR_CANDIDATOS = 2           # Candidatos puntuados con difflib por resultado pedido
+PRESUPUESTO_CANDIDATOS = 1000   # uids sumados de las listas de trigramas por consulta
+
+
+class TablaIndexada(dict):
+    def __init__(self, indices, datos=None):
+        super().__init__()
+        self._extractores = dict(indices)              # nombre -> fn(datos) -> claves
+        self._idx = {nombre: {} for nombre in indices}  # nombre -> clave -> {uid}
+        self._claves = {}                               # uid -> {nombre: claves}
+        self._lock = threading.RLock()
+        if datos:
+            self.update(datos)
+
+    # --- Mantenimiento de índices (llamar con _lock) ---
+
+    def _indexar(self, uid, valor):
+        previas = self._claves.get(uid, {})
+        nuevas = {nombre: fn(valor) for nombre, fn in self._extractores.items()}
+        for nombre, claves in nuevas.items():
+            viejas = previas.get(nombre, ())
+            if viejas == claves:
+                continue
+            idx = self._idx[nombre]
+            for k in viejas:
+                uids = idx.get(k)
+                if uids is not None:
+                    uids.discard(uid)
+                    if not uids:
+                        del idx[k]
+            for k in claves:
+                idx.setdefault(k, set()).add(uid)
+        self._claves[uid] = nuevas
+
+    def _desindexar(self, uid):
+        for nombre, claves in self._claves.pop(uid, {}).items():
+            idx = self._idx[nombre]
+            for k in claves:
+                uids = idx.get(k)
+                if uids is not None:
+                    uids.discard(uid)
+                    if not uids:
+                        del idx[k]
+
+    # --- Escritura ---
+
+    def __setitem__(self, uid, valor):
+        with self._lock:
+            super().__setitem__(uid, valor)
+            self._indexar(uid, valor)
+
+    def __delitem__(self, uid):
+        with self._lock:
+            super().__delitem__(uid)
+            self._desindexar(uid)
+
+    def pop(self, uid, *defecto):
+        with self._lock:
+            if uid in self:
+                self._desindexar(uid)
+            return super().pop(uid, *defecto)
+
+    def popitem(self):
+        with self._lock:
+            uid, valor = super().popitem()
+            self._desindexar(uid)
+            return uid, valor
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._claves.clear()
+            for idx in self._idx.values():
+                idx.clear()
+
+    def update(self, *args, **kwargs):
+        with self._lock:
+            for uid, valor in dict(*args, **kwargs).items():
+                self[uid] = valor
+
+    def setdefault(self, uid, defecto=None):
+        with self._lock:
+            if uid not in self:
+                self[uid] = defecto
+            return super().__getitem__(uid)
+
+    def actualizar(self, uid, campos):
+        """Mezcla `campos` en la entrada (la crea si no existe) y reindexa. Retorna la entrada."""
+        with self._lock:
+            entrada = self.get(uid)
+            if entrada is None:
+                entrada = {}
+                super().__setitem__(uid, entrada)
+            entrada.update(campos)
+            self._indexar(uid, entrada)
+            return entrada
+
+    def reindexar(self, uid):
+        with self._lock:
+            if uid in self:
+                self._indexar(uid, self[uid])
+
+    # --- Consultas ---
+
+    def uids(self, indice, clave):
+        with self._lock:
+            return set(self._idx[indice].get(clave, ()))
+
+    def buscar(self, indice, clave):
+        """Entradas cuya clave en `indice` es `clave`, más recientes (last_seen) primero."""
+        with self._lock:
+            res = [self[uid] for uid in self._idx[indice].get(clave, ()) if uid in self]
+        res.sort(key=lambda d: d.get('last_seen', 0) if isinstance(d, dict) else 0, reverse=True)
+        return res
+
+    def primero(self, indice, clave):
+        res = self.buscar(indice, clave)
+        return res[0] if res else None
+
+    def similares(self, consulta, minimo=0.55, limite=10, indice="trigrama", indice_texto="nick",
+                  contiene=True, cupo=None):
+        """
+        Entradas parecidas a `consulta` (ya normalizada), mejores primero: [(ratio, uid)].
+        ratio = 1.0 si es igual, 0.9 si la contiene, si no difflib.SequenceMatcher (>= minimo).
+        contiene=False: siempre el ratio de difflib (mismo puntaje y desempate que
+        difflib.get_close_matches, para listas cortas como los alias de comandos).
+        cupo: candidatos que pasan a puntuarse (por defecto limite * FACTOR_CANDIDATOS);
+        si cubre toda la tabla se puntúan todas las entradas (resultado exacto).
+        El texto de cada entrada es su clave (única) en `indice_texto`.
+        """
+        q = trigramas(consulta)
+        if not q:
+            return []
+        cupo = cupo or int(limite * FACTOR_CANDIDATOS)
+        with self._lock:
+            if cupo >= len(self):
+                # La tabla entera cabe en el cupo: se puntúan todas las entradas
+                # (sin descartar por trigramas, igual que get_close_matches)
+                textos = [(uid, (self._claves[uid][indice_texto] or ("",))[0]) for uid in self]
+                contienen = {uid for uid, texto in textos if consulta in texto}
+                return self._mejores(consulta, textos, contienen, minimo, limite, contiene)
+            idx = self._idx[indice]
+            # Contienen la consulta: están en las listas de todos sus trigramas internos
+            # (con menos de 3 caracteres se usa el índice de prefijos, si lo hay)
+            internos = sorted((idx.get(consulta[i:i + 3], set()) for i in range(len(consulta) - 2)), key=len)
+            if internos:
+                contienen = set.intersection(*internos)
+            else:
+                contienen = self._idx.get("prefijo", {}).get(consulta, set())
+            # (acotado a `cupo`, pero las coincidencias exactas entran siempre)
+            contienen = set(itertools.islice(contienen, cupo))
+            contienen.update(self._idx.get(indice_texto, {}).get(consulta, ()))
+            # Trigramas en común, recorriendo las listas de la más rara a la más común.
+            # Las listas comunes ('  a', ' ma'...) casi no discriminan: se dejan de
+            # sumar al pasar PRESUPUESTO_CANDIDATOS (siempre se cuenta al menos una).
+            conteo = collections.Counter()
+            acumulado = 0
+            for lista in sorted((idx.get(t, ()) for t in q), key=len):
+                if acumulado and acumulado + len(lista) > PRESUPUESTO_CANDIDATOS:
+                    break
+                conteo.update(lista)
+                acumulado += len(lista)
+            parecidos = []
+            for uid, _ in conteo.most_common(cupo * 2):
+                if uid in contienen:
+                    continue
+                claves = self._claves[uid][indice]
+                dice = 2 * len(q & claves) / (len(q) + len(claves))
+                if dice >= DICE_MINIMO:
+                    parecidos.append((dice, uid))
+            elegidos = list(contienen) + [uid for _, uid in heapq.nlargest(cupo, parecidos)]
+            textos = [(uid, (self._claves[uid][indice_texto] or ("",))[0]) for uid in elegidos]
+        return self._mejores(consulta, textos, contienen, minimo, limite, contiene)
+
+    @staticmethod
+    def _mejores(consulta, textos, contienen, minimo, limite, contiene):
+        """Los `limite` mejores (ratio, uid) de `textos` [(uid, texto)], ver similares()."""
+        # Como get_close_matches: la consulta va en seq2 (se prepara una vez) y
+        # las cotas baratas (real_quick_ratio, quick_ratio >= ratio) descartan antes
+        # del ratio real
+        sm = difflib.SequenceMatcher()
+        sm.set_seq2(consulta)
+        mejores = []        # min-heap con los `limite` mejores (ratio, uid)
+        por_cota = []
+        for uid, texto in textos:
+            if texto == consulta:
+                mejores.append((1.0, uid))
+            elif contiene and uid in contienen:
+                mejores.append((0.9, uid))
+            else:
+                sm.set_seq1(texto)
+                if sm.real_quick_ratio() < minimo:
+                    continue
+                cota = sm.quick_ratio()
+                if cota >= minimo:
+                    por_cota.append((cota, uid, texto))
+        mejores = heapq.nlargest(limite, mejores)
+        heapq.heapify(mejores)
+        # Ramificar y acotar: de la cota más alta a la más baja, hasta que la cota ya
+        # no alcance al peor de los `limite` mejores (el ratio real nunca la supera)
+        por_cota.sort(reverse=True)
+        for cota, uid, texto in por_cota:
+            if len(mejores) >= limite and cota < mejores[0][0]:
+                break
+            sm.set_seq1(texto)
+            ratio = sm.ratio()
+            if ratio < minimo:
+                continue
+            if len(mejores) < limite:
+                heapq.heappush(mejores, (ratio, uid))
+            elif (ratio, uid) > mejores[0]:
+                heapq.heapreplace(mejores, (ratio, uid))
+        return heapq.nlargest(limite, mejores)
+
+
+INDICES_PEERS = {"nick": clave_nick, "prefijo": prefijos_nick, "trigrama": trigramas_nick,
+                 "onion": clave_onion, "ip": clave_ip}
+INDICES_CONTACTOS = INDICES_PEERS
+INDICES_GRUPOS = {"nombre": clave_nombre}
+
+
+def tabla_peers(datos=None):
+    return TablaIndexada(INDICES_PEERS, datos)
+
+
+def tabla_contactos(datos=None):
+    return TablaIndexada(INDICES_CONTACTOS, datos)
+
+
+def tabla_grupos(datos=None):
+    return TablaIndexada(INDICES_GRUPOS, datos)
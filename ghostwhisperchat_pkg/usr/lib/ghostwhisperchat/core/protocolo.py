@@ -4,6 +4,16 @@
 import json
 import time
 from ghostwhisperchat.core.estado import MemoriaGlobal
+# Framing de streams (v3: prefijo de largo / v2: newline). Ver core/tramas.py
+# El JSON sigue siendo "ver": 2 para que los peers antiguos lo acepten;
+# la versión de framing se anuncia aparte en origen["proto"].
+#
+# Sesión por conexión (proto >= PROTO_SESION, ver core/tramas.py): en una
+# conexión del pool el primer paquete va completo con "sid" (handshake) y el
+# receptor asocia sid -> origen para ese socket. Los siguientes van compactos:
+# {"ver", "tipo", "token", "sid", "payload", "meta"} sin origen ni destino.
+# Si el origen cambia, el emisor manda por esa sesión un PEER_UPDATE completo
+# con el mismo sid antes de seguir compactando.
 
 CMD_TYPES = [
     "SEARCH", "FOUND", "DISCOVER", "PING",     # UDP
@@ -11,6 +21,31 @@ CMD_TYPES = [
     "CHAT_REQ", "CHAT_ACK", "CHAT_NO", "FILE_OFFER", "FILE_ACCEPT", "FILE_REJECT" # TCP PRIVATE
 ]
 
+class Paquete(bytes):
+    """
+    JSON completo de empaquetar() (se usa como bytes en todos lados) que además
+    recuerda sus partes para armar la forma con sesión sin volver a parsear.
+    """
+
+    def con_sesion(self, sid):
+        """Paquete completo + "sid": abre (o re-asocia) la sesión en el receptor."""
+        return bytes(self[:-1]) + b', "sid": ' + json.dumps(sid).encode('utf-8') + b'}'
+
+    def compactar(self, sid):
+        """Forma compacta: el receptor repone origen (y destino) desde la sesión."""
+        compacto = {"ver": 2, "tipo": self.tipo, "token": self.token, "sid": sid,
+                    "payload": self.payload, "meta": self.meta}
+        if self.destino != self.origen:
+            compacto["destino"] = self.destino
+        return json.dumps(compacto).encode('utf-8')
+
+    def aviso_origen(self, sid):
+        """PEER_UPDATE completo por la sesión `sid`: el origen cambió desde el handshake."""
+        return json.dumps({"ver": 2, "tipo": "PEER_UPDATE", "token": "", "origen": self.origen,
+                           "destino": self.origen, "payload": {}, "meta": self.meta,
+                           "sid": sid}).encode('utf-8')
+
+
 def empaquetar(tipo, payload, destino, token=""):
     """
     Crea el paquete JSON estándar.
@@ -38,21 +73,37 @@ def empaquetar(tipo, payload, destino, token=""):
     # Serializar a bytes UTF-8
     try:
         data_json = json.dumps(paquete)
-        return data_json.encode('utf-8')
+        pkg = Paquete(data_json.encode('utf-8'))
+        pkg.tipo, pkg.token, pkg.payload, pkg.meta = tipo, token, payload, paquete["meta"]
+        pkg.origen, pkg.destino = paquete["origen"], destino
+        return pkg
     except TypeError as e:
         print(f"Error serializando JSON: {e}")
         return None
 
-def desempaquetar(data_bytes):
+def reenviable(data):
+    """
+    JSON completo de un paquete recibido (dict de desempaquetar) para reenviarlo
+    tal cual (relay gossip): conserva el origen del autor, aunque haya llegado
+    compacto, y quita la sesión del salto anterior ("sid", "compacto").
+    Retorna bytes simples: el pool no los compacta (su origen no es el nuestro).
+    """
+    return json.dumps({k: v for k, v in data.items() if k not in ("sid", "compacto")}).encode('utf-8')
+
+def desempaquetar(data_bytes, sesiones=None):
     """
     Parsea bytes a Dict y valida estructura básica.
+    sesiones: dict sid -> origen de la conexión por la que llegó (None = sin sesiones).
+    Un paquete completo con "sid" abre/actualiza la sesión; uno compacto recupera
+    de ahí su origen y queda marcado con data["compacto"] = True.
     Retorna (valid, content_dict_or_error_str)
     """
     if not data_bytes:
         return False, "Empty data"
 
     try:
-        decoded = data_bytes.decode('utf-8')
+        # Acepta bytes o memoryview (tramas sin copia desde LectorTramas)
+        decoded = str(data_bytes, 'utf-8')
         data = json.loads(decoded)
     except UnicodeDecodeError:
         return False, "UTF-8 Decode Error"
@@ -61,6 +112,18 @@ def desempaquetar(data_bytes):
     
     if not isinstance(data, dict):
         return False, "Not a dictionary"
+    
+    sid = data.get("sid")
+    if sid is not None and sesiones is not None:
+        if "origen" in data:
+            if isinstance(data["origen"], dict):
+                sesiones[sid] = data["origen"]
+        elif sid in sesiones:
+            data["origen"] = sesiones[sid]
+            data.setdefault("destino", data["origen"])
+            data["compacto"] = True
+        else:
+            return False, "Unknown session"
         
     # Validar campos base
     valid, err = validar_schema(data)
@@ -0,0 +1,305 @@
+# /usr/lib/ghostwhisperchat/core/reactor.py
+# Reactor de Eventos (selectors / epoll)
+#
+# Cada socket se registra UNA sola vez junto a su tipo y handler.
+# El bucle principal ya no reconstruye listas en cada vuelta: select()
+# devuelve solo los sockets listos y se despacha directo a su handler (O(listos)).
+# Otros hilos no tocan el estado del bucle directamente: encolan callbacks con
+# llamar_pronto() y el hilo del bucle los ejecuta tras despertar.
+#
+# Temporizadores: llamar_en(segundos, fn) agenda fn en un heap de vencimientos.
+# El select() duerme exactamente hasta el próximo vencimiento (o hasta que
+# llegue un evento), así que sin actividad el demonio no despierta de más.
+# Cancelar es O(1) (se marca y se descarta al llegar al tope del heap).
+#
+# Tareas bloqueantes (connect por SOCKS5, etc.): ejecutar_en_hilo(fn) las corre
+# en un pool de hilos y al_terminar(resultado, error) vuelve al hilo del bucle.
+# Ningún handler debe dormir ni esperar red en el hilo del bucle: el vigilante
+# de latencia registra cada handler/callback/temporizador que supera
+# PRESUPUESTO_HANDLER (con el tipo de paquete, si el handler lo anotó).
+
+import collections
+import queue
+import heapq
+import itertools
+import selectors
+import socket
+import sys
+import threading
+import time
+
+# Tipos de handler (solo informativos / debug)
+TIPO_UDP = "UDP"
+TIPO_LISTENER = "LISTENER"
+TIPO_PEER_TCP = "PEER_TCP"
+TIPO_UI = "UI"
+TIPO_IPC = "IPC"
+TIPO_INTERNO = "INTERNO"
+
+PRESUPUESTO_HANDLER = 0.05   # Segundos que un handler puede ocupar el bucle sin aviso
+HILOS_EJECUTOR = 16          # Tope de tareas bloqueantes simultáneas (ejecutar_en_hilo)
+
+
+class Temporizador:
+    """Handle de un llamar_en(): permite cancelarlo antes de que venza."""
+    __slots__ = ("cuando", "fn", "args", "cancelado")
+
+    def __init__(self, cuando, fn, args):
+        self.cuando = cuando
+        self.fn = fn
+        self.args = args
+        self.cancelado = False
+
+    def cancelar(self):
+        self.cancelado = True
+
+    def activo(self):
+        return not self.cancelado and self.fn is not None
+
+
+class Reactor:
+    def __init__(self):
+        # DefaultSelector = epoll en Linux (kqueue/poll en otros sistemas)
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.RLock()
+        self._hilo_loop = None
+        self._callbacks = collections.deque()   # (fn, args) a ejecutar en el hilo del bucle
+        self._timers = []                       # heap (cuando, seq, Temporizador)
+        self._seq = itertools.count()           # Desempate estable entre vencimientos iguales
+        self._tareas = queue.Queue()            # (fn, args, al_terminar) para el pool de hilos
+        self._trabajadores = []
+        self._ociosos = 0                       # Hilos del pool esperando tarea
+        self._anotaciones = []                  # Detalle del handler en curso (tipos de paquete)
+        self.presupuesto = PRESUPUESTO_HANDLER
+        self.lentos = collections.Counter()     # etiqueta -> veces que superó el presupuesto
+
+        # Par de sockets para despertar el select() desde otros hilos
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, (TIPO_INTERNO, self._drenar_wake))
+
+    def registrar(self, sock, tipo, handler):
+        """
+        Registra un socket para lectura con su handler: handler(sock).
+        Si ya estaba registrado solo se actualiza el handler (idempotente).
+        """
+        if sock is None:
+            return False
+        try:
+            if sock.fileno() < 0:
+                return False
+        except OSError:
+            return False
+
+        with self._lock:
+            try:
+                self._sel.register(sock, selectors.EVENT_READ, (tipo, handler))
+            except KeyError:
+                # Ya registrado: actualizar datos
+                self._sel.modify(sock, selectors.EVENT_READ, (tipo, handler))
+            except (ValueError, OSError) as e:
+                print(f"[REACTOR] No se pudo registrar socket {tipo}: {e}", file=sys.stderr)
+                return False
+
+        # Con poll/select (no epoll) el hilo del loop no ve el nuevo fd hasta despertar
+        if self._hilo_loop is not None and threading.get_ident() != self._hilo_loop:
+            self.despertar()
+        return True
+
+    def quitar(self, sock):
+        """Des-registra un socket. Seguro de llamar varias veces o con socket ya cerrado."""
+        if sock is None:
+            return
+        with self._lock:
+            try:
+                self._sel.unregister(sock)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def esta_registrado(self, sock):
+        try:
+            self._sel.get_key(sock)
+            return True
+        except (KeyError, ValueError):
+            return False
+
+    def tipo_de(self, sock):
+        try:
+            return self._sel.get_key(sock).data[0]
+        except (KeyError, ValueError):
+            return None
+
+    def total_registrados(self):
+        # Excluye el socket interno de wake-up
+        return max(0, len(self._sel.get_map()) - 1)
+
+    def despertar(self):
+        """Interrumpe un select() en curso (llamable desde cualquier hilo)."""
+        try:
+            self._wake_w.send(b"\x00")
+        except (BlockingIOError, OSError):
+            pass  # Buffer lleno = ya hay un despertar pendiente
+
+    def llamar_pronto(self, fn, *args):
+        """Ejecuta fn(*args) en el hilo del bucle en la próxima vuelta (llamable desde cualquier hilo)."""
+        self._callbacks.append((fn, args))
+        if threading.get_ident() != self._hilo_loop:
+            self.despertar()
+
+    def llamar_en(self, segundos, fn, *args):
+        """
+        Ejecuta fn(*args) en el hilo del bucle dentro de `segundos` (llamable desde cualquier hilo).
+        Retorna un Temporizador (cancelar() para anularlo).
+        """
+        t = Temporizador(time.monotonic() + max(0.0, segundos), fn, args)
+        with self._lock:
+            # Si pasa a ser el primero, el select() en curso debe acortar su espera
+            adelanta = not self._timers or t.cuando < self._timers[0][0]
+            heapq.heappush(self._timers, (t.cuando, next(self._seq), t))
+        if adelanta and self._hilo_loop is not None and threading.get_ident() != self._hilo_loop:
+            self.despertar()
+        return t
+
+    def ejecutar_en_hilo(self, fn, *args, al_terminar=None):
+        """
+        Corre fn(*args) fuera del bucle (pool de hilos). Si se pasa al_terminar, se
+        llama en el hilo del bucle como al_terminar(resultado, error) (error = None si fue bien).
+        """
+        with self._lock:
+            if not self._ociosos and len(self._trabajadores) < HILOS_EJECUTOR:
+                h = threading.Thread(target=self._trabajador, daemon=True,
+                                     name=f"gwc-exec-{len(self._trabajadores)}")
+                self._trabajadores.append(h)
+                h.start()
+        self._tareas.put((fn, args, al_terminar))
+
+    def _trabajador(self):
+        while True:
+            with self._lock:
+                self._ociosos += 1
+            tarea = self._tareas.get()
+            with self._lock:
+                self._ociosos -= 1
+            if tarea is None:
+                return
+            fn, args, al_terminar = tarea
+            resultado = error = None
+            try:
+                resultado = fn(*args)
+            except Exception as e:
+                error = e
+                if al_terminar is None:
+                    print(f"[REACTOR] Error en tarea {getattr(fn, '__name__', fn)}: {e}", file=sys.stderr)
+            if al_terminar is not None:
+                self.llamar_pronto(al_terminar, resultado, error)
+
+    def anotar(self, detalle):
+        """Detalle (p. ej. tipo de paquete) del handler en curso, para el vigilante de latencia."""
+        if threading.get_ident() == self._hilo_loop:
+            self._anotaciones.append(str(detalle))
+
+    def _vigilar(self, etiqueta, t0):
+        """Avisa si lo ejecutado desde t0 ocupó el bucle más que el presupuesto."""
+        dt = time.monotonic() - t0
+        if dt > self.presupuesto:
+            if self._anotaciones:
+                etiqueta = f"{etiqueta} ({', '.join(self._anotaciones)})"
+            self.lentos[etiqueta] += 1
+            print(f"[LATENCIA] {etiqueta} bloqueó el bucle {dt * 1000:.0f} ms "
+                  f"(presupuesto {self.presupuesto * 1000:.0f} ms)", file=sys.stderr)
+        self._anotaciones.clear()
+
+    def total_temporizadores(self):
+        with self._lock:
+            return sum(1 for _, _, t in self._timers if not t.cancelado)
+
+    def _proximo_vencimiento(self):
+        """Segundos hasta el próximo temporizador vivo (None si no hay). Descarta cancelados del tope."""
+        with self._lock:
+            while self._timers and self._timers[0][2].cancelado:
+                heapq.heappop(self._timers)
+            if not self._timers:
+                return None
+            return max(0.0, self._timers[0][0] - time.monotonic())
+
+    def _ejecutar_vencidos(self):
+        ahora = time.monotonic()
+        vencidos = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= ahora:
+                _, _, t = heapq.heappop(self._timers)
+                if not t.cancelado:
+                    vencidos.append(t)
+        for t in vencidos:
+            fn, args = t.fn, t.args
+            t.fn = t.args = None    # Ya corrió: activo() = False y no retiene referencias
+            t0 = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[REACTOR] Error en temporizador {getattr(fn, '__name__', fn)}: {e}", file=sys.stderr)
+            self._vigilar(f"temporizador {getattr(fn, '__name__', fn)}", t0)
+
+    def _ejecutar_callbacks(self):
+        # Solo los encolados hasta ahora: un callback que re-encola no bloquea la vuelta
+        for _ in range(len(self._callbacks)):
+            fn, args = self._callbacks.popleft()
+            t0 = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[REACTOR] Error en callback {getattr(fn, '__name__', fn)}: {e}", file=sys.stderr)
+            self._vigilar(f"callback {getattr(fn, '__name__', fn)}", t0)
+
+    def _drenar_wake(self, sock):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def procesar_eventos(self, timeout=None):
+        """
+        Espera eventos hasta `timeout` segundos (o hasta el próximo temporizador, lo que
+        ocurra antes; None = sin límite propio) y despacha cada socket listo a su handler.
+        Luego corre callbacks y temporizadores vencidos. Retorna los eventos despachados.
+        """
+        self._hilo_loop = threading.get_ident()
+        proximo = self._proximo_vencimiento()
+        if proximo is not None and (timeout is None or proximo < timeout):
+            timeout = proximo
+        if self._callbacks:
+            timeout = 0
+        try:
+            eventos = self._sel.select(timeout)
+        except InterruptedError:
+            eventos = []
+
+        mapa = self._sel.get_map()
+        despachados = 0
+        for key, _ in eventos:
+            # Un handler previo pudo cerrar/des-registrar este socket en la misma vuelta
+            if mapa.get(key.fd) is not key:
+                continue
+            tipo, handler = key.data
+            t0 = time.monotonic()
+            try:
+                handler(key.fileobj)
+            except Exception as e:
+                print(f"[REACTOR] Error en handler {tipo}: {e}", file=sys.stderr)
+            self._vigilar(f"handler {tipo}", t0)
+            despachados += 1
+        self._ejecutar_callbacks()
+        self._ejecutar_vencidos()
+        return despachados
+
+    def cerrar(self):
+        with self._lock:
+            try: self._sel.close()
+            except: pass
+            for _ in self._trabajadores:
+                self._tareas.put(None)
+        for s in (self._wake_r, self._wake_w):
+            try: s.close()
+            except: pass
@@ -0,0 +1,189 @@
+# /usr/lib/ghostwhisperchat/core/rutas.py
+# Tabla de Rutas: LAN directa vs Onion (Tor) por peer, con TTL
+#
+# Antes cada envío a un peer con .onion e IP de la misma subred hacía un
+# connect() de prueba bloqueante de 500ms (a veces en el bucle principal).
+# Ahora resolver() es una búsqueda en un dict:
+# - Ruta vigente -> se usa tal cual.
+# - Ruta vencida -> se usa la conocida y se re-sondea en segundo plano.
+# - Sin ruta     -> se usa el .onion y se sondea la LAN. Si este nodo no tiene Tor
+#                   (tor_disponible=False) el .onion no sirve: se usa la IP.
+# Un único hilo "sonda" procesa una cola sin duplicados. Un paquete UDP recibido
+# del peer confirma la ruta LAN sin sondear. Las rutas se invalidan al fallar un
+# envío, al cambiar la IP del peer o al cambiar la IP local.
+
+import socket
+import sys
+import threading
+import time
+import collections
+
+TTL_LAN = 120.0            # Ruta LAN confirmada: re-sondeo tras N s
+TTL_ONION = 60.0           # Ruta Onion (LAN no respondió): re-sondear antes por si vuelve
+TIMEOUT_SONDA = 0.5        # connect() de prueba hacia la IP LAN
+INTERVALO_IP_LOCAL = 30.0  # Re-verificación de la IP local (cambio de interfaz / DHCP)
+
+RUTA_LAN = "LAN"
+RUTA_ONION = "ONION"
+
+IPS_INVALIDAS = ('127.0.0.1', 'localhost', '0.0.0.0', 'WAN', '?.?.?.?')
+
+
+def _misma_subred(ip_a, ip_b):
+    return '.'.join(str(ip_a).split('.')[:3]) == '.'.join(str(ip_b).split('.')[:3])
+
+
+class TablaRutas:
+    def __init__(self, puerto_propio=44494):
+        self.puerto_propio = puerto_propio
+        # Lo actualiza el Motor: True con Tor iniciado y el SOCKS5 local respondiendo
+        self.tor_disponible = False
+        # onion -> [ruta, ip, port, t_expira]
+        self._rutas = {}
+        self._lock = threading.Lock()
+
+        self._ip_local = None
+        self._t_ip_local = 0.0
+
+        self._pendientes = collections.deque()
+        self._en_cola = set()
+        self._cond = threading.Condition(self._lock)
+        self._hilo = None
+        self.stats = {"hits": 0, "vencidas": 0, "frias": 0, "sondeos": 0, "invalidadas": 0}
+
+    # --- IP local ---
+
+    def ip_local(self):
+        """IP local cacheada (get_local_ip abre un socket UDP: no llamarla por envío)."""
+        if self._ip_local is None:
+            self.refrescar_ip_local()
+        return self._ip_local
+
+    def refrescar_ip_local(self, forzar=False):
+        """
+        Re-consulta la IP local como máximo cada INTERVALO_IP_LOCAL segundos.
+        Si cambió (otra red / DHCP), todas las rutas dejan de ser válidas.
+        Retorna la IP nueva si cambió, None si no.
+        """
+        ahora = time.time()
+        if not forzar and self._ip_local is not None and ahora - self._t_ip_local < INTERVALO_IP_LOCAL:
+            return None
+        from ghostwhisperchat.core.utilidades import get_local_ip
+        nueva = get_local_ip()
+        self._t_ip_local = ahora
+        anterior, self._ip_local = self._ip_local, nueva
+        if anterior is not None and nueva != anterior:
+            print(f"[RUTAS] IP local cambió {anterior} -> {nueva}, invalidando rutas", file=sys.stderr)
+            self.invalidar_todo()
+            return nueva
+        return None
+
+    # --- Resolución ---
+
+    def resolver(self, peer):
+        """Host destino para un peer/origen (dict): IP LAN o dirección .onion."""
+        onion = peer.get('onion')
+        ip = peer.get('ip')
+        if not onion:
+            return ip or '127.0.0.1'
+        if not ip or ip in IPS_INVALIDAS:
+            return onion
+
+        port = peer.get('port_priv', 44494)
+        mi_ip = self.ip_local()
+        if not mi_ip or mi_ip == '127.0.0.1' or ip == '127.0.0.1' or not _misma_subred(mi_ip, ip):
+            return onion
+        # Evitar auto-ping si DHCP nos asignó la antigua IP del contacto
+        if ip == mi_ip and port == self.puerto_propio:
+            return onion
+
+        with self._lock:
+            ruta = self._rutas.get(onion)
+            if ruta is None or ruta[1] != ip or ruta[2] != port:
+                # Sin ruta (o la IP/puerto del peer cambió): Onion ya (o la IP si no
+                # tenemos Tor), sondear LAN en fondo
+                self.stats["frias"] += 1
+                self._encolar_sonda(onion, ip, port)
+                return onion if self.tor_disponible else ip
+            if time.time() >= ruta[3]:
+                self.stats["vencidas"] += 1
+                self._encolar_sonda(onion, ip, port)
+            else:
+                self.stats["hits"] += 1
+            return ip if ruta[0] == RUTA_LAN or not self.tor_disponible else onion
+
+    def confirmar_lan(self, onion, ip, port=44494):
+        """Un paquete UDP del peer llegó desde `ip`: está en nuestra LAN."""
+        if not onion or not ip or ip in IPS_INVALIDAS:
+            return
+        with self._lock:
+            self._rutas[onion] = [RUTA_LAN, ip, port, time.time() + TTL_LAN]
+
+    # --- Invalidación ---
+
+    def invalidar_peer(self, onion):
+        if not onion:
+            return
+        with self._lock:
+            if self._rutas.pop(onion, None) is not None:
+                self.stats["invalidadas"] += 1
+
+    def invalidar_destino(self, host, port=None):
+        """Un envío a `host` falló: olvidar las rutas que apuntaban ahí (IP o .onion)."""
+        with self._lock:
+            borrar = [o for o, r in self._rutas.items()
+                      if host == o or (r[0] == RUTA_LAN and r[1] == host)]
+            for o in borrar:
+                del self._rutas[o]
+            self.stats["invalidadas"] += len(borrar)
+
+    def invalidar_todo(self):
+        with self._lock:
+            self.stats["invalidadas"] += len(self._rutas)
+            self._rutas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            res = dict(self.stats)
+            res["lan"] = sum(1 for r in self._rutas.values() if r[0] == RUTA_LAN)
+            res["onion"] = len(self._rutas) - res["lan"]
+        return res
+
+    # --- Sonda en segundo plano ---
+
+    def _encolar_sonda(self, onion, ip, port):
+        """Agrega una sonda sin duplicados (llamar con _lock tomado)."""
+        clave = (onion, ip, port)
+        if clave in self._en_cola:
+            return
+        self._en_cola.add(clave)
+        self._pendientes.append(clave)
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._hilo_sonda, daemon=True, name="rutas-sonda")
+            self._hilo.start()
+        self._cond.notify()
+
+    def _hilo_sonda(self):
+        while True:
+            with self._cond:
+                while not self._pendientes:
+                    self._cond.wait()
+                clave = self._pendientes.popleft()
+            onion, ip, port = clave
+
+            en_lan = False
+            try:
+                s = socket.create_connection((ip, port), timeout=TIMEOUT_SONDA)
+                s.close()
+                en_lan = True  # Confirmado en la misma red fisica local
+            except OSError:
+                pass
+
+            with self._lock:
+                self._en_cola.discard(clave)
+                self.stats["sondeos"] += 1
+                if en_lan:
+                    self._rutas[onion] = [RUTA_LAN, ip, port, time.time() + TTL_LAN]
+                else:
+                    self._rutas[onion] = [RUTA_ONION, ip, port, time.time() + TTL_ONION]
+            print(f"[RUTAS] {onion[:16]}... -> {'LAN ' + ip if en_lan else 'Onion'}", file=sys.stderr)
@@ -0,0 +1,216 @@
+# /usr/lib/ghostwhisperchat/core/tramas.py
+# Capa de Framing para streams TCP / IPC
+#
+# Protocolo de tramas v3 (anunciado en origen["proto"]):
+#   [0x00][largo: 4 bytes big-endian][JSON]
+# Protocolo v4 agrega tramas binarias (FILE_CHUNK sin base64 ni JSON):
+#   [0x01][largo cabecera: 4 BE][largo payload: 8 BE][cabecera JSON][payload crudo]
+# Protocolo v2 (legado): JSON terminado en '\n'.
+# Protocolo v5 no cambia el framing: agrega la sesión por conexión (el origen
+# viaja una vez por conexión del pool, ver core/protocolo.py).
+#
+# Un JSON v2 nunca empieza con 0x00/0x01, así que el lector detecta el formato
+# trama por trama y acepta todos en el mismo stream. El buffer es un bytearray
+# preasignado que se llena con recv_into; las tramas se entregan como
+# memoryview (sin copias) y solo se compacta/crece cuando hace falta.
+# El payload binario NO se acumula: se entrega en trozos (EventoBinario) a
+# medida que llega, para escribirlo directo a disco desde el buffer.
+
+# Versión de framing que soporta este nodo (origen["proto"])
+PROTO_TRAMAS = 5
+PROTO_LARGO = 3                     # Desde esta versión: tramas con prefijo de largo
+PROTO_BINARIO = 4                   # Desde esta versión: tramas binarias (0x01)
+PROTO_SESION = 5                    # Desde esta versión: paquetes compactos con sesión (sid)
+
+MARCA_TRAMA = 0x00
+MARCA_BINARIA = 0x01
+CABECERA = 5                        # marca (1) + largo (4)
+CABECERA_BIN = 13                   # marca (1) + largo cabecera (4) + largo payload (8)
+MAX_TRAMA = 64 * 1024 * 1024        # Tope de seguridad por trama (64MB)
+MAX_CABECERA_BIN = 64 * 1024        # La cabecera JSON de una trama binaria es chica
+BLOQUE_BINARIO = 256 * 1024         # recv_into por vuelta mientras llega un payload binario
+CAPACIDAD_INICIAL = 64 * 1024
+CAPACIDAD_OCIOSA = 1024 * 1024      # Al vaciarse, buffers mayores vuelven a CAPACIDAD_INICIAL
+MIN_LIBRE = 32 * 1024               # Espacio libre mínimo antes de cada recv_into
+
+
+def enmarcar(data_bytes):
+    """Trama v3 con prefijo de largo."""
+    return b"\x00" + len(data_bytes).to_bytes(4, 'big') + data_bytes
+
+
+def enmarcar_linea(data_bytes):
+    """Trama v2 (legado): JSON + salto de línea."""
+    return data_bytes + b"\n"
+
+
+def enmarcar_binario(cabecera, largo_payload):
+    """Prefijo de una trama binaria v4: el payload (largo_payload bytes) se envía aparte."""
+    return (b"\x01" + len(cabecera).to_bytes(4, 'big') +
+            largo_payload.to_bytes(8, 'big') + cabecera)
+
+
+# Eventos de trama binaria (ver LectorTramas.tramas)
+BIN_INI = "BIN_INI"       # datos = cabecera JSON, largo = bytes de payload que siguen
+BIN_DATOS = "BIN_DATOS"   # datos = trozo del payload (memoryview sobre el buffer)
+BIN_FIN = "BIN_FIN"       # payload completo
+
+
+class EventoBinario:
+    __slots__ = ("tipo", "datos", "largo")
+
+    def __init__(self, tipo, datos=None, largo=0):
+        self.tipo = tipo
+        self.datos = datos
+        self.largo = largo
+
+
+class LectorTramas:
+    def __init__(self, capacidad=CAPACIDAD_INICIAL, binario=False):
+        self._buf = bytearray(capacidad)
+        self._ini = 0        # Inicio de datos pendientes
+        self._fin = 0        # Fin de datos válidos
+        self._scan = 0       # Hasta dónde ya se buscó '\n' (evita re-escanear)
+        self._necesario = 0  # Bytes totales que necesita la trama en curso
+        self._binario = binario    # Aceptar tramas 0x01 (solo sockets entre peers)
+        self._bin_restante = 0     # Bytes de payload binario aún por entregar
+        self.v3 = False      # El otro extremo ya envió tramas con prefijo
+
+    def en_binario(self):
+        """True si hay un payload binario a medio recibir."""
+        return self._bin_restante > 0
+
+    def pendientes(self):
+        return self._fin - self._ini
+
+    def _reservar(self, libre):
+        """Garantiza `libre` bytes al final del buffer (compacta o crece)."""
+        if len(self._buf) - self._fin >= libre:
+            return
+        datos = self._fin - self._ini
+        requerido = datos + libre
+        if self._ini > 0 and len(self._buf) >= requerido:
+            # Compactar: mover pendientes al inicio (mismo tamaño, sin realloc)
+            self._buf[0:datos] = self._buf[self._ini:self._fin]
+        else:
+            nuevo = bytearray(max(requerido, len(self._buf) * 2))
+            nuevo[0:datos] = self._buf[self._ini:self._fin]
+            self._buf = nuevo
+        self._scan = max(0, self._scan - self._ini)
+        self._ini = 0
+        self._fin = datos
+
+    def recibir(self, sock):
+        """
+        Lee del socket directo al buffer (recv_into). Retorna bytes leídos (0 = EOF).
+        Propaga BlockingIOError/OSError como recv().
+        """
+        libre = MIN_LIBRE
+        if self._bin_restante:
+            # Payload binario: bloques acotados, se vacían a disco en cada vuelta
+            libre = max(libre, min(self._bin_restante, BLOQUE_BINARIO))
+        elif self._necesario:
+            # Trama grande en curso: reservar de una vez lo que falta
+            libre = max(libre, self._necesario - (self._fin - self._ini))
+        self._reservar(libre)
+        with memoryview(self._buf) as mv:
+            with mv[self._fin:] as destino:
+                n = sock.recv_into(destino)
+        self._fin += n
+        return n
+
+    def alimentar(self, data):
+        """Agrega bytes ya leídos (tests/benchmarks o fuentes sin recv_into)."""
+        self._reservar(len(data))
+        self._buf[self._fin:self._fin + len(data)] = data
+        self._fin += len(data)
+
+    def tramas(self):
+        """
+        Generador de tramas completas como memoryview. La vista solo es válida
+        durante la iteración: copiar con bytes() si se necesita conservarla.
+        Con binario=True, una trama 0x01 se entrega como EventoBinario:
+        BIN_INI (cabecera), uno o más BIN_DATOS (trozos del payload) y BIN_FIN.
+        """
+        buf = self._buf
+        while self._ini < self._fin:
+            ini, fin = self._ini, self._fin
+
+            if self._bin_restante:
+                # Trozo del payload binario en curso: entregar lo que haya
+                n = min(self._bin_restante, fin - ini)
+                self._ini = self._scan = ini + n
+                self._bin_restante -= n
+                vista = memoryview(buf)[ini:ini + n]
+                try:
+                    yield EventoBinario(BIN_DATOS, vista, n)
+                finally:
+                    try: vista.release()
+                    except BufferError: pass
+                if not self._bin_restante:
+                    yield EventoBinario(BIN_FIN)
+                continue
+
+            if buf[ini] == MARCA_BINARIA and self._binario:
+                if fin - ini < CABECERA_BIN:
+                    return
+                largo_cab = int.from_bytes(buf[ini + 1:ini + 5], 'big')
+                largo_payload = int.from_bytes(buf[ini + 5:ini + CABECERA_BIN], 'big')
+                if largo_cab > MAX_CABECERA_BIN:
+                    raise ValueError(f"Cabecera binaria demasiado grande ({largo_cab} bytes)")
+                if fin - ini - CABECERA_BIN < largo_cab:
+                    self._necesario = CABECERA_BIN + largo_cab
+                    return
+                self._necesario = 0
+                inicio = ini + CABECERA_BIN
+                self._ini = self._scan = inicio + largo_cab
+                self._bin_restante = largo_payload
+                vista = memoryview(buf)[inicio:inicio + largo_cab]
+                try:
+                    yield EventoBinario(BIN_INI, vista, largo_payload)
+                finally:
+                    try: vista.release()
+                    except BufferError: pass
+                if not largo_payload:
+                    yield EventoBinario(BIN_FIN)
+                continue
+
+            if buf[ini] == MARCA_TRAMA:
+                if fin - ini < CABECERA:
+                    return
+                largo = int.from_bytes(buf[ini + 1:ini + CABECERA], 'big')
+                if largo > MAX_TRAMA:
+                    raise ValueError(f"Trama demasiado grande ({largo} bytes)")
+                if fin - ini - CABECERA < largo:
+                    self._necesario = CABECERA + largo
+                    return
+                self._necesario = 0
+                self.v3 = True
+                inicio = ini + CABECERA
+                self._ini = self._scan = inicio + largo
+                trama = memoryview(buf)[inicio:inicio + largo]
+            else:
+                pos = buf.find(b"\n", max(self._scan, ini), fin)
+                if pos < 0:
+                    self._scan = fin
+                    return
+                self._ini = self._scan = pos + 1
+                if pos == ini:
+                    continue  # Línea vacía
+                trama = memoryview(buf)[ini:pos]
+
+            try:
+                yield trama
+            finally:
+                try: trama.release()
+                except BufferError: pass
+
+        # Todo consumido: reiniciar punteros sin mover datos
+        self._ini = self._fin = self._scan = 0
+        if len(self._buf) > CAPACIDAD_OCIOSA:
+            # Liberar la memoria de una trama grande (ej: FILE_CHUNK de 13MB)
+            self._buf = bytearray(CAPACIDAD_INICIAL)
+
+    def resto(self):
+        """Bytes pendientes sin trama completa (para procesar al cerrar la conexión)."""
+        return bytes(self._buf[self._ini:self._fin])
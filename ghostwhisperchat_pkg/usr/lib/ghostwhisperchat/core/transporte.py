@@ -2,16 +2,28 @@
 # Capa de Transporte (Sockets UDP/TCP)
 
 import socket
-import select
 import sys
+import time
 import errno
-from ghostwhisperchat.core.utilidades import get_local_ip
+import secrets
+import weakref
+from ghostwhisperchat.core.tramas import PROTO_LARGO, PROTO_BINARIO, PROTO_SESION, enmarcar, enmarcar_linea, enmarcar_binario
 
 # Constantes de Puerto
 PORT_PRIVATE = 44494   # TCP P2P
 PORT_DISCOVERY = 44495 # UDP Broadcast
 PORT_GROUP = 44496     # TCP Mesh
 
+# --- Pool de conexiones salientes (LAN y Tor) ---
+POOL_MAX_POR_PEER = 4       # Conexiones abiertas (ociosas + prestadas) por (host, port)
+POOL_OCIOSAS_POR_PEER = 2   # De ellas, cuántas se retienen ociosas al devolverlas
+POOL_ESPERA_CUPO = 10.0     # Segundos que un envío espera cupo con el tope lleno antes de fallar
+POOL_IDLE_LAN = 60.0        # Segundos sin uso antes de cerrar una conexión LAN
+POOL_IDLE_ONION = 300.0     # Idem Tor (el circuito es caro de rehacer)
+KEEPALIVE_IDLE = 30         # TCP keepalive: primer probe tras N s sin tráfico
+KEEPALIVE_INTVL = 10        # Intervalo entre probes
+KEEPALIVE_CNT = 3           # Probes fallidos antes de dar la conexión por muerta
+
 import threading
 
 class GestorRed:
@@ -26,12 +38,111 @@ class GestorRed:
         self.tcp_connections = []  # Lista de sockets TCP activos (conectados o aceptados)
         self.inputs = []           # Lista para select()
         
-        # --- Pool de conexiones Tor persistentes ---
-        # Clave: (host_onion, port) | Valor: socket vivo
-        # Evita crear un circuito nuevo por cada mensaje (el mayor costo de latencia Tor).
-        # Thread-safe via _pool_lock.
-        self._onion_pool = {}          # { (host, port): socket }
+        # --- Pool de conexiones persistentes (LAN y Tor) ---
+        # Clave: (host, port) | Valor: lista de (socket, t_ultimo_uso) ociosos.
+        # Evita handshake TCP (LAN) o circuito nuevo (Tor) por cada mensaje y no deja
+        # sockets en TIME_WAIT. Cada envío "toma" un socket y lo "devuelve" al terminar,
+        # así dos hilos nunca escriben intercalado en la misma conexión.
+        # Ociosas + prestadas nunca superan POOL_MAX_POR_PEER por (host, port): con el
+        # tope lleno, quien necesita una conexión espera a que se devuelva una.
+        # Thread-safe via _pool_lock (_pool_cond avisa cada devolución).
+        self._pool = {}                # { (host, port): [(socket, t_ultimo_uso), ...] }
+        self._pool_en_uso = {}         # { (host, port): n sockets prestados (o conectando) }
         self._pool_lock = threading.Lock()
+        self._pool_cond = threading.Condition(self._pool_lock)
+        self.pool_stats = {"hits": 0, "misses": 0, "expirados": 0, "muertos": 0, "descartados": 0,
+                           "esperas_cupo": 0, "sin_cupo": 0}
+
+        # Reactor (selectors/epoll) del Motor: los sockets TCP se registran una sola vez
+        # al crearse y se des-registran al cerrarse (ver core/reactor.py).
+        self.reactor = None
+        self._handler_tcp = None
+
+        # --- Framing por destino ---
+        # (host, port) -> versión de framing anunciada por el peer (origen["proto"]).
+        # Sin dato = v2 (newline), que todos los nodos entienden.
+        self.proto_peers = {}
+        self._socks_v3 = set()        # Sockets donde el otro extremo ya envió tramas v3
+        self._destino_socket = {}     # socket -> (host, port) para conexiones salientes
+
+        # --- Sesión por conexión del pool (proto >= PROTO_SESION, ver core/protocolo.py) ---
+        # socket -> (sid, origen enviado en el handshake o último PEER_UPDATE).
+        # Un socket prestado lo usa un solo hilo; el lock protege solo el dict.
+        self._sesiones_tx = weakref.WeakKeyDictionary()
+
+    def registrar_proto(self, origen):
+        """Memoriza la versión de framing de un peer a partir de su 'origen'."""
+        try:
+            proto = int(origen.get('proto', 2))
+        except (TypeError, ValueError):
+            proto = 2
+        puertos = [p for p in (origen.get('port_priv'), origen.get('port_group')) if p]
+        for host in (origen.get('ip'), origen.get('onion')):
+            if not host or host in ('127.0.0.1', '0.0.0.0', '?.?.?.?'):
+                continue
+            for port in puertos:
+                self.proto_peers[(host, port)] = proto
+
+    def soporta_binario(self, host, port):
+        """True si el peer anunció tramas binarias (FILE_CHUNK sin base64)."""
+        return self.proto_peers.get((host, port), 2) >= PROTO_BINARIO
+
+    def marcar_socket_v3(self, sock):
+        self._socks_v3.add(sock)
+
+    def _serializar(self, data_bytes, host=None, port=None, sock=None):
+        """Elige framing v3 (prefijo de largo) si el destino lo soporta; si no, newline."""
+        if sock is not None:
+            if sock in self._socks_v3:
+                return enmarcar(data_bytes)
+            host, port = self._destino_socket.get(sock, (host, port))
+        if self.proto_peers.get((host, port), 2) >= PROTO_LARGO:
+            return enmarcar(data_bytes)
+        return enmarcar_linea(data_bytes)
+
+    def _cuerpos_sesion(self, s, host, port, data_bytes):
+        """
+        Paquetes JSON a mandar por el socket del pool `s` en lugar de `data_bytes`.
+        Primer paquete de la conexión: completo con "sid". Luego: compactos (sin
+        origen). Si el origen cambió: PEER_UPDATE completo con el sid y después el
+        compacto. Peers < v5 o bytes que no salen de empaquetar() (p. ej. un relay
+        de protocolo.reenviable, con el origen de otro nodo): tal cual.
+        """
+        from ghostwhisperchat.core.protocolo import Paquete
+        if not isinstance(data_bytes, Paquete) or self.proto_peers.get((host, port), 2) < PROTO_SESION:
+            return [data_bytes]
+        with self._pool_lock:
+            sesion = self._sesiones_tx.get(s)
+        if sesion is None:
+            sid = secrets.token_hex(8)
+            cuerpos = [data_bytes.con_sesion(sid)]
+        else:
+            sid, origen = sesion
+            if origen == data_bytes.origen:
+                cuerpos = [data_bytes.compactar(sid)]
+            elif data_bytes.tipo == "PEER_UPDATE":
+                cuerpos = [data_bytes.con_sesion(sid)]
+            else:
+                cuerpos = [data_bytes.aviso_origen(sid), data_bytes.compactar(sid)]
+        with self._pool_lock:
+            self._sesiones_tx[s] = (sid, data_bytes.origen)
+        return cuerpos
+
+    def _trama_pool(self, s, host, port, data_bytes):
+        """Trama lista para sendall por un socket del pool (sesión + framing del destino)."""
+        return b"".join(self._serializar(c, host, port) for c in self._cuerpos_sesion(s, host, port, data_bytes))
+
+    def set_reactor(self, reactor, handler_tcp):
+        """Asocia el reactor del Motor y el handler para sockets TCP de peers."""
+        self.reactor = reactor
+        self._handler_tcp = handler_tcp
+        for s in list(self.tcp_connections):
+            self._vigilar(s)
+
+    def _vigilar(self, sock):
+        if self.reactor is not None and self._handler_tcp is not None:
+            from ghostwhisperchat.core.reactor import TIPO_PEER_TCP
+            self.reactor.registrar(sock, TIPO_PEER_TCP, self._handler_tcp)
 
     def set_socks_proxy(self, host="127.0.0.1", port=9050):
         """Configura los parámetros del proxy SOCKS5 local para Tor"""
@@ -162,6 +273,8 @@ class GestorRed:
             s.setblocking(False)
             self.inputs.append(s)
             self.tcp_connections.append(s)
+            self._destino_socket[s] = (host, puerto)
+            self._vigilar(s)
             return s
         except OSError as e:
             print(f"[!] Error conectar_tcp a {host}:{puerto} -> {e}", file=sys.stderr)
@@ -169,10 +282,14 @@ class GestorRed:
 
     def cerrar_tcp(self, sock):
         """Cierra un socket de forma segura y limpia listas"""
+        if self.reactor is not None:
+            self.reactor.quitar(sock)
         if sock in self.inputs:
             self.inputs.remove(sock)
         if sock in self.tcp_connections:
             self.tcp_connections.remove(sock)
+        self._socks_v3.discard(sock)
+        self._destino_socket.pop(sock, None)
         try:
             sock.close()
         except OSError:
@@ -194,7 +311,7 @@ class GestorRed:
             
             try:
                 sock.setblocking(True)
-                sock.sendall(data_bytes + b'\n')
+                sock.sendall(self._serializar(data_bytes, sock=sock))
                 sock.setblocking(False)
                 return True
             except Exception as e:
@@ -217,143 +334,306 @@ class GestorRed:
             client.setblocking(False)
             self.inputs.append(client)
             self.tcp_connections.append(client)
+            self._vigilar(client)
             return client, addr
         except OSError:
             return None, None
 
-    def _pool_get(self, host, port):
+    @staticmethod
+    def _idle_timeout(host):
+        return POOL_IDLE_ONION if str(host).endswith(".onion") else POOL_IDLE_LAN
+
+    @staticmethod
+    def _timeout_envio(host):
+        return 30.0 if str(host).endswith(".onion") else 15.0
+
+    @staticmethod
+    def _configurar_socket_pool(s):
+        """TCP_NODELAY (mensajes chicos de chat) + keepalive del kernel para detectar peers caídos."""
+        try:
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTVL)
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_CNT)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _cerrar_silencioso(s):
+        try: s.close()
+        except: pass
+
+    def _pool_tomar(self, host, port):
         """
-        Devuelve un socket vivo del pool para (host, port), o None si no hay / está muerto.
-        Remueve sockets muertos automáticamente.
+        Presta un socket ocioso del pool para (host, port), o None (miss).
+        Descarta los expirados por inactividad y los que el kernel ya marcó muertos
+        (keepalive / RST) o cuyo peer cerró (FIN): un solo recv no bloqueante, sin select.
         """
         key = (host, port)
-        with self._pool_lock:
-            s = self._onion_pool.get(key)
-        if s is None:
-            return None
-        # Verificar que el socket sigue vivo
-        try:
-            if s.fileno() < 0:
-                raise OSError("fileno<0")
-            # select no bloqueante: si hay error, está muerto
-            r, _, e = select.select([s], [], [s], 0)
-            if e:
-                raise OSError("socket error flag")
-            if r:
-                # Hay datos pendientes: podría ser EOF del otro lado
-                peek = s.recv(1, socket.MSG_PEEK)
-                if not peek:
+        ahora = time.time()
+        limite = self._idle_timeout(host)
+        while True:
+            with self._pool_lock:
+                libres = self._pool.get(key)
+                if not libres:
+                    self.pool_stats["misses"] += 1
+                    return None
+                s, t_uso = libres.pop()
+                if not libres:
+                    del self._pool[key]
+
+            if ahora - t_uso > limite:
+                self._contar("expirados")
+                self._cerrar_silencioso(s)
+                continue
+            try:
+                if s.fileno() < 0:
+                    raise OSError("fileno<0")
+                # Los sockets ociosos quedan en modo no bloqueante (ver _pool_devolver)
+                if s.recv(1, socket.MSG_PEEK) == b"":
                     raise OSError("EOF detectado")
-        except Exception as dead_err:
-            print(f"[POOL] Socket muerto para {host}:{port} ({dead_err}), removiendo.", file=sys.stderr)
+            except (BlockingIOError, InterruptedError):
+                pass  # Sin datos pendientes = conexión viva
+            except OSError as dead_err:
+                print(f"[POOL] Socket muerto para {host}:{port} ({dead_err}), removiendo.", file=sys.stderr)
+                self._contar("muertos")
+                self._cerrar_silencioso(s)
+                continue
+
+            s.settimeout(self._timeout_envio(host))
             with self._pool_lock:
-                self._onion_pool.pop(key, None)
-            try: s.close()
-            except: pass
-            return None
+                self.pool_stats["hits"] += 1
+                self._pool_en_uso[key] = self._pool_en_uso.get(key, 0) + 1
+            return s
+
+    def _pool_reservar(self, host, port):
+        """
+        Cupo para abrir una conexión a (host, port): la cuenta como prestada y retorna None.
+        Con el tope lleno espera (hasta POOL_ESPERA_CUPO) a que se devuelva una; si vuelve
+        ociosa se presta esa (retorna el socket). Sin cupo a tiempo: TimeoutError.
+        """
+        key = (host, port)
+        limite = time.monotonic() + POOL_ESPERA_CUPO
+        espero = False
+        while True:
+            with self._pool_cond:
+                while not self._pool.get(key):
+                    en_uso = self._pool_en_uso.get(key, 0)
+                    if en_uso < POOL_MAX_POR_PEER:
+                        self._pool_en_uso[key] = en_uso + 1
+                        return None
+                    resto = limite - time.monotonic()
+                    if resto <= 0:
+                        self.pool_stats["sin_cupo"] += 1
+                        raise TimeoutError(f"{POOL_MAX_POR_PEER} conexiones abiertas a {host}:{port}, sin cupo")
+                    if not espero:
+                        self.pool_stats["esperas_cupo"] += 1
+                        espero = True
+                    self._pool_cond.wait(resto)
+            # Hay una ociosa (devuelta mientras tanto): se presta si sigue viva
+            s = self._pool_tomar(host, port)
+            if s:
+                return s
+
+    def _pool_soltar(self, key):
+        """Descuenta un socket prestado y despierta a quien espera cupo (llamar con _pool_lock)."""
+        n = self._pool_en_uso.get(key, 1) - 1
+        if n > 0:
+            self._pool_en_uso[key] = n
+        else:
+            self._pool_en_uso.pop(key, None)
+        self._pool_cond.notify_all()
+
+    def _pool_crear(self, host, port):
+        """
+        Abre una conexión nueva (LAN directa o Tor SOCKS5) y la marca como prestada,
+        respetando POOL_MAX_POR_PEER (ver _pool_reservar: puede prestar una ociosa).
+        """
+        s = self._pool_reservar(host, port)
+        if s is not None:
+            return s
+        try:
+            if str(host).endswith(".onion"):
+                print(f"[POOL] Creando nueva conexión Tor a {host}:{port}...", file=sys.stderr)
+                s = self._conectar_socks5(host, port, timeout=60.0)
+            else:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.settimeout(15.0)
+                try:
+                    s.connect((host, port))
+                except OSError:
+                    self._cerrar_silencioso(s)
+                    raise
+        except BaseException:
+            with self._pool_lock:
+                self._pool_soltar((host, port))
+            raise
+        # Envíos síncronos con timeout acotado
+        s.settimeout(self._timeout_envio(host))
+        self._configurar_socket_pool(s)
         return s
 
-    def _pool_set(self, host, port, sock):
-        """Registra un socket en el pool de forma thread-safe."""
+    def _pool_devolver(self, host, port, s, roto=False):
+        """Devuelve un socket prestado. Si está roto o el pool del peer está lleno, se cierra."""
+        key = (host, port)
         with self._pool_lock:
-            # Si había uno viejo, cerrarlo
-            old = self._onion_pool.get((host, port))
-            if old and old is not sock:
-                try: old.close()
-                except: pass
-            self._onion_pool[(host, port)] = sock
+            self._pool_soltar(key)
+            if not roto:
+                libres = self._pool.setdefault(key, [])
+                if len(libres) < POOL_OCIOSAS_POR_PEER:
+                    try:
+                        # Ocioso = no bloqueante: el chequeo de _pool_tomar no espera
+                        s.setblocking(False)
+                        libres.append((s, time.time()))
+                        return
+                    except OSError:
+                        pass
+                self.pool_stats["descartados"] += 1
+        self._cerrar_silencioso(s)
+
+    def _contar(self, clave):
+        with self._pool_lock:
+            self.pool_stats[clave] += 1
 
     def pool_close(self, host, port):
-        """Cierra y elimina la conexión poolada para (host, port). Llamar al cerrar un chat."""
+        """Cierra y elimina las conexiones ociosas para (host, port). Llamar al cerrar un chat."""
         key = (host, port)
         with self._pool_lock:
-            s = self._onion_pool.pop(key, None)
-        if s:
-            try: s.close()
-            except: pass
+            libres = self._pool.pop(key, [])
+        for s, _ in libres:
+            self._cerrar_silencioso(s)
+        if libres:
             print(f"[POOL] Conexión cerrada y removida: {host}:{port}", file=sys.stderr)
 
     def pool_close_all(self):
         """Cierra todas las conexiones del pool (al apagar el motor)."""
         with self._pool_lock:
-            items = list(self._onion_pool.items())
-            self._onion_pool.clear()
-        for (h, p), s in items:
-            try: s.close()
-            except: pass
+            items = list(self._pool.values())
+            self._pool.clear()
+        for libres in items:
+            for s, _ in libres:
+                self._cerrar_silencioso(s)
+
+    def pool_purgar_inactivos(self):
+        """Cierra conexiones ociosas que superaron su idle timeout (mantenimiento periódico)."""
+        ahora = time.time()
+        cerrar = []
+        with self._pool_lock:
+            for key in list(self._pool.keys()):
+                limite = self._idle_timeout(key[0])
+                vivos = []
+                for s, t_uso in self._pool[key]:
+                    if ahora - t_uso > limite:
+                        cerrar.append(s)
+                    else:
+                        vivos.append((s, t_uso))
+                if vivos:
+                    self._pool[key] = vivos
+                else:
+                    del self._pool[key]
+            self.pool_stats["expirados"] += len(cerrar)
+        for s in cerrar:
+            self._cerrar_silencioso(s)
+        return len(cerrar)
+
+    def estadisticas_pool(self):
+        """Snapshot de contadores del pool (para el dashboard)."""
+        with self._pool_lock:
+            stats = dict(self.pool_stats)
+            stats["ociosas"] = sum(len(v) for v in self._pool.values())
+            stats["en_uso"] = sum(self._pool_en_uso.values())
+        return stats
 
     def enviar_tcp_priv(self, ip_o_host, data_bytes, port=PORT_PRIVATE, force_new=False):
         """
-        Envía un mensaje TCP al puerto Privado (LAN o WAN Tor).
-        Para destinos .onion usa un pool de conexiones persistentes para evitar
-        el overhead de circuit setup en cada mensaje (principal causa de latencia alta).
-        Patrón LAN: Connect -> Send -> Close (LAN es rápido, sin overhead).
-        Patrón Tor: Pool -> Send (reutiliza circuito existente; solo el primer msg paga el costo).
-        force_new=True: siempre crea conexion fresca (usar para CHAT_REQ, no para MSG).
+        Envía un mensaje TCP al puerto Privado/Grupo (LAN o WAN Tor) usando el pool
+        de conexiones persistentes (LAN y .onion): solo el primer mensaje paga el
+        handshake TCP / circuito Tor.
+        force_new=True: descarta las conexiones ociosas y crea una fresca (CHAT_REQ).
         """
-        try:
-            is_onion = str(ip_o_host).endswith(".onion")
-            
-            if is_onion:
-                # --- Intentar reutilizar conexión del pool (excepto si force_new) ---
-                s = None if force_new else self._pool_get(ip_o_host, port)
-                
-                if s and force_new:
-                    # CHAT_REQ: cerrar viejo primero, queremos circuito fresco
-                    self.pool_close(ip_o_host, port)
-                    s = None
-                
-                if s:
-                    # Tenemos conexión viva: enviar directamente
-                    try:
-                        s.sendall(data_bytes + b'\n')
-                        if len(data_bytes) > 2000:
-                            print(f"[OUT_TCP_POOL] -> {ip_o_host}:{port}: (Large) {len(data_bytes)}b", file=sys.stderr)
-                        else:
-                            print(f"[OUT_TCP_POOL] -> {ip_o_host}:{port}: {data_bytes.strip()}", file=sys.stderr)
-                        return True
-                    except Exception as send_err:
-                        # Conexión rota en envío: limpiar pool y reconectar
-                        print(f"[POOL] Envío falló en socket poolado ({send_err}), reconectando...", file=sys.stderr)
-                        self.pool_close(ip_o_host, port)
-                        s = None
-                
-                # --- Sin conexión en pool (o recién limpiada): crear nueva ---
-                print(f"[POOL] Creando nueva conexión Tor a {ip_o_host}:{port}...", file=sys.stderr)
-                s = self._conectar_socks5(ip_o_host, port, timeout=60.0)
-                # Mantener el socket en modo bloqueante para envíos síncronos
-                s.settimeout(30.0)
-                s.sendall(data_bytes + b'\n')
-                # Registrar en pool para reusar en mensajes futuros
-                self._pool_set(ip_o_host, port, s)
-                
-                if len(data_bytes) > 2000:
-                    print(f"[OUT_TCP_PRIV_NEW] -> {ip_o_host}:{port}: (Large) {len(data_bytes)}b", file=sys.stderr)
-                else:
-                    print(f"[OUT_TCP_PRIV_NEW] -> {ip_o_host}:{port}: {data_bytes.strip()}", file=sys.stderr)
-                return True
+        if len(data_bytes) > 2000:
+            log_data = f"(Large) {len(data_bytes)}b"
+        else:
+            log_data = data_bytes.strip()
 
+        try:
+            if force_new:
+                self.pool_close(ip_o_host, port)
+                s = None
             else:
-                # LAN: conexión transitoria (sin pool, LAN no tiene overhead)
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(15.0)
-                s.connect((ip_o_host, port))
-                if len(data_bytes) > 2000:
-                    print(f"[OUT_TCP_PRIV] -> {ip_o_host}:{port}: (Large) {len(data_bytes)}b", file=sys.stderr)
-                else:
-                    print(f"[OUT_TCP_PRIV] -> {ip_o_host}:{port}: {data_bytes.strip()}", file=sys.stderr)
-                s.sendall(data_bytes + b'\n')
-                s.close()
-                return True
+                s = self._pool_tomar(ip_o_host, port)
+
+            if s:
+                # La trama depende del socket (sesión propia de cada conexión)
+                trama = self._trama_pool(s, ip_o_host, port, data_bytes)
+                try:
+                    s.sendall(trama)
+                    self._pool_devolver(ip_o_host, port, s)
+                    print(f"[OUT_TCP_POOL] -> {ip_o_host}:{port}: {log_data}", file=sys.stderr)
+                    return True
+                except Exception as send_err:
+                    # Conexión rota en envío: descartarla y reconectar una vez
+                    print(f"[POOL] Envío falló en socket poolado ({send_err}), reconectando...", file=sys.stderr)
+                    self._pool_devolver(ip_o_host, port, s, roto=True)
+
+            s = self._pool_crear(ip_o_host, port)
+            try:
+                s.sendall(self._trama_pool(s, ip_o_host, port, data_bytes))
+            except Exception:
+                self._pool_devolver(ip_o_host, port, s, roto=True)
+                raise
+            self._pool_devolver(ip_o_host, port, s)
+            print(f"[OUT_TCP_PRIV_NEW] -> {ip_o_host}:{port}: {log_data}", file=sys.stderr)
+            return True
 
         except Exception as e:
             print(f"[X] Error TCP Priv a {ip_o_host}:{port}: {e}", file=sys.stderr)
             return False
 
+    def enviar_archivo_bin(self, host, cabecera, f, offset, largo, port=PORT_PRIVATE):
+        """
+        Envía una trama binaria v4 por el pool: prefijo + cabecera JSON con sendall y
+        luego `largo` bytes del archivo `f` desde `offset` con socket.sendfile
+        (kernel -> socket, sin leer el archivo a Python ni pasar por base64).
+        """
+        s = None
+        try:
+            s = self._pool_tomar(host, port)
+            if s:
+                try:
+                    s.sendall(self._prefijo_bin(s, host, port, cabecera, largo))
+                except OSError as send_err:
+                    print(f"[POOL] Envío falló en socket poolado ({send_err}), reconectando...", file=sys.stderr)
+                    self._pool_devolver(host, port, s, roto=True)
+                    s = None
+            if s is None:
+                s = self._pool_crear(host, port)
+                s.sendall(self._prefijo_bin(s, host, port, cabecera, largo))
+            enviados = s.sendfile(f, offset, largo) if largo else 0
+            if enviados != largo:
+                raise OSError(f"sendfile incompleto ({enviados}/{largo} bytes)")
+        except Exception as e:
+            # Una trama binaria a medias deja el stream inservible: no devolver al pool
+            if s is not None:
+                self._pool_devolver(host, port, s, roto=True)
+            print(f"[X] Error TCP Bin a {host}:{port}: {e}", file=sys.stderr)
+            return False
+        self._pool_devolver(host, port, s)
+        print(f"[OUT_TCP_BIN] -> {host}:{port}: {largo}b desde offset {offset}", file=sys.stderr)
+        return True
+
+    def _prefijo_bin(self, s, host, port, cabecera, largo):
+        """Prefijo + cabecera de la trama binaria; un PEER_UPDATE de la sesión va antes, aparte."""
+        *previos, cabecera = self._cuerpos_sesion(s, host, port, cabecera)
+        return b"".join(self._serializar(c, host, port) for c in previos) + enmarcar_binario(cabecera, largo)
+
     def registrar_socket_tcp(self, sock, label=None):
         """Registra un socket creado externamente en el pool de monitoreo"""
         if sock not in self.inputs:
             self.inputs.append(sock)
         if sock not in self.tcp_connections:
             self.tcp_connections.append(sock)
+        self._vigilar(sock)
         # Nota: label no se usa en select, es para debug si quisiéramos loggear
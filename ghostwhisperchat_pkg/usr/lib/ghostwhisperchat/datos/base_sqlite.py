@@ -0,0 +1,233 @@
+# /usr/lib/ghostwhisperchat/datos/base_sqlite.py
+# Backend SQLite opcional (GWC_BACKEND=sqlite) para agenda, vault e historial
+#
+# Por defecto el estado sigue en archivos (contacts.json, vault.enc, history/).
+# Con GWC_BACKEND=sqlite todo va a ~/.ghostwhisperchat/gwc.db (modo WAL):
+#   contactos  -> uid PK + índices por nick normalizado y onion
+#   vault      -> una fila por uid cifrada con AES-GCM (AAD = uid)
+#   historial  -> índice (chat_id, ts)
+# Solo se escriben las filas que cambiaron (no el archivo entero).
+# Al abrir la base por primera vez se migran los archivos existentes (una vez,
+# los originales quedan como respaldo).
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+import contextlib
+
+DB_FILE = os.path.expanduser("~/.ghostwhisperchat/gwc.db")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS contactos (
+    uid TEXT PRIMARY KEY,
+    nick_norm TEXT,
+    onion TEXT,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_contactos_nick ON contactos(nick_norm);
+CREATE INDEX IF NOT EXISTS idx_contactos_onion ON contactos(onion);
+CREATE TABLE IF NOT EXISTS vault (
+    uid TEXT PRIMARY KEY,
+    nonce BLOB NOT NULL,
+    cifrado BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS historial (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    linea TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_historial_chat_ts ON historial(chat_id, ts);
+"""
+
+
+def usar_sqlite():
+    return os.environ.get("GWC_BACKEND", "").strip().lower() == "sqlite"
+
+
+def _nick_norm(datos):
+    from ghostwhisperchat.core.utilidades import normalize_text
+    nick = datos.get("nick") if isinstance(datos, dict) else None
+    return normalize_text(nick) if nick else None
+
+
+class BaseSQLite:
+    def __init__(self, ruta=DB_FILE):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Una conexión por proceso compartida entre hilos, serializada con _lock
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")   # En WAL: durable al checkpoint, sin fsync por commit
+            self._conn.executescript(ESQUEMA)
+        try: os.chmod(ruta, 0o600)
+        except OSError: pass
+
+    @contextlib.contextmanager
+    def transaccion(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def consultar(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Meta ---
+
+    def meta(self, clave, defecto=None):
+        filas = self.consultar("SELECT valor FROM meta WHERE clave = ?", (clave,))
+        return filas[0][0] if filas else defecto
+
+    def set_meta(self, clave, valor):
+        with self.transaccion() as c:
+            c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, str(valor)))
+
+    # --- Contactos ---
+
+    def cargar_contactos(self):
+        return {uid: json.loads(datos) for uid, datos in self.consultar("SELECT uid, datos FROM contactos")}
+
+    def guardar_contactos(self, cambios, borrados=(), reemplazar=False):
+        """Upsert de {uid: datos} y borrado de uids, en una transacción."""
+        with self.transaccion() as c:
+            if reemplazar:
+                c.execute("DELETE FROM contactos")
+            c.executemany("DELETE FROM contactos WHERE uid = ?", [(uid,) for uid in borrados])
+            c.executemany(
+                "INSERT OR REPLACE INTO contactos (uid, nick_norm, onion, datos) VALUES (?, ?, ?, ?)",
+                [(uid, _nick_norm(d), d.get("onion") if isinstance(d, dict) else None, json.dumps(d))
+                 for uid, d in cambios.items()])
+
+    def buscar_contactos_nick(self, nick_norm):
+        return {uid: json.loads(d) for uid, d in
+                self.consultar("SELECT uid, datos FROM contactos WHERE nick_norm = ?", (nick_norm,))}
+
+    def buscar_contacto_onion(self, onion):
+        filas = self.consultar("SELECT uid, datos FROM contactos WHERE onion = ? LIMIT 1", (onion,))
+        return (filas[0][0], json.loads(filas[0][1])) if filas else (None, None)
+
+    # --- Vault (filas ya cifradas por core/cripto_vault.py) ---
+
+    def cargar_vault(self):
+        return self.consultar("SELECT uid, nonce, cifrado FROM vault")
+
+    def guardar_vault(self, filas, borrados=(), reemplazar=False):
+        with self.transaccion() as c:
+            if reemplazar:
+                c.execute("DELETE FROM vault")
+            c.executemany("DELETE FROM vault WHERE uid = ?", [(uid,) for uid in borrados])
+            c.executemany("INSERT OR REPLACE INTO vault (uid, nonce, cifrado) VALUES (?, ?, ?)", filas)
+
+    # --- Historial ---
+
+    def agregar_historial(self, chat_id, linea, ts=None):
+        with self._lock:
+            self._conn.execute("INSERT INTO historial (chat_id, ts, linea) VALUES (?, ?, ?)",
+                               (chat_id, ts if ts is not None else time.time(), linea))
+
+    def ultimas_historial(self, chat_id, n):
+        filas = self.consultar(
+            "SELECT linea FROM historial WHERE chat_id = ? ORDER BY ts DESC, id DESC LIMIT ?", (chat_id, n))
+        return [f[0] for f in reversed(filas)]
+
+    def total_historial(self, chat_id):
+        return self.consultar("SELECT COUNT(*) FROM historial WHERE chat_id = ?", (chat_id,))[0][0]
+
+    def recortar_historial(self, chat_id, retener):
+        """Borra las líneas más viejas dejando `retener`. Retorna las borradas."""
+        with self.transaccion() as c:
+            fila = c.execute("SELECT ts, id FROM historial WHERE chat_id = ? ORDER BY ts DESC, id DESC "
+                             "LIMIT 1 OFFSET ?", (chat_id, retener - 1)).fetchone()
+            if not fila:
+                return 0
+            return c.execute("DELETE FROM historial WHERE chat_id = ? AND (ts < ? OR (ts = ? AND id < ?))",
+                             (chat_id, fila[0], fila[0], fila[1])).rowcount
+
+
+def migrar_desde_json(base):
+    """
+    Importa una sola vez contacts.json, vault.enc y history/ a la base.
+    Los archivos originales no se tocan (respaldo / volver a GWC_BACKEND=json).
+    """
+    if base.meta("migrado_json"):
+        return
+    t0 = time.time()
+    resumen = []
+
+    from ghostwhisperchat.datos import contactos
+    if os.path.exists(contactos.CONTACTS_FILE):
+        try:
+            with open(contactos.CONTACTS_FILE, 'r', encoding='utf-8') as f:
+                agenda = json.load(f)
+            if isinstance(agenda, dict):
+                base.guardar_contactos(agenda)
+                resumen.append(f"{len(agenda)} contactos")
+        except (OSError, ValueError) as e:
+            print(f"[SQLITE] contacts.json no migrado: {e}", file=sys.stderr)
+
+    try:
+        from ghostwhisperchat.core import cripto_vault
+        vault = cripto_vault._leer_archivo()
+        if vault:
+            base.guardar_vault([cripto_vault._cifrar_fila(uid, e) for uid, e in vault.items()])
+            resumen.append(f"{len(vault)} entradas de vault")
+    except Exception as e:
+        print(f"[SQLITE] vault.enc no migrado: {e}", file=sys.stderr)
+
+    from ghostwhisperchat.core.estado import HISTORY_DIR
+    from ghostwhisperchat.core.historial import HistorialChats
+    if os.path.isdir(HISTORY_DIR):
+        hist = HistorialChats(HISTORY_DIR)
+        lineas = 0
+        for nombre in sorted(os.listdir(HISTORY_DIR)):
+            chat_id = nombre[:-4] if nombre.endswith(".log") else nombre
+            previas, total = hist.ultimas(chat_id, 10 ** 9)
+            if not previas:
+                continue
+            # Sin timestamps por línea en el formato previo: se conserva el orden
+            ts0 = t0 - len(previas)
+            with base.transaccion() as c:
+                c.executemany("INSERT INTO historial (chat_id, ts, linea) VALUES (?, ?, ?)",
+                              [(chat_id, ts0 + i, l) for i, l in enumerate(previas)])
+            lineas += len(previas)
+        if lineas:
+            resumen.append(f"{lineas} líneas de historial")
+
+    base.set_meta("migrado_json", int(t0))
+    print(f"[SQLITE] Migración inicial: {', '.join(resumen) or 'sin datos previos'} "
+          f"({time.time() - t0:.2f}s)", file=sys.stderr)
+
+
+_base = None
+_base_lock = threading.Lock()
+
+
+def base():
+    """BaseSQLite del proceso (abre y migra al primer uso)."""
+    global _base
+    if _base is None:
+        with _base_lock:
+            if _base is None:
+                b = BaseSQLite()
+                migrar_desde_json(b)
+                _base = b
+    return _base
@@ -1,76 +1,266 @@
 # /usr/lib/ghostwhisperchat/datos/contactos.py
 # Gestión de Agenda de Contactos
+#
+# AlmacenContactos es la única fuente de verdad de la agenda por proceso:
+# contacts.json se lee una vez y todas las consultas van a RAM.
+# Las escrituras marcan la agenda como sucia y un timer la persiste en bloque
+# (tmp + fsync + rename). Si lo único que cambió es `last_seen` (cada paquete
+# recibido lo actualiza), el flush espera la ventana larga VENTANA_LAST_SEEN:
+# perder unos segundos de last_seen en un corte no importa.
+# MemoriaGlobal.contactos es el dict de este almacén (ver core/estado.py).
+# La agenda es una TablaIndexada (core/indices.py): índices por nick, prefijo,
+# onion e IP que se mantienen en cada actualizar/eliminar.
+# Con GWC_BACKEND=sqlite (AlmacenContactosSQLite) el flush solo escribe las
+# filas de los uids modificados (ver datos/base_sqlite.py).
 
 import json
 import os
-import shutil
+import sys
 import time
+import atexit
+import threading
+
+from ghostwhisperchat.core.indices import tabla_contactos
 
 CONTACTS_FILE = os.path.expanduser("~/.ghostwhisperchat/contacts.json")
 
+FLUSH_DEBOUNCE = 2.0          # Cambios reales (nick, estado, altas/bajas)
+VENTANA_LAST_SEEN = 60.0      # Cambios que solo tocan last_seen
+CAMPOS_EFIMEROS = ("last_seen",)
+
+
+class AlmacenContactos:
+    def __init__(self, ruta=CONTACTS_FILE):
+        self.ruta = ruta
+        self.datos = tabla_contactos()     # uid -> dict (el mismo objeto que MemoriaGlobal.contactos)
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._sucio = False                # Hay cambios reales sin persistir
+        self._sucio_efimero = False        # Solo cambió last_seen
+        self._uids_sucios = set()          # uids tocados desde el último flush
+        self._todo_sucio = False           # `datos` se modificó directamente: reescribir todo
+        self._timer = None
+        self._t_limite = None              # Momento en que dispara el timer actual
+        self.stats = {"flushes": 0, "coalescidos": 0}
+        self.cargar()
+
+    # --- Lectura (RAM) ---
+
+    def cargar(self):
+        """Lee la agenda a RAM (reemplaza el contenido sin cambiar el dict)."""
+        datos = self._leer()
+        with self._lock:
+            self.datos.clear()
+            self.datos.update(datos if isinstance(datos, dict) else {})
+            self._sucio = self._sucio_efimero = self._todo_sucio = False
+            self._uids_sucios.clear()
+
+    def _leer(self):
+        if not os.path.exists(self.ruta):
+            return {}
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def obtener(self, uid):
+        with self._lock:
+            return self.datos.get(uid)
+
+    def copia(self):
+        with self._lock:
+            return {uid: dict(c) if isinstance(c, dict) else c for uid, c in self.datos.items()}
+
+    # --- Escritura (marca sucio + flush diferido) ---
+
+    def actualizar(self, uid, contacto):
+        """Guarda el contacto. Si solo cambió last_seen, el flush se agrupa en la ventana larga."""
+        with self._lock:
+            previo = self.datos.get(uid)
+            self.datos[uid] = contacto
+            self._uids_sucios.add(uid)
+            if isinstance(previo, dict) and all(previo.get(k) == v for k, v in contacto.items()
+                                                if k not in CAMPOS_EFIMEROS) and previo.keys() == contacto.keys():
+                self._sucio_efimero = True
+                self.stats["coalescidos"] += 1
+                self._programar_flush(VENTANA_LAST_SEEN)
+            else:
+                self._sucio = True
+                self._programar_flush(FLUSH_DEBOUNCE)
+
+    def eliminar(self, uid):
+        with self._lock:
+            if self.datos.pop(uid, None) is None:
+                return False
+            self._uids_sucios.add(uid)
+            self._sucio = True
+            self._programar_flush(FLUSH_DEBOUNCE)
+            return True
+
+    def reemplazar(self, datos):
+        with self._lock:
+            self.datos.clear()
+            self.datos.update(datos)
+            self.marcar_sucio()
+
+    def marcar_sucio(self):
+        """Para quien modificó `datos` directamente (pop, clear...): se reescribe todo."""
+        with self._lock:
+            self._sucio = True
+            self._todo_sucio = True
+            self._programar_flush(FLUSH_DEBOUNCE)
+
+    def _programar_flush(self, retardo):
+        """Un solo timer: si ya hay uno que dispara antes, se agrupa con él (llamar con _lock)."""
+        limite = time.time() + retardo
+        if self._timer is not None:
+            if self._t_limite <= limite:
+                return
+            self._timer.cancel()
+        self._t_limite = limite
+        self._timer = threading.Timer(retardo, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Persiste si hay cambios pendientes (tmp + fsync + rename). Llamar también al apagar."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = self._t_limite = None
+                if not (self._sucio or self._sucio_efimero):
+                    return True
+                snapshot = self._snapshot()
+                uids, todo = set(self._uids_sucios), self._todo_sucio
+                self._sucio = self._sucio_efimero = self._todo_sucio = False
+                self._uids_sucios.clear()
+            if self._escribir(snapshot):
+                self.stats["flushes"] += 1
+                return True
+            # Reintentar en el próximo flush
+            with self._lock:
+                self._sucio = True
+                self._todo_sucio = self._todo_sucio or todo
+                self._uids_sucios.update(uids)
+                self._programar_flush(FLUSH_DEBOUNCE)
+            return False
+
+    def _snapshot(self):
+        """Lo que se persiste (llamar con _lock): el JSON completo."""
+        return json.dumps(self.datos)
+
+    def _escribir(self, contenido):
+        tmp_file = self.ruta + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.ruta)
+            # fsync del directorio: el rename queda persistido
+            fd = os.open(os.path.dirname(self.ruta), os.O_RDONLY)
+            try: os.fsync(fd)
+            finally: os.close(fd)
+            return True
+        except OSError as e:
+            print(f"[CONTACTOS] Error guardando {self.ruta}: {e}", file=sys.stderr)
+            return False
+
+
+class AlmacenContactosSQLite(AlmacenContactos):
+    """Misma API; persiste en la tabla `contactos` de gwc.db fila por fila."""
+
+    def __init__(self, base):
+        self.base = base
+        super().__init__(ruta=base.ruta)
+
+    def _leer(self):
+        return self.base.cargar_contactos()
+
+    def _snapshot(self):
+        if self._todo_sucio:
+            return (dict(self.datos), (), True)
+        cambios = {uid: self.datos[uid] for uid in self._uids_sucios if uid in self.datos}
+        return (cambios, [uid for uid in self._uids_sucios if uid not in self.datos], False)
+
+    def _escribir(self, snapshot):
+        cambios, borrados, reemplazar = snapshot
+        try:
+            self.base.guardar_contactos(cambios, borrados, reemplazar=reemplazar)
+            return True
+        except Exception as e:
+            print(f"[CONTACTOS] Error guardando en SQLite: {e}", file=sys.stderr)
+            return False
+
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def almacen():
+    """AlmacenContactos del proceso (se crea al primer uso, según GWC_BACKEND)."""
+    global _almacen
+    if _almacen is None:
+        with _almacen_lock:
+            if _almacen is None:
+                from ghostwhisperchat.datos.base_sqlite import usar_sqlite, base
+                _almacen = AlmacenContactosSQLite(base()) if usar_sqlite() else AlmacenContactos()
+                atexit.register(_almacen.flush)
+    return _almacen
+
+
 def cargar_contactos():
-    if not os.path.exists(CONTACTS_FILE):
-        return {}
-    
-    try:
-        with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {}
+    return almacen().copia()
 
 def guardar_contactos(contactos_dict):
-    tmp_file = CONTACTS_FILE + ".tmp"
-    try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(contactos_dict, f, indent=4)
-        shutil.move(tmp_file, CONTACTS_FILE)
-    except OSError:
-        pass
+    almacen().reemplazar(contactos_dict)
 
 def agregar_contacto(uid, nick, ip, onion=None):
     """
     Registra un contacto conocido con su IP local y/o dirección Onion.
     """
-    agenda = cargar_contactos()
-    
-    contacto_previo = agenda.get(uid, {})
+    agenda = almacen()
+
+    contacto_previo = agenda.obtener(uid) or {}
     onion_final = onion if onion else contacto_previo.get("onion")
-    
-    agenda[uid] = {
+
+    agenda.actualizar(uid, {
         "nick": nick,
         "last_ip": ip,
         "onion": onion_final,
         "last_seen": time.time(),
         "trusted": contacto_previo.get("trusted", False),
         "blocked": contacto_previo.get("blocked", False)
-    }
-    
-    guardar_contactos(agenda)
+    })
 
 def bloquear_contacto(uid):
-    agenda = cargar_contactos()
-    if uid in agenda:
-        agenda[uid]["blocked"] = True
-        guardar_contactos(agenda)
+    agenda = almacen()
+    contacto = agenda.obtener(uid)
+    if contacto is not None:
+        agenda.actualizar(uid, dict(contacto, blocked=True))
 
 def es_bloqueado(uid):
-    agenda = cargar_contactos()
-    if uid in agenda:
-        return agenda[uid].get("blocked", False)
+    contacto = almacen().obtener(uid)
+    if contacto:
+        return contacto.get("blocked", False)
     return False
 
 def obtener_nick_conocido(uid):
-    agenda = cargar_contactos()
-    if uid in agenda:
-        return agenda[uid].get("nick")
+    contacto = almacen().obtener(uid)
+    if contacto:
+        return contacto.get("nick")
     return None
 
 def buscar_contacto_por_onion(onion_addr):
     """Busca en la agenda si existe un contacto con la dirección .onion dada"""
-    agenda = cargar_contactos()
-    for uid, data in agenda.items():
-        if data.get("onion") == onion_addr:
-            return uid, data
+    agenda = almacen().datos
+    for uid in agenda.uids("onion", onion_addr.lower() if onion_addr else ""):
+        data = agenda.get(uid)
+        if isinstance(data, dict) and data.get("onion") == onion_addr:
+            return uid, dict(data)
     return None, None
 
 def eliminar_contacto(nick_o_uid):
@@ -78,7 +268,7 @@ def eliminar_contacto(nick_o_uid):
     Elimina un contacto de la agenda buscando por nick (case-insensitive) o por uid exacto.
     Retorna el nick eliminado si tuvo éxito, o None si no se encontró.
     """
-    agenda = cargar_contactos()
+    agenda = almacen().copia()
     uid_a_borrar = None
     nick_encontrado = None
 
@@ -95,8 +285,7 @@ def eliminar_contacto(nick_o_uid):
                 break
 
     if uid_a_borrar:
-        del agenda[uid_a_borrar]
-        guardar_contactos(agenda)
+        almacen().eliminar(uid_a_borrar)
         return nick_encontrado
 
     return None
@@ -106,7 +295,7 @@ def eliminar_todos_contactos():
     Elimina toda la agenda de contactos.
     Retorna el número de contactos eliminados.
     """
-    agenda = cargar_contactos()
-    total = len(agenda)
-    guardar_contactos({})
+    agenda = almacen()
+    total = len(agenda.datos)
+    agenda.reemplazar({})
     return total
@@ -150,6 +150,12 @@ AYUDA = f"""
   {Colores.GREEN}--archivo <Ruta>{Colores.RESET} ............. Enviar archivo (Soporta Drag & Drop).
         {Colores.GREY}[Alias: -f, --enviar]{Colores.RESET}
 
+  {Colores.GREEN}--transferencias{Colores.RESET} ............. Ver envíos de archivos en curso y su progreso.
+        {Colores.GREY}[Alias: -t, --envios, --transfers]{Colores.RESET}
+
+  {Colores.GREEN}--cancelar <ID>{Colores.RESET} .............. Cancelar un envío de archivo en curso.
+        {Colores.GREY}[Alias: --cancelar-envio, --cancel]{Colores.RESET}
+
   {Colores.GREEN}--imagen <Ruta>{Colores.RESET} .............. Enviar imagen visual (ASCII) y original.
         {Colores.GREY}[Alias: -i, --foto, --pic]{Colores.RESET}
 
@@ -204,6 +210,10 @@ ABBREVIATIONS_DISPLAY = {
             'aliases': ['--silenciar', '-m', '--shh', '--nomolestar', '--mute'],
             'desc': "[Switch] Activar/Desactivar notificaciones."
         },
+        "DIFUSIÓN GOSSIP": {
+            'aliases': ['--gossip', '--difusion', '--epidemico'],
+            'desc': "[Switch] En grupos grandes: cada mensaje sale a unos pocos miembros y ellos lo reenvían."
+        },
         "LISTAR ASISTENTES": {
             'aliases': ['--ls', '-l', '--gente', '--lista', '--usuarios'],
             'desc': "Ver quiénes están en el chat actual."
@@ -254,6 +264,14 @@ ABBREVIATIONS_DISPLAY = {
             'aliases': ['--archivo', '-f', '--enviar', '--mandar', '--adjuntar'],
             'desc': "Enviar un archivo a la sala actual (puedes arrastrarlo al chat para la ruta)."
         },
+        "VER TRANSFERENCIAS": {
+            'aliases': ['--transferencias', '-t', '--envios', '--transfers'],
+            'desc': "Listar los envíos de archivos (ID, estado, progreso)."
+        },
+        "CANCELAR TRANSFERENCIA": {
+            'aliases': ['--cancelar', '--cancelar-envio', '--cancel'],
+            'desc': "Cancelar un envío en curso. Uso: --cancelar <ID>"
+        },
         "ENVIAR IMAGEN ASCII": {
             'aliases': ['--imagen', '-P', '--foto', '--picture', '-i'],
             'desc': "Mandar foto como Arte ASCII. Uso: --imagen <ruta> <opcional:ancho>"
@@ -305,6 +323,7 @@ COMMAND_MAP = {
     'ACCEPT':       ['--aceptar'],
     'DENY':         ['--rechazar'],
     'MUTE_TOGGLE':  ['--silenciar', '-m', '--shh', '--nomolestar', '--mute'],
+    'GOSSIP_TOGGLE':['--gossip', '--difusion', '--epidemico'],
     'LS':           ['--ls', '-l', '--gente', '--lista', '--usuarios'],
     'EXIT':         ['--salir', '-x', '--chau', '--adios', '--exit'],
     'MY_ID':            ['--mi-id', '--onion', '--mi-onion', '--id-global', '--gwc-id'],
@@ -317,6 +336,8 @@ COMMAND_MAP = {
     'PRIVACY_POLICY':   ['--privacidad', '--priv', '--compartir'],
     'VISIBILITY_TOGGLE':['--invisible', '-v', '--fantasma', '--oculto', '--visibilidad'],
     'FILE':         ['--archivo', '-f', '--enviar', '--mandar', '--adjuntar', '--file'],
+    'TRANSFERS':    ['--transferencias', '-t', '--envios', '--transfers'],
+    'TRANSFER_CANCEL': ['--cancelar', '--cancelar-envio', '--cancel'],
     'IMAGE':        ['--imagen', '-i', '--foto', '--picture', '-P'],
     'CHANGE_NICK':  ['--cambiarnombre', '-n', '--nick', '--apodo', '--nombre'],
     'STATUS':       ['--estado', '-e', '--situacion', '--mood', '--st'],
@@ -14,6 +14,8 @@ def signal_handler(sig, frame):
 
 def main():
     signal.signal(signal.SIGINT, signal_handler)
+    # SIGTERM (systemd stop) también sale limpio: permite el flush final del vault
+    signal.signal(signal.SIGTERM, signal_handler)
     
     # 2. Inicializar Memoria (Maneja su propia persistencia)
     memoria = MemoriaGlobal()
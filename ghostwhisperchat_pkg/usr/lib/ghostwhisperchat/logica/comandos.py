@@ -57,4 +57,33 @@ def obtener_ayuda_comando(cmd_raw=None):
     
     return f"No se encontró ayuda para '{cmd_raw}'. Escribe --ayuda para ver todo."
 
+# --- Sugerencias de comandos (autocompletado y comandos desconocidos) ---
+# Índices de prefijos y trigramas sobre todos los alias de COMMAND_MAP,
+# armados una sola vez (ver core/indices.py).
+_tabla_alias = None
+
+def _alias_indexados():
+    global _tabla_alias
+    if _tabla_alias is None:
+        from ghostwhisperchat.core.indices import TablaIndexada, trigramas
+        indices = {
+            "alias": lambda d: (d["alias"],),
+            "prefijo": lambda d: tuple(d["alias"][:i] for i in range(1, len(d["alias"]) + 1)),
+            "trigrama": lambda d: trigramas(d["alias"]),
+        }
+        _tabla_alias = TablaIndexada(indices, {a: {"alias": a} for aliases in COMMAND_MAP.values() for a in aliases})
+    return _tabla_alias
+
+def comandos_con_prefijo(prefijo):
+    """Alias que empiezan con `prefijo`, ordenados."""
+    return sorted(_alias_indexados().uids("prefijo", prefijo))
+
+def sugerir_comandos(texto, n=3, minimo=0.55):
+    """Alias más parecidos a `texto` (mismo criterio que difflib.get_close_matches)."""
+    # Son pocos alias: se puntúan todos (cupo = tabla entera) con el ratio de difflib
+    # sin el atajo de "contiene", así el resultado es el de get_close_matches
+    tabla = _alias_indexados()
+    return [a for _, a in tabla.similares(texto, minimo=minimo, limite=n, indice_texto="alias",
+                                          contiene=False, cupo=len(tabla))]
+
 from ghostwhisperchat.datos.recursos import Colores
@@ -1,32 +1,71 @@
 # /usr/lib/ghostwhisperchat/logica/motor.py
 # Motor Principal (Event Loop) - Refactor v2.1
 
-import select
 import socket
 import os
 import time
 import sys
 import threading
-from ghostwhisperchat.core.estado import MemoriaGlobal
+import weakref
+import collections
+from ghostwhisperchat.core.estado import MemoriaGlobal, PEER_TIMEOUT
 from ghostwhisperchat.core.transporte import GestorRed
-from ghostwhisperchat.core.protocolo import empaquetar, desempaquetar
+from ghostwhisperchat.core.despachador import DespachadorSalida
+from ghostwhisperchat.core.rutas import TablaRutas, INTERVALO_IP_LOCAL
+from ghostwhisperchat.core.reactor import Reactor, TIPO_UDP, TIPO_LISTENER, TIPO_UI, TIPO_IPC
+from ghostwhisperchat.core.protocolo import empaquetar, desempaquetar, reenviable
+from ghostwhisperchat.core.tramas import LectorTramas
+from ghostwhisperchat.core.tramas import EventoBinario, BIN_INI, BIN_DATOS
 from ghostwhisperchat.core.launcher import abrir_chat_ui
 from ghostwhisperchat.logica.comandos import parsear_comando, obtener_ayuda_comando
 from ghostwhisperchat.datos.recursos import AYUDA, ABBREVIATIONS_DISPLAY, Colores
 from ghostwhisperchat.logica import grupos
+from ghostwhisperchat.logica import difusion
+from ghostwhisperchat.logica.transferencias import GestorTransferencias
 from ghostwhisperchat.core.utilidades import enviar_notificacion, preguntar_invitacion_chat
 
 IPC_SOCK_PATH = os.path.expanduser("~/.ghostwhisperchat/gwc.sock")
 
+# Temporizadores del reactor (ver "Temporizadores" más abajo)
+INTERVALO_PING = 15.0           # DISCOVER/PING por broadcast
+INTERVALO_TOR_WATCHDOG = 60.0   # Salud del SOCKS5 de Tor
+ACK_TIMEOUT = 60.0              # 60s: ida Tor (~15-30s) + ACK de vuelta (~15-30s) + margen
+KEEPALIVE_IDLE = 45.0           # Segundos sin tráfico en un chat antes de enviar CHAT_KEEP
+INTERVALO_PURGA_POOL = 10.0     # Cierre de conexiones ociosas del pool TCP
+SMART_INTERVALO = 0.2           # Revisión de scan_buffer tras WHO_NAME (_resolver_objetivo_smart)
+SMART_REVISIONES = 8            # ~1.6s de espera total
+TYPING_INTERVALO_MIN = 1.5      # Mínimo entre TYPING salientes por chat (el UI refresca cada 2s)
+TYPING_EXPIRA = 3.5             # Un "escribiendo..." recibido caduca si no se refresca
+SYNC_PLAZO = 90.0               # Plazo global de la unión a la malla tras SYNC
+SYNC_REINTENTO = 60.0           # Espera antes de reintentar miembros fallidos (x intento)
+SYNC_MAX_INTENTOS = 3
+SYNC_CONCURRENCIA = 4           # Connects de la unión en vuelo a la vez (el resto espera en cola)
+
 class Motor:
     def __init__(self):
         self.memoria = MemoriaGlobal()
         self.red = GestorRed()
+        # Reactor selectors/epoll: sockets registrados una vez con su handler
+        self.reactor = Reactor()
+        self.red.set_reactor(self.reactor, self._on_tcp_legible)
+        # Rutas LAN/Onion por peer (cache con TTL, sondeo en segundo plano)
+        self.rutas = TablaRutas()
+        self.memoria.al_cambiar_ip = lambda uid, onion, ip_ant, ip_nueva: self.rutas.invalidar_peer(onion)
+        # Expiración por peer en el reactor (sin barrer la tabla)
+        self.memoria.al_nuevo_peer = self._agendar_expiracion_peer
+        # Envíos salientes: pool acotado de workers + cola FIFO por destino.
+        # Un envío fallido invalida la ruta cacheada hacia ese host.
+        self.despachador = DespachadorSalida(self.red, al_fallar=self.rutas.invalidar_destino)
+        # Envío de archivos en hilos propios (el bucle solo encola)
+        self.transferencias = GestorTransferencias(self)
         self.ipc_sock = None
         self.tor = None
         
         # Buffer de TCP para evitar fragmentacion (10MB packets)
+        # { socket: LectorTramas } -> recv_into + tramas v3 (largo) o v2 (newline)
         self.tcp_buffers = {}
+        # { socket: estado } -> FILE_CHUNK binario (v4) en recepción por ese socket
+        self.rx_binario = {}
         
         # Actividad para notificaciones inteligentes (3 min cooldown)
         self.last_activity = {} # chat_id -> timestamp
@@ -34,7 +73,7 @@ class Motor:
         
         # Mapeo de UI Sockets: { "ID_CHAT": socket_ipc }
         self.ui_sessions = {} 
-        self.ui_buffers = {} # v2.156: Buffer bytes para IPC UI 
+        self.ui_buffers = {} # v2.156: Buffer para IPC UI { socket: LectorTramas } 
         
         # Buffer efímero para resultados de escaneo (--enlinea)
         self.scan_buffer = []
@@ -53,7 +92,10 @@ class Motor:
         self.mention_cooldowns = {}
         
         # Typing Status Tracking: { chat_id: { uid: (timestamp, nick) } }
+        # Cada entrada caduca con su temporizador (_timers_typing), no al recibir otro TYPING.
         self.typing_states = {}
+        # Typing saliente coalescido por chat: { chat_id: {"enviado", "t", "pendiente", "timer"} }
+        self.typing_salida = {}
         self.chat_requests_status = {}
         
         # Handshake 3 vías: guarda si llegó CHAT_READY del emisor { uid: True }
@@ -68,6 +110,19 @@ class Motor:
         # Se limpia cuando llega MSG_ACK o pasado el timeout de confirmación.
         self.pending_ack = {} 
 
+        # Temporizadores individuales del reactor: { uid | mid | chat_id: Temporizador }
+        self._timers_peer = {}
+        self._timers_ack = {}
+        self._timers_keepalive = {}
+        self._timers_typing = {}    # { (chat_id, uid): Temporizador }
+
+        # Grupos en modo gossip: mids de MSG ya recibidos/reenviados (logica/difusion.py)
+        self.vistos_grupo = difusion.CacheVistos()
+
+        # Sesiones de conexión entrantes (core/protocolo.py): { socket: {sid: origen} }
+        # Se van solas al cerrarse/liberarse el socket.
+        self.sesiones_rx = weakref.WeakKeyDictionary()
+
     def iniciar_ipc(self):
         if os.path.exists(IPC_SOCK_PATH):
             try:
@@ -84,9 +139,9 @@ class Motor:
         """Loop principal del Demonio"""
         print("[*] Iniciando Motor GWC v2.1...", file=sys.stderr)
         
-        # Determine local IP and Identity
-        from ghostwhisperchat.core.utilidades import get_local_ip
-        local_ip = get_local_ip()
+        # Determine local IP and Identity (cacheada en la tabla de rutas)
+        self.rutas.refrescar_ip_local(forzar=True)
+        local_ip = self.rutas.ip_local()
         self.memoria.mi_ip = local_ip
         print(f"[*] Identidad: {self.memoria.mi_nick} ({self.memoria.mi_uid}) @ {local_ip}", file=sys.stderr)
 
@@ -101,6 +156,7 @@ class Motor:
             port_group=self.red.real_port_group
         )
         print(f"[*] Puertos Dinamicos: Priv={self.red.real_port_priv}, Group={self.red.real_port_group}", file=sys.stderr)
+        self.rutas.puerto_propio = self.red.real_port_priv
 
         # Iniciar Capa Tor (WAN P2P Overlay) en segundo plano
         try:
@@ -111,109 +167,34 @@ class Motor:
                 if self.tor.iniciar():
                     self.memoria.mi_onion = self.tor.onion_address
                     self.red.set_socks_proxy(self.tor.socks_host, self.tor.socks_port)
+                    self.rutas.tor_disponible = True
                     self.memoria.guardar_configuracion()
                     print(f"[*] Red Global Activa: {self.tor.onion_address}", file=sys.stderr)
-                    # Iniciar watchdog de salud Tor y keepalive de sesiones
-                    threading.Thread(target=self._hilo_tor_watchdog, daemon=True).start()
-                    threading.Thread(target=self._hilo_keepalive_chat, daemon=True).start()
+                    # Watchdog de salud Tor (los keepalive de sesión van por chat, ver _agendar_keepalive)
+                    self.reactor.llamar_en(INTERVALO_TOR_WATCHDOG, self._vigilar_tor)
                 else:
                     print(f"[*] Red Global no activa ({self.tor.status_message}). Modo Local.", file=sys.stderr)
 
             threading.Thread(target=_iniciar_tor_async, daemon=True).start()
-            # Hilo de timeout de ACK: opera independiente de Tor (también cubre LAN)
-            threading.Thread(target=self._hilo_ack_timeout, daemon=True).start()
         except Exception as e:
             print(f"[!] No se pudo cargar gestor de red Global: {e}", file=sys.stderr)
 
         self.iniciar_ipc()
         self.running = True
         
-        # Start PING thread
-        threading.Thread(target=self._hilo_ping, daemon=True).start()
-        
         print(f"[MOTOR_DEBUG] Entrando a Bucle Principal. Running={self.running}", file=sys.stderr)
         
+        # Registro único en el reactor: cada socket con su handler tipado
+        self.reactor.registrar(self.red.sock_udp, TIPO_UDP, self._on_udp_legible)
+        self.reactor.registrar(self.red.sock_tcp_group, TIPO_LISTENER, self._on_listener_legible)
+        self.reactor.registrar(self.red.sock_tcp_priv, TIPO_LISTENER, self._on_listener_legible)
+        self.reactor.registrar(self.ipc_sock, TIPO_IPC, self._on_ipc_legible)
+        self._iniciar_temporizadores()
+        
         try:
             while self.running:
-                sockets_red = self.red.get_sockets_lectura()
-                sockets_ui = list(self.ui_sessions.values())
-                rlist = sockets_red + [self.ipc_sock] + sockets_ui
-                
-                try:
-                    readable, _, _ = select.select(rlist, [], [], 2.0)
-                except select.error as e:
-                    if e.args[0] == 4: continue
-                    raise e
-                    
-                for s in readable:
-                    if s == self.ipc_sock:
-                        try:
-                            conn, _ = s.accept()
-                            conn.setblocking(True) 
-                            data = conn.recv(4096)
-                            if data:
-                                self.procesar_ipc_mensaje(data.decode('utf-8').strip(), conn)
-                            else:
-                                conn.close()
-                        except: pass
-                    
-                    elif s in sockets_ui:
-                        try:
-                            # FIX v2.156: Lectura Stream con Acumulacion (Igual que Cliente)
-                            data = s.recv(16777216)
-                            if data:
-                                if s not in self.ui_buffers: self.ui_buffers[s] = b""
-                                self.ui_buffers[s] += data
-                                
-                                # Procesar lineas completas
-                                while b'\n' in self.ui_buffers[s]:
-                                    line_bytes, self.ui_buffers[s] = self.ui_buffers[s].split(b'\n', 1)
-                                    if not line_bytes: continue
-                                    
-                                    try:
-                                        msg_str = line_bytes.decode('utf-8').strip()
-                                        if msg_str: self.procesar_input_chat_ui(s, msg_str)
-                                    except: pass
-                            else:
-                                if s in self.ui_buffers: del self.ui_buffers[s]
-                                self.desconectar_ui(s)
-                        except: 
-                            if s in self.ui_buffers: del self.ui_buffers[s]
-                            self.desconectar_ui(s)
-    
-                    elif s == self.red.sock_udp:
-                        try:
-                            data, addr = s.recvfrom(65535)
-                            self.manejar_paquete_udp(data, addr)
-                        except Exception as e:
-                           print(f"[UDP_ERR] {e}", file=sys.stderr)
-
-                    elif s == self.red.sock_tcp_group or s == self.red.sock_tcp_priv:
-                         self.red.aceptar_conexion(s) 
-
-                    else: 
-                        try:
-                            # FIX v2.152: Aumentar buffer TCP RED a 16MB para coincidir con UI
-                            data = s.recv(16777216)
-                            if data:
-                                if s not in self.tcp_buffers: self.tcp_buffers[s] = b""
-                                self.tcp_buffers[s] += data
-                                
-                                while b'\n' in self.tcp_buffers[s]:
-                                    line, self.tcp_buffers[s] = self.tcp_buffers[s].split(b'\n', 1)
-                                    if line: self.manejar_paquete_tcp(line, s)
-                            else:
-                                # Connection Closed
-                                if s in self.tcp_buffers:
-                                    if self.tcp_buffers[s].strip():
-                                        self.manejar_paquete_tcp(self.tcp_buffers[s], s)
-                                    del self.tcp_buffers[s]
-                                self.red.cerrar_tcp(s)
-                        except: 
-                            if s in self.tcp_buffers: del self.tcp_buffers[s]
-                            self.red.cerrar_tcp(s)
-
-                self.tareas_mantenimiento()
+                # Duerme hasta el próximo evento o temporizador (PING, expiraciones, ACKs...)
+                self.reactor.procesar_eventos()
 
         except Exception as e:
              print(f"[CRASH] {e}", file=sys.stderr)
@@ -221,145 +202,339 @@ class Motor:
              traceback.print_exc(file=sys.stderr)
         finally:
              self.running = False
+             self.transferencias.cancelar_todas()
+             # Drenar envíos pendientes (LEAVE/BYE) antes de cerrar el pool
+             self.despachador.cerrar(timeout=2.0)
+             self.red.pool_close_all()
+             # Flush final de la agenda y del vault (write-behind)
+             self.memoria.flush_contactos()
+             try:
+                 from ghostwhisperchat.core.cripto_vault import flush_vault
+                 flush_vault()
+             except Exception as e:
+                 print(f"[VAULT] Error en flush final: {e}", file=sys.stderr)
+
+    # --- Handlers del Reactor (uno por tipo de socket) ---
+
+    def _on_ipc_legible(self, s):
+        try:
+            conn, _ = s.accept()
+            conn.setblocking(True) 
+            data = conn.recv(4096)
+            if data:
+                self.procesar_ipc_mensaje(data.decode('utf-8').strip(), conn)
+            else:
+                conn.close()
+        except: pass
+
+    def _on_ui_legible(self, s):
+        try:
+            # FIX v2.156: Lectura Stream con Acumulacion (Igual que Cliente)
+            lector = self.ui_buffers.get(s)
+            if lector is None:
+                lector = self.ui_buffers[s] = LectorTramas()
+            if lector.recibir(s):
+                # Procesar lineas completas
+                for linea in lector.tramas():
+                    try:
+                        msg_str = str(linea, 'utf-8').strip()
+                        if msg_str: self.procesar_input_chat_ui(s, msg_str)
+                    except: pass
+            else:
+                if s in self.ui_buffers: del self.ui_buffers[s]
+                self.desconectar_ui(s)
+        except BlockingIOError:
+            pass
+        except: 
+            if s in self.ui_buffers: del self.ui_buffers[s]
+            self.desconectar_ui(s)
+
+    def _on_udp_legible(self, s):
+        try:
+            data, addr = s.recvfrom(65535)
+            self.manejar_paquete_udp(data, addr)
+        except BlockingIOError:
+            pass
+        except Exception as e:
+           print(f"[UDP_ERR] {e}", file=sys.stderr)
+
+    def _on_listener_legible(self, s):
+        # aceptar_conexion registra el socket nuevo en el reactor (PEER_TCP)
+        self.red.aceptar_conexion(s)
+
+    def _on_tcp_legible(self, s):
+        try:
+            lector = self.tcp_buffers.get(s)
+            if lector is None:
+                lector = self.tcp_buffers[s] = LectorTramas(binario=True)
+            if lector.recibir(s):
+                for trama in lector.tramas():
+                    if isinstance(trama, EventoBinario):
+                        self.manejar_binario_tcp(trama, s)
+                    else:
+                        self.manejar_paquete_tcp(trama, s)
+                if lector.v3:
+                    # El peer habla tramas v3: responder igual por este socket
+                    self.red.marcar_socket_v3(s)
+            else:
+                # Connection Closed
+                if s in self.tcp_buffers:
+                    lector = self.tcp_buffers.pop(s)
+                    resto = lector.resto()
+                    if resto.strip() and not lector.en_binario():
+                        self.manejar_paquete_tcp(resto, s)
+                self._cerrar_rx_binario(s)
+                self.red.cerrar_tcp(s)
+        except BlockingIOError:
+            pass
+        except: 
+            if s in self.tcp_buffers: del self.tcp_buffers[s]
+            self._cerrar_rx_binario(s)
+            self.red.cerrar_tcp(s)
 
     def _resolver_host_objetivo(self, peer_o_origen):
         """
-        Determina de forma inteligente si la ruta hacia un contacto es directa por IP LAN o vía Global (WAN).
-        Si dispone de ID Onion y la IP coincide con el pool local (ej: 192.168.1.x), realiza un test de socket ultrarrápido (150ms)
-        para confirmar si el nodo está físicamente en la misma red LAN. Si no responde en LAN, conmuta automáticamente a Tor Onion.
+        Determina si la ruta hacia un contacto es directa por IP LAN o vía Global (WAN).
+        Consulta la tabla de rutas (dict + TTL): el test de socket que confirma si un peer
+        con ID Onion e IP de nuestra subred está físicamente en la LAN corre en segundo
+        plano (core/rutas.py). Mientras no esté confirmado se usa Tor Onion (o la IP
+        si este nodo no tiene Tor: rutas.tor_disponible).
         """
         if not isinstance(peer_o_origen, dict):
             return str(peer_o_origen) if peer_o_origen else None
+        return self.rutas.resolver(peer_o_origen)
 
-        onion = peer_o_origen.get('onion')
-        ip = peer_o_origen.get('ip')
-        port_priv = peer_o_origen.get('port_priv', 44494)
-
-        if onion:
-            if not ip or ip in ['127.0.0.1', 'localhost', '0.0.0.0', 'WAN', '?.?.?.?', None]:
-                return onion
-
-            from ghostwhisperchat.core.utilidades import get_local_ip
-            mi_ip = get_local_ip()
-            if mi_ip and mi_ip != '127.0.0.1' and ip != '127.0.0.1':
-                # Evitar auto-ping si DHCP nos asignó la antigua IP del contacto
-                if ip == mi_ip and port_priv == getattr(self.red, 'port_priv', 44494):
-                    return onion
-
-                sub_mi = '.'.join(mi_ip.split('.')[:3])
-                sub_peer = '.'.join(str(ip).split('.')[:3])
-                
-                # Coincidencia de subred (ej: 192.168.1.X)
-                if sub_mi == sub_peer:
-                    # Test activo (500ms): confirmar si esta fisicamente en la misma red LAN.
-                    # 150ms era muy corto para redes con algo de carga o latencia.
-                    try:
-                        import socket
-                        test_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        test_sock.settimeout(0.50)
-                        test_sock.connect((ip, port_priv))
-                        test_sock.close()
-                        return ip # Confirmado en la misma red fisica local!
-                    except Exception:
-                        pass # No esta en la misma red fisica o no responde -> Usar Onion
-
-            return onion
+    def _cerrar_ui_chat(self, uid, ui_sock):
+        """Cierra la ventana de chat de `uid` (temporizador tras CHAT_BYE) si sigue siendo la misma."""
+        if self.ui_sessions.get(uid) is not ui_sock:
+            return
+        self.reactor.quitar(ui_sock)
+        try: ui_sock.shutdown(socket.SHUT_RDWR)
+        except: pass
+        try: ui_sock.close()
+        except: pass
+        del self.ui_sessions[uid]
+        t = self._timers_keepalive.pop(uid, None)
+        if t: t.cancelar()
+
+    def _abrir_conexion(self, host, port, timeout_lan=2.0):
+        """Connect bloqueante (LAN directo o .onion vía SOCKS5). Para ejecutar_en_hilo, no en el bucle."""
+        if str(host).endswith(".onion"):
+            return self.red._conectar_socks5(host, port, timeout=40.0)
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.settimeout(timeout_lan)
+            s.connect((host, port))
+        except Exception:
+            s.close()
+            raise
+        return s
+
+    def _conectar_y_enviar(self, host, port, data):
+        """_abrir_conexion + primer paquete (newline, lo entiende cualquier versión). Para ejecutar_en_hilo."""
+        s = self._abrir_conexion(host, port, timeout_lan=5.0)
+        try:
+            s.sendall(data + b'\n')
+        except Exception:
+            s.close()
+            raise
+        return s
+
+    def _embajador_conectado(self, gid, s, error):
+        """Fin del auto-join (hilo del bucle): el socket al embajador entra al reactor."""
+        if error is not None:
+            print(f"[X] Fallo al conectar con Grupo: {error}", file=sys.stderr)
+            return
+        self.red.registrar_socket_tcp(s, f"GRP_OUT_{gid}")
 
-        return ip or '127.0.0.1'
+    def _avisar_ui(self, chat_id, texto):
+        if chat_id in self.ui_sessions:
+            try: self.ui_sessions[chat_id].sendall(f"\n[SISTEMA] {texto}\n".encode('utf-8'))
+            except: pass
 
-    def _resolver_objetivo_smart(self, target_raw):
+    def _unir_malla(self, gid, uids, intento=1):
+        """
+        Unión a la malla tras SYNC: connect + ANNOUNCE a los `uids` del grupo en el pool
+        del reactor, de a SYNC_CONCURRENCIA a la vez (no acapara los hilos que comparten
+        las demás tareas diferidas), con plazo global SYNC_PLAZO. El progreso se informa
+        en la UI del grupo; los que fallan o no llegan a tiempo (incluidos los que seguían
+        en cola) se reintentan más tarde (SYNC_REINTENTO * intento, hasta SYNC_MAX_INTENTOS).
+        """
+        from ghostwhisperchat.core.transporte import PORT_GROUP
+        g = self.memoria.grupos_activos.get(gid)
+        if not g: return
+        # Prepare ANNOUNCE packet
+        ann_pkg = empaquetar("ANNOUNCE", {"gid": gid, "user": self.memoria.get_origen()}, self.memoria.get_origen())
+        union = {"gid": gid, "intento": intento, "total": 0, "ok": 0, "ann_pkg": ann_pkg,
+                 "pendientes": set(), "fallidos": set(), "abierta": True,
+                 "cola": collections.deque(), "en_vuelo": 0}
+        
+        for uid in uids:
+            m = g.get('miembros', {}).get(uid)
+            if not m: continue
+            target_host = self._resolver_host_objetivo(m)
+            if not target_host:
+                union["fallidos"].add(uid)
+                continue
+            
+            union["pendientes"].add(uid)
+            union["cola"].append((uid, m.get('nick'), target_host, m.get('port_group') or PORT_GROUP))
+        union["total"] = len(union["pendientes"]) + len(union["fallidos"])
+        self._malla_lanzar(union)
+        
+        if not union["pendientes"]:
+            self._cerrar_union(union)
+            return
+        union["plazo"] = self.reactor.llamar_en(SYNC_PLAZO, self._cerrar_union, union)
+        if intento == 1:
+            self._avisar_ui(gid, f"[*] Conectando con {union['total']} miembros...")
+
+    def _malla_lanzar(self, union):
+        """Pasa connects de la cola al pool del reactor hasta SYNC_CONCURRENCIA en vuelo."""
+        if union["gid"] not in self.memoria.grupos_activos:
+            union["cola"].clear()   # Salimos del grupo: no seguir conectando
+        while union["cola"] and union["en_vuelo"] < SYNC_CONCURRENCIA:
+            uid, nick, host, port = union["cola"].popleft()
+            # El connect (hasta 40s por SOCKS5) corre en el pool, no en el bucle
+            print(f"[DEBUG] SYNC: Conectando a {nick} ({host})...", file=sys.stderr)
+            union["en_vuelo"] += 1
+            self.reactor.ejecutar_en_hilo(
+                self._abrir_conexion, host, port,
+                al_terminar=lambda s, e, uid=uid, host=host: self._malla_conectado(union, uid, host, s, e))
+
+    def _malla_conectado(self, union, uid, host, s, error):
+        """Fin de un connect de la unión (hilo del bucle): ANNOUNCE, alta del socket y siguiente de la cola."""
+        union["en_vuelo"] -= 1
+        self._malla_lanzar(union)
+        ann_pkg = union["ann_pkg"]
+        gid = union["gid"]
+        g = self.memoria.grupos_activos.get(gid)
+        m = g.get('miembros', {}).get(uid, {}) if g else {}
+        if error is None and not g:
+            # Salimos del grupo mientras conectaba
+            try: s.close()
+            except: pass
+            return
+        if error is None:
+            self.red.enviar_tcp(s, ann_pkg)
+            self.red.registrar_socket_tcp(s, f"GRP_PEER_{gid}_{uid}")
+            print(f"[MESH] Conectado y anunciado a {m.get('nick')}", file=sys.stderr)
+        else:
+            print(f"[MESH] Fallo conexion mesh a {host}: {error}", file=sys.stderr)
+        
+        if not union["abierta"]:
+            # Llegó después del plazo: se contó como fallido; si conectó, ya no hace falta reintentarlo
+            if error is None: union["faltan"].discard(uid)
+            return
+        union["pendientes"].discard(uid)
+        if error is None:
+            union["ok"] += 1
+            self._avisar_ui(gid, f"[+] Conectado con {m.get('nick', uid[:8])} ({union['ok']}/{union['total']})")
+        else:
+            union["fallidos"].add(uid)
+        if not union["pendientes"]:
+            self._cerrar_union(union)
+
+    def _cerrar_union(self, union):
+        """Todos respondieron o venció el plazo: resumen en la UI y reintento de los que faltan."""
+        if not union["abierta"]: return
+        union["abierta"] = False
+        union["cola"].clear()   # Los que no llegaron a lanzarse quedan en pendientes -> reintento
+        if union.get("plazo"): union["plazo"].cancelar()
+        gid = union["gid"]
+        faltan = union["faltan"] = union["fallidos"] | union["pendientes"]
+        
+        if not faltan:
+            if union["total"]:
+                self._avisar_ui(gid, f"[*] Malla lista: {union['ok']}/{union['total']} miembros conectados.")
+            return
+        if union["intento"] >= SYNC_MAX_INTENTOS or gid not in self.memoria.grupos_activos:
+            self._avisar_ui(gid, f"[!] Malla: {union['ok']}/{union['total']} conectados; "
+                                 f"sin conexión con {len(faltan)} miembros.")
+            return
+        espera = SYNC_REINTENTO * union["intento"]
+        self._avisar_ui(gid, f"[!] Malla: {union['ok']}/{union['total']} conectados; "
+                             f"reintentando {len(faltan)} en {espera:.0f}s.")
+        self.reactor.llamar_en(espera, self._reintentar_malla, gid, faltan, union["intento"] + 1)
+
+    def _reintentar_malla(self, gid, uids, intento):
+        g = self.memoria.grupos_activos.get(gid)
+        if not g: return
+        # Solo los que siguen en el grupo (un LEAVE los quita de miembros)
+        self._unir_malla(gid, [u for u in uids if u in g.get('miembros', {})], intento)
+
+    def _resolver_objetivo_smart(self, target_raw, al_terminar):
         """
         Busca un usuario por Nick, IP o dirección .onion. 
         Orden: Onion Directa -> IP Directa -> Memoria Local (RAM/Agenda) -> Escaneo UDP LAN -> Fallback Onion Agenda.
-        Retorna: (destino_encontrado, error_msg_o_sugerencias)
+        Resultado: al_terminar(destino_encontrado, error_msg_o_sugerencias), en el hilo del bucle.
+        El escaneo UDP no lee el socket: las respuestas las procesa el bucle (scan_buffer)
+        y aquí solo se revisa el buffer con un temporizador.
         """
         try:
             import re
-            import time
-            import socket
             from ghostwhisperchat.core.utilidades import normalize_text
             
             # 1. Es dirección Onion directa?
             if str(target_raw).endswith(".onion"):
-                return target_raw, None
+                return al_terminar(target_raw, None)
 
             # 2. Es IP directa?
             if re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", target_raw):
-                return target_raw, None
+                return al_terminar(target_raw, None)
                 
             target_norm = normalize_text(target_raw)
             
-            # Helper interno seguro
+            # Helper interno seguro (peers y agenda son TablaIndexada: nick/prefijo sin recorrer)
             def buscar_en_diccionario(dicc):
-                matches = []
-                if not dicc: return None, matches
-                for uid, d in dicc.items():
-                    if isinstance(d, dict) and 'nick' in d:
-                        n = normalize_text(d['nick'])
-                        if n == target_norm:
-                            dest = d.get('ip')
-                            if not dest or dest in ['127.0.0.1', 'localhost']:
-                                dest = d.get('onion') or dest
-                            return dest, None
-                        if n.startswith(target_norm): matches.append(d)
-                return None, matches
+                if not dicc or not target_norm: return None, []
+                d = dicc.primero("nick", target_norm)
+                if d:
+                    dest = d.get('ip')
+                    if not dest or dest in ['127.0.0.1', 'localhost']:
+                        dest = d.get('onion') or dest
+                    return dest, None
+                return None, [d for d in dicc.buscar("prefijo", target_norm) if 'nick' in d]
 
             # 3. Busqueda Local
             print(f"[SMART] Buscando '{target_norm}' en local...", file=sys.stderr)
             dest, matches = buscar_en_diccionario(self.memoria.peers)
-            if dest: return dest, None
+            if dest: return al_terminar(dest, None)
             
             # Check agenda too
             if not dest:
                  dest_c, matches_c = buscar_en_diccionario(self.memoria.contactos)
-                 if dest_c: return dest_c, None
+                 if dest_c: return al_terminar(dest_c, None)
                  if matches_c: matches.extend(matches_c)
 
-            # 4. Escaneo Red (Active Polling con Timeout socket)
+            # 4. Escaneo Red (WHO_NAME + revisión periódica de scan_buffer, ~1.6s)
             print(f"[SMART] Buscando en red (UDP)...", file=sys.stderr)
             self.scan_buffer = [] 
             
             from ghostwhisperchat.core.protocolo import empaquetar
             pkg = empaquetar("WHO_NAME", {"nick": target_raw}, self.memoria.get_origen())
             self.red.enviar_udp_broadcast(pkg) 
+            self.reactor.llamar_en(SMART_INTERVALO, self._smart_revisar_scan,
+                                   target_raw, target_norm, matches, al_terminar, SMART_REVISIONES)
             
-            start_time = time.time()
-            found_ip = None
-            
-            old_timeout = self.red.sock_udp.gettimeout()
-            self.red.sock_udp.settimeout(0.2)
-            
-            try:
-                for _ in range(8): # ~1.6s
-                    try:
-                        while True: # Drain buffer
-                            data, addr = self.red.sock_udp.recvfrom(65535)
-                            self.manejar_paquete_udp(data, addr)
-                    except socket.timeout:
-                        pass
-                    except BlockingIOError:
-                        pass
-                    except Exception as e:
-                        print(f"[SMART_WARN] UDP Reading error: {e}", file=sys.stderr)
-                    
-                    for res in self.scan_buffer:
-                        n = normalize_text(res.get('nick', ''))
-                        if n == target_norm:
-                            found_ip = res.get('ip')
-                            break
-                    
-                    if found_ip: break
-                    time.sleep(0.1)
-            finally:
-                self.red.sock_udp.settimeout(old_timeout)
+        except Exception as e:
+            al_terminar(None, f"Error SmartResolve: {e}")
 
-            if found_ip: return found_ip, None
+    def _smart_revisar_scan(self, target_raw, target_norm, matches, al_terminar, restantes):
+        from ghostwhisperchat.core.utilidades import normalize_text
+        try:
+            for res in self.scan_buffer:
+                if normalize_text(res.get('nick', '')) == target_norm and res.get('ip'):
+                    return al_terminar(res.get('ip'), None)
+            if restantes > 1:
+                self.reactor.llamar_en(SMART_INTERVALO, self._smart_revisar_scan,
+                                       target_raw, target_norm, matches, al_terminar, restantes - 1)
+                return
 
             # 5. Fallback a dirección Onion en Agenda
-            for uid, c in self.memoria.contactos.items():
-                if isinstance(c, dict) and normalize_text(c.get('nick', '')) == target_norm:
-                    if c.get('onion'):
-                        return c['onion'], None
+            for c in self.memoria.contactos.buscar("nick", target_norm):
+                if c.get('onion'):
+                    return al_terminar(c['onion'], None)
 
             # 6. Sugerencias si no fue encontrado
             candidates = set()
@@ -370,13 +545,48 @@ class Motor:
                 if n.startswith(target_norm): candidates.add(res['nick'])
                     
             if not candidates:
-                return None, f"No se encontró a '{target_raw}' ni en LAN ni con ID Global Onion."
+                return al_terminar(None, f"No se encontró a '{target_raw}' ni en LAN ni con ID Global Onion.")
                 
             sug = ", ".join(list(candidates)[:3])
-            return None, f"'{target_raw}' no existe. ¿Quizás: {sug}?"
+            al_terminar(None, f"'{target_raw}' no existe. ¿Quizás: {sug}?")
             
         except Exception as e:
-            return None, f"Error SmartResolve: {e}"
+            al_terminar(None, f"Error SmartResolve: {e}")
+
+    def _enviar_a_grupo(self, gid, pkg, excluir=(), gossip=False):
+        """
+        Encola pkg hacia los miembros de gid vía despachador: a todos (malla) o, con
+        gossip, a `fanout` elegidos al azar (logica/difusion.py). Retorna cuántos.
+        Cada miembro tiene su cola FIFO (el orden de los mensajes se conserva) y los
+        miembros Tor lentos no bloquean a los de la LAN. Con pool activo, solo el 1er
+        mensaje a cada miembro paga el circuit setup.
+        """
+        from ghostwhisperchat.core.transporte import PORT_GROUP
+        g = self.memoria.grupos_activos.get(gid)
+        if not g: return 0
+        members = g.get('miembros', {})
+        # Normalize to list
+        m_list = members.values() if isinstance(members, dict) else members
+        otros = [m for m in m_list if m.get('uid') != self.memoria.mi_uid and m.get('uid') not in excluir]
+        if gossip:
+            otros = difusion.elegir_vecinos(otros, difusion.fanout_para(len(otros)))
+        enviados = 0
+        for m in otros:
+            target = self._resolver_host_objetivo(m)
+            if not target: continue
+            port_g = m.get('port_group', PORT_GROUP)
+            self.despachador.encolar(target, port_g, pkg)
+            enviados += 1
+        return enviados
+
+    def _uid_por_ip_o_nick(self, tabla, valor, por_nick=True):
+        """uid cuya IP (o nick exacto) es `valor`, vía los índices de la tabla. None si no hay."""
+        from ghostwhisperchat.core.utilidades import normalize_text
+        uids = tabla.uids("ip", valor)
+        if not uids and por_nick:
+            uids = {uid for uid in tabla.uids("nick", normalize_text(valor))
+                    if tabla.get(uid, {}).get('nick') == valor}
+        return next(iter(uids), None)
 
     def _sincronizar_ui_usuarios(self, chat_id):
         """Manda la lista de nicks al UI para el autocompletado (Comando Oculto)"""
@@ -438,23 +648,18 @@ class Motor:
                         if peer_found:
                             hist_target_id = peer_found['uid']
                         else:
-                            # 2. Reverse Lookup in Active Peers (by IP) manually
+                            # 2. Reverse Lookup in Active Peers (by IP) via índice
                             # buscar_peer usually does nick or uid.
-                            uid_by_ip = None
-                            for uid, p in self.memoria.peers.items():
-                                 if p.get('ip') == chat_id:
-                                      uid_by_ip = uid
-                                      break
+                            uid_by_ip = self._uid_por_ip_o_nick(self.memoria.peers, chat_id, por_nick=False)
                             
                             if uid_by_ip:
                                  hist_target_id = uid_by_ip
                             else:
-                                 # 3. Fallback: Contacts (Reverse Lookup IP)
+                                 # 3. Fallback: Contacts (Reverse Lookup IP / Nick)
                                  # self.memoria.contactos = {uid: {ip, nick...}}
-                                 for uid, c in self.memoria.contactos.items():
-                                       if c.get('ip') == chat_id or c.get('nick') == chat_id:
-                                            hist_target_id = uid
-                                            break
+                                 uid_c = self._uid_por_ip_o_nick(self.memoria.contactos, chat_id)
+                                 if uid_c:
+                                      hist_target_id = uid_c
 
                     try:
                         hist_block = self.memoria.get_historial_reciente(hist_target_id, limit=20)
@@ -468,6 +673,8 @@ class Motor:
                 # Keep connection open for streaming logs
                 # We store it in ui_sessions
                 self.ui_sessions[chat_id] = conn
+                self.reactor.registrar(conn, TIPO_UI, self._on_ui_legible)
+                self._agendar_keepalive(chat_id)
                 print(f"[UI] Registrada ventana para {chat_id}", file=sys.stderr)
                 conn.sendall(f"[*] Conectado al Daemon. ID: {chat_id}\n".encode('utf-8'))
                 
@@ -480,6 +687,8 @@ class Motor:
             if len(parts) == 2:
                 chat_id = parts[1]
                 self.ui_sessions[chat_id] = conn
+                self.reactor.registrar(conn, TIPO_UI, self._on_ui_legible)
+                self._agendar_keepalive(chat_id)
                 print(f"[IPC] UI registrada para chat_id: {chat_id}", file=sys.stderr)
                 self._sincronizar_ui_usuarios(chat_id)
             return
@@ -845,7 +1054,14 @@ class Motor:
                  res += f"   • Política:  {Colores.CYAN}{getattr(m, 'privacy_policy', 'AMBOS')}{Colores.RESET}\n"
                  res += f"   • Versión:   {Colores.C_PINK_PASTEL}{APP_VERSION}{Colores.RESET}\n"
                  res += f"   • UID:       {Colores.CYAN}{str(m.mi_uid)}{Colores.RESET}\n"
-                 res += f"   • Puertos:   TCP={ident.get('port_priv')} / MESH={ident.get('port_group')}\n\n"
+                 res += f"   • Puertos:   TCP={ident.get('port_priv')} / MESH={ident.get('port_group')}\n"
+                 ps = self.red.estadisticas_pool()
+                 res += f"   • Pool TCP:  {ps['hits']} hits / {ps['misses']} miss ({ps['ociosas']} abiertas, {ps['expirados']} expiradas)\n"
+                 rs = self.rutas.estadisticas()
+                 res += f"   • Rutas:     {rs['lan']} LAN / {rs['onion']} Onion ({rs['hits']} hits, {rs['sondeos']} sondeos)\n"
+                 ds = self.despachador.estadisticas()
+                 res += f"   • Salida:    cola LAN={ds['LAN']['cola']} TOR={ds['TOR']['cola']} | {ds['enviados']} enviados, {ds['fallidos']} fallidos, {ds['descartados']} descartados\n"
+                 res += f"   • Archivos:  {len(self.transferencias.activas())} transferencia(s) activa(s)\n\n"
 
                  # Peers
                  all_peers = list(m.peers.values())
@@ -855,6 +1071,9 @@ class Motor:
                      res += f"   {Colores.C_SILVER}(No hay peers. Ejecuta 'gwc scan' para buscar){Colores.RESET}\n"
                  else:
                      limit = 15
+                     # Vault en bloque (una sola toma de lock para todo el dashboard)
+                     from ghostwhisperchat.core.cripto_vault import get_vault_entries
+                     vault_batch = get_vault_entries([p.get('uid') for p in all_peers[:limit]])
                      for i, p in enumerate(all_peers):
                          if i >= limit:
                              res += f"   {Colores.C_SILVER}... y {n_peers - limit} más.{Colores.RESET}\n"
@@ -869,8 +1088,7 @@ class Motor:
                          
                          pip = str(p.get('ip', ''))
                          ponion = str(p.get('onion', ''))
-                         from ghostwhisperchat.core.cripto_vault import get_vault_entry
-                         v_data = get_vault_entry(p.get('uid'))
+                         v_data = vault_batch.get(p.get('uid'), {})
                          
                          peer_privacy = p.get('privacy_policy', 'AMBOS')
                          has_ip = False
@@ -917,6 +1135,9 @@ class Motor:
                  
                  if not all_uids: return "No hay contactos guardados."
                  
+                 from ghostwhisperchat.core.cripto_vault import get_vault_entries
+                 vault_batch = get_vault_entries(all_uids)
+                 
                  for uid in all_uids:
                       if uid == self.memoria.mi_uid: continue
                       
@@ -936,8 +1157,7 @@ class Motor:
                       msg = data.get('status_msg', '')
                       
                       # Get IP and Onion from Vault to show badges
-                      from ghostwhisperchat.core.cripto_vault import get_vault_entry
-                      v_data = get_vault_entry(uid)
+                      v_data = vault_batch.get(uid, {})
                       
                       peer_privacy = data.get('privacy_policy', 'AMBOS')
                       has_ip = False
@@ -981,13 +1201,11 @@ class Motor:
                     nick_borrado = nick_json or target
                     break
             if uid_a_borrar:
-                # 1. Eliminar de RAM
-                self.memoria.contactos.pop(uid_a_borrar, None)
+                # 1. Eliminar de RAM (el almacén persiste contacts.json en su flush diferido)
+                self.memoria.almacen_contactos.eliminar(uid_a_borrar)
                 self.memoria.peers.pop(uid_a_borrar, None) # Tambien de peers activos para que desaparezca YA
                 if hasattr(self.memoria, 'contactos_ignorados'):
                     self.memoria.contactos_ignorados.add(uid_a_borrar)
-                # 2. Persistir a disco (contacts.json) mediante el helper de memoria
-                self.memoria.guardar_contactos()
                 # 3. Eliminar de bóveda encriptada
                 from ghostwhisperchat.core.cripto_vault import delete_vault_entry
                 delete_vault_entry(uid_a_borrar)
@@ -1007,9 +1225,8 @@ class Motor:
             if hasattr(self.memoria, 'contactos_ignorados'):
                 self.memoria.contactos_ignorados.update(self.memoria.contactos.keys())
             # Limpiar RAM y persistir a disco
-            self.memoria.contactos.clear()
+            self.memoria.almacen_contactos.reemplazar({})
             self.memoria.peers.clear() # Tambien limpiar peers activos
-            self.memoria.guardar_contactos()
             
             # Limpiar boveda
             from ghostwhisperchat.core.cripto_vault import clear_vault
@@ -1035,7 +1252,7 @@ class Motor:
             sel = args[0].upper()
             self.memoria.privacy_policy = valid_policies[sel]
             self.memoria.guardar_configuracion()
-            self._propagar_actualizacion_perfil()
+            self._propagar_actualizacion_perfil(context_ui)
             return f"{Colores.GREEN}[\u2714] Politica de privacidad actualizada a: {Colores.BOLD}{sel}{Colores.RESET}"
 
         elif cmd == "SHORTCUTS":
@@ -1055,8 +1272,9 @@ class Motor:
             self.memoria.guardar_configuracion()
             
             # Use shared helper
-            nodos = self._propagar_actualizacion_perfil()
-            return f"[*] Nick cambiado: {old} -> {self.memoria.mi_nick}"
+            nodos = self._propagar_actualizacion_perfil(context_ui)
+            aviso = f" Propagando a {nodos} nodos..." if nodos else ""
+            return f"[*] Nick cambiado: {old} -> {self.memoria.mi_nick}.{aviso}"
 
         elif cmd == "STATUS":
              # 1. Parse Args
@@ -1082,9 +1300,21 @@ class Motor:
              self.memoria.guardar_configuracion()
              
              # 4. Propagate
-             nodos = self._propagar_actualizacion_perfil()
+             nodos = self._propagar_actualizacion_perfil(context_ui)
              
-             return f"[*] Estado {msg}"
+             aviso = f" Propagando a {nodos} nodos..." if nodos else ""
+             return f"[*] Estado {msg}.{aviso}"
+
+        elif cmd == "GOSSIP_TOGGLE":
+            if not context_ui or context_ui[1] not in self.memoria.grupos_activos:
+                return "[X] Solo dentro de un grupo."
+            g = self.memoria.grupos_activos[context_ui[1]]
+            g['gossip'] = not difusion.usa_gossip(g)
+            if not g['gossip']:
+                return f"[*] Difusión en '{g['nombre']}': malla completa (a todos los miembros)."
+            n = max(0, len(g.get('miembros', {})) - 1)
+            return (f"[*] Difusión en '{g['nombre']}': gossip "
+                    f"(cada mensaje sale a {difusion.fanout_para(n)} de {n} miembros y ellos lo reenvían).")
 
         elif cmd == "MUTE_TOGGLE":
             self.memoria.no_molestar = not self.memoria.no_molestar
@@ -1112,19 +1342,8 @@ class Motor:
              # 1. Dirección Onion Directa
              if str(target).endswith(".onion"):
                   req = empaquetar("CHAT_REQ", {}, self.memoria.get_origen())
-                  def _send_onion_chat():
-                      try:
-                          print(f"[CHAT_WAN] Conectando vía Global a {target}:44494...", file=sys.stderr)
-                          ok = self.red.enviar_tcp_priv(target, req, port=44494, force_new=True)
-                          if ok:
-                              print(f"[CHAT_WAN] Solicitud entregada exitosamente a {target}.", file=sys.stderr)
-                          else:
-                              print(f"[CHAT_WAN] [X] No se pudo entregar solicitud a {target}.", file=sys.stderr)
-                              self.chat_requests_status[target] = ('REJECTED', target, 'No se pudo conectar vía Global')
-                      except Exception as e:
-                          print(f"[CHAT_WAN] [!] Error entregando a {target}: {e}", file=sys.stderr)
-                          self.chat_requests_status[target] = ('REJECTED', target, str(e))
-                  threading.Thread(target=_send_onion_chat, daemon=True).start()
+                  print(f"[CHAT_WAN] Conectando vía Global a {target}:44494...", file=sys.stderr)
+                  self._encolar_chat_req_global(target, target, 44494, req)
                   return f"[*] Solicitud enviada a {target} vía Global. Esperando respuesta..."
 
              # 2. IP Directa
@@ -1145,19 +1364,8 @@ class Motor:
                   dest_host = self._resolver_host_objetivo(peer)
                   port_p = peer.get('port_priv', 44494)
                   if str(dest_host).endswith(".onion"):
-                      def _send_onion_peer():
-                          try:
-                              print(f"[CHAT_WAN] Conectando vía Global a {target} ({dest_host}:{port_p})...", file=sys.stderr)
-                              ok = self.red.enviar_tcp_priv(dest_host, req, port=port_p, force_new=True)
-                              if ok:
-                                  print(f"[CHAT_WAN] Solicitud entregada exitosamente a {target}.", file=sys.stderr)
-                              else:
-                                  print(f"[CHAT_WAN] [X] No se pudo entregar solicitud a {target}.", file=sys.stderr)
-                                  self.chat_requests_status[target] = ('REJECTED', target, 'No se pudo conectar vía Global')
-                          except Exception as e:
-                              print(f"[CHAT_WAN] [!] Error entregando a {target}: {e}", file=sys.stderr)
-                              self.chat_requests_status[target] = ('REJECTED', target, str(e))
-                      threading.Thread(target=_send_onion_peer, daemon=True).start()
+                      print(f"[CHAT_WAN] Conectando vía Global a {target} ({dest_host}:{port_p})...", file=sys.stderr)
+                      self._encolar_chat_req_global(target, dest_host, port_p, req)
                       return f"[*] Solicitud enviada a '{target}' vía Global. Esperando respuesta..."
                   else:
                       try:
@@ -1175,19 +1383,8 @@ class Motor:
                      port_p = c.get('port_priv', 44494)
                      req = empaquetar("CHAT_REQ", {}, self.memoria.get_origen())
                      if str(dest_host).endswith(".onion"):
-                         def _send_onion_c(dh=dest_host, pp=port_p):
-                             try:
-                                 print(f"[CHAT_WAN] Conectando vía Global a contacto de agenda '{target}' ({dh}:{pp})...", file=sys.stderr)
-                                 ok = self.red.enviar_tcp_priv(dh, req, port=pp, force_new=True)
-                                 if ok:
-                                     print(f"[CHAT_WAN] Solicitud entregada exitosamente a {target}.", file=sys.stderr)
-                                 else:
-                                     print(f"[CHAT_WAN] [X] No se pudo entregar solicitud a {target}.", file=sys.stderr)
-                                     self.chat_requests_status[target] = ('REJECTED', target, 'No se pudo conectar vía Global')
-                             except Exception as e:
-                                 print(f"[CHAT_WAN] [!] Error entregando a {target}: {e}", file=sys.stderr)
-                                 self.chat_requests_status[target] = ('REJECTED', target, str(e))
-                         threading.Thread(target=_send_onion_c, daemon=True).start()
+                         print(f"[CHAT_WAN] Conectando vía Global a contacto de agenda '{target}' ({dest_host}:{port_p})...", file=sys.stderr)
+                         self._encolar_chat_req_global(target, dest_host, port_p, req)
                          return f"[*] Solicitud enviada a '{target}' vía Global (Agenda). Esperando respuesta..."
                      else:
                          try:
@@ -1228,6 +1425,9 @@ class Motor:
                  # FIX CRITICO: Importar Colores correctamente (Clase, no modulo)
                  from ghostwhisperchat.datos.recursos import Colores
                  
+                 from ghostwhisperchat.core.cripto_vault import get_vault_entries
+                 vault_batch = get_vault_entries(list(ms.keys()))
+                 
                  for uid, mdata in ms.items():
                      # Default to snapshot
                      nick = mdata.get('nick', 'UNK')
@@ -1265,8 +1465,7 @@ class Motor:
                          
                          
                          # Check IP/Onion presence for badges
-                         from ghostwhisperchat.core.cripto_vault import get_vault_entry
-                         v_data = get_vault_entry(uid)
+                         v_data = vault_batch.get(uid, {})
                          
                          peer_privacy = mdata.get('privacy_policy') or (peer and peer.get('privacy_policy')) or 'AMBOS'
                          has_ip = False
@@ -1318,115 +1517,20 @@ class Motor:
                 if is_silent: return None # Fail silently
                 return f"[X] Archivo no encontrado: {ruta}"
             
-            import base64
-            import shutil
-            
-            filename = os.path.basename(ruta)
-            file_data = None
-            
-            # Handle Directory -> Zip
-            temp_zip = None
-            if os.path.isdir(ruta):
-                import tempfile
-                fd, temp_zip = tempfile.mkstemp(suffix=".zip")
-                os.close(fd)
-                # Remove file created by mkstemp to allow make_archive to create it? 
-                # make_archive creates 'base_name.zip'.
-                # Better:
-                base = os.path.join(tempfile.gettempdir(), filename)
-                shutil.make_archive(base, 'zip', ruta)
-                temp_zip = base + ".zip"
-                filename = filename + ".zip"
-                ruta = temp_zip
-            
-            # Size Check (Max 2GB)
-            size = os.path.getsize(ruta)
-            max_size = 2 * 1024 * 1024 * 1024 # 2GB
-            if size > max_size:
-                if is_silent: return None
-                return f"[X] Archivo muy grande ({size/1024/1024:.1f}MB). Max 2GB."
-                
-            try:
-                import math
-                chunk_size = 10 * 1024 * 1024 # 10MB
-                total_chunks = math.ceil(size / chunk_size)
-                
-                # Get UI Session for progress bars
-                ui_sess = self.ui_sessions.get(chat_id)
-                
-                with open(ruta, 'rb') as f:
-                    for i in range(total_chunks):
-                        raw = f.read(chunk_size)
-                        if not raw: break
-                        
-                        b64_data = base64.b64encode(raw).decode('ascii')
-                        
-                        # Packet
-                        pkg = empaquetar("FILE_CHUNK", {
-                            "filename": filename,
-                            "chunk_id": i + 1,
-                            "total_chunks": total_chunks,
-                            "data": b64_data,
-                            "filesize": size,
-                            "gid": chat_id if chat_id in self.memoria.grupos_activos else None # Inject Context
-                        }, self.memoria.get_origen())
-                        
-                        # Send Logic (Soporta IP LAN y Onion WAN)
-                        targets = []
-                        if chat_id in self.memoria.grupos_activos:
-                             g = self.memoria.grupos_activos[chat_id]
-                             for uid, m in g['miembros'].items():
-                                 if uid == self.memoria.mi_uid: continue
-                                 ip = m.get('ip')
-                                 onion = m.get('onion')
-                                 target = self._resolver_host_objetivo(m)
-                                 if target:
-                                     port = m.get('port_priv', 44494)
-                                     targets.append((target, port))
-                        else:
-                             peer = self.memoria.buscar_peer(chat_id)
-                             if peer:
-                                 target = self._resolver_host_objetivo(peer)
-                                 if target:
-                                     targets.append((target, peer.get('port_priv', 44494)))
-                             else:
-                                 if chat_id in self.memoria.contactos:
-                                     c = self.memoria.contactos[chat_id]
-                                     target = self._resolver_host_objetivo(c)
-                                     if target:
-                                         targets.append((target, c.get('port_priv', 44494)))
-                        
-                        for dest_host, port in targets:
-                            try: self.red.enviar_tcp_priv(dest_host, pkg, port=port)
-                            except: pass
-                        
-                        # Progress Update (Suppress if silent)
-                        if ui_sess and not is_silent:
-                            pct = int(((i + 1) / total_chunks) * 100)
-                            # ASCII Animation Frame roughly
-                            # Just simple percentage
-                            msg_prog = f"\r[SISTEMA] [*] Enviando '{filename}': {pct}% (Parte {i+1}/{total_chunks})"
-                            ui_sess.sendall(msg_prog.encode('utf-8'))
-                            
-                        # Slight delay to allow network flush and prevent freezing
-                        time.sleep(0.2)
-                
-                if ui_sess and not is_silent: 
-                    ui_sess.sendall(b"\n")
-                    from ghostwhisperchat.datos.recursos import Colores
-                    # Estilo ligero: Verde Texto (sin background), como pidio usuario.
-                    msg_done = f"\n{Colores.C_GREEN_NEON} [SISTEMA] Archivo enviado correctamente: {filename} {Colores.RESET}\n"
-                    ui_sess.sendall(msg_done.encode('utf-8'))
-                
-                if is_silent: return None # No message needed
+            # Encolar: comprimir/leer/enviar corre en los hilos del gestor de transferencias
+            t = self.transferencias.encolar(chat_id, ruta, silenciosa=is_silent)
+            print(f"[TRANSFER] {t.tid} en cola: {ruta} -> {chat_id}", file=sys.stderr)
+            if is_silent: return None # No message needed
+            return f"[*] Enviando '{t.filename}' (ID {t.tid}). Usa --transferencias para ver el progreso."
 
-                return f"[*] Archivo '{filename}' enviado exitosamente ({total_chunks} partes)."
-            except Exception as e:
-                return f"[X] Error enviando archivo: {e}"
-            finally:
-                # Cleanup temp zip
-                if temp_zip and os.path.exists(temp_zip):
-                    os.unlink(temp_zip)
+        elif cmd == "TRANSFERS":
+            return self.transferencias.listar()
+
+        elif cmd == "TRANSFER_CANCEL":
+            if not args: return "[X] Uso: --cancelar <ID> (ver --transferencias)"
+            t = self.transferencias.cancelar(args[0])
+            if not t: return f"[X] No hay una transferencia activa con ID '{args[0]}'."
+            return f"[*] Cancelando transferencia {t.tid} ({t.filename})..."
 
         elif cmd == "EXIT":
             if context_ui:
@@ -1444,16 +1548,12 @@ class Motor:
 
         # --- MANEJO DE COMANDOS DESCONOCIDOS (Sugerencias) ---
         elif cmd == "UNKNOWN":
-             import difflib
-             from ghostwhisperchat.datos.recursos import COMMAND_MAP
+             from ghostwhisperchat.logica.comandos import sugerir_comandos
              
              raw = args[0] if args else "???"
-             all_cmds = []
-             for aliases in COMMAND_MAP.values():
-                 all_cmds.extend(aliases)
              
-             # Fuzzy Search
-             matches = difflib.get_close_matches(raw, all_cmds, n=1, cutoff=0.5)
+             # Fuzzy Search (índice de trigramas sobre los alias)
+             matches = sugerir_comandos(raw, n=1, minimo=0.5)
              
              err = f"[?] Comando '{raw}' no encontrado."
              if matches:
@@ -1515,27 +1615,14 @@ class Motor:
              
              if chat_id in self.memoria.grupos_activos:
                  g = self.memoria.grupos_activos[chat_id]
-                 pkg = empaquetar("MSG", {"text": msg_content, "gid": chat_id}, self.memoria.get_origen())
-                 
-                 from ghostwhisperchat.core.transporte import PORT_GROUP
-                 members = g.get('miembros', {})
-                 # Normalize to list
-                 m_list = members.values() if isinstance(members, dict) else members
-                 
-                 # Envio paralelo a todos los miembros: fire-and-forget en hilos daemon.
-                 # Sin paralelismo, miembro-5 esperaria que terminen 1..4 (efecto cascada Tor).
-                 # Con pool activo, solo el 1er mensaje a cada miembro paga el circuit setup;
-                 # los siguientes usan el circuito cacheado (~0.1s).
-                 for m in m_list:
-                     uid = m.get('uid')
-                     if uid == self.memoria.mi_uid: continue
-                     target = self._resolver_host_objetivo(m)
-                     if not target: continue
-                     port_g = m.get('port_group', PORT_GROUP)
-                     def _send_to_member(t=target, p=port_g, pk=pkg):
-                         try: self.red.enviar_tcp_priv(t, pk, port=p)
-                         except: pass
-                     threading.Thread(target=_send_to_member, daemon=True).start()
+                 payload_msg = {"text": msg_content, "gid": chat_id}
+                 gossip = difusion.usa_gossip(g)
+                 if gossip:
+                     # Modo gossip: mid único en el grupo; los receptores lo reenvían una vez
+                     payload_msg["mid"] = difusion.nuevo_mid()
+                     self.vistos_grupo.registrar(chat_id, payload_msg["mid"])
+                 pkg = empaquetar("MSG", payload_msg, self.memoria.get_origen())
+                 self._enviar_a_grupo(chat_id, pkg, gossip=gossip)
                  
                  # Log outgoing group message
                  self.memoria.log_historial(chat_id, self.memoria.mi_nick, msg_content, es_propio=True)
@@ -1573,18 +1660,24 @@ class Motor:
                     import hashlib, time as _t
                     mid = hashlib.sha1(f"{_t.time()}{self.memoria.mi_uid}{msg_content}".encode()).hexdigest()[:10]
                     pkg = empaquetar("MSG", {"text": msg_content, "mid": mid}, self.memoria.get_origen())
-                    ok = self.red.enviar_tcp_priv(target_host, pkg, port=target_port)
-                    if ok:
-                        # Registrar pendiente: si no llega ACK en 60s se notificara al usuario
-                        preview = msg_content[:45] + "..." if len(msg_content) > 45 else msg_content
-                        self.pending_ack[mid] = (chat_id, time.time(), preview)
-                    else:
-                        # Fallo inmediato de envio (sin conexion): notificar directamente
-                        if chat_id in self.ui_sessions:
-                            try: self.ui_sessions[chat_id].sendall(
+                    # Registrar pendiente antes de encolar (el ACK puede llegar antes que el callback):
+                    # si no llega ACK en 60s se notificara al usuario
+                    preview = msg_content[:45] + "..." if len(msg_content) > 45 else msg_content
+                    self.pending_ack[mid] = (chat_id, time.time(), preview)
+                    self._timers_ack[mid] = self.reactor.llamar_en(ACK_TIMEOUT, self._ack_vencido, mid)
+
+                    # on_done corre en un hilo del despachador: pending_ack, timers y UI son del bucle
+                    def _msg_enviado(ok, m=mid, cid=chat_id):
+                        if ok: return
+                        # Fallo de envio (sin conexion): notificar directamente
+                        self._descartar_ack(m)
+                        if cid in self.ui_sessions:
+                            try: self.ui_sessions[cid].sendall(
                                 "[!] No se pudo enviar el mensaje. Verifica la conexion.\n".encode('utf-8')
                             )
                             except: pass
+                    self.despachador.encolar(target_host, target_port, pkg,
+                                             on_done=lambda ok: self.reactor.llamar_pronto(_msg_enviado, ok))
                  
                  
                  # Log outgoing private message
@@ -1601,13 +1694,8 @@ class Motor:
                       pass # good
                  else:
                       # It's likely an IP or Nick.
-                      # Try to find peer with this IP
-                      real_uid = None
-                      # Check Active Peers
-                      for uid, pdata in self.memoria.peers.items():
-                           if pdata.get('ip') == chat_id or pdata.get('nick') == chat_id:
-                               real_uid = uid
-                               break
+                      # Check Active Peers (índices IP / nick)
+                      real_uid = self._uid_por_ip_o_nick(self.memoria.peers, chat_id)
                       
                       if real_uid:
                            hist_id = real_uid
@@ -1619,10 +1707,7 @@ class Motor:
                                  hist_id = chat_id # It was a UID after all?
                             else:
                                  # Reverse search in contacts
-                                 for c_uid, c_data in self.memoria.contactos.items():
-                                      if c_data.get('ip') == chat_id or c_data.get('nick') == chat_id:
-                                           hist_id = c_uid
-                                           break
+                                 hist_id = self._uid_por_ip_o_nick(self.memoria.contactos, chat_id) or hist_id
                  
                  self.memoria.log_historial(hist_id, self.memoria.mi_nick, msg_content, es_propio=True)
                  
@@ -1650,10 +1735,20 @@ class Motor:
             self.desconectar_ui(sock)
 
     def desconectar_ui(self, ui_sock):
+        self.reactor.quitar(ui_sock)
+        if not any(sock is ui_sock for sock in self.ui_sessions.values()):
+            # Socket UI huérfano (sesión reemplazada): solo cerrar
+            try: ui_sock.close()
+            except: pass
+            return
         for chat_id, sock in list(self.ui_sessions.items()):
             if sock == ui_sock:
                 print(f"[UI] Desconectando sesión {chat_id}...", file=sys.stderr)
                 del self.ui_sessions[chat_id]
+                t = self._timers_keepalive.pop(chat_id, None)
+                if t: t.cancelar()
+                st = self.typing_salida.pop(chat_id, None)
+                if st and st["timer"]: st["timer"].cancelar()
                 try: ui_sock.close()
                 except: pass
                 
@@ -1671,22 +1766,14 @@ class Motor:
                          members = g.get('miembros', {})
                          m_list = list(members.values()) if isinstance(members, dict) else list(members)
                          
-                         def _send_leave_async(m_data, pkg=leave_pkg):
-                             try:
-                                 if not isinstance(m_data, dict): return
-                                 uid = m_data.get('uid')
-                                 if uid == self.memoria.mi_uid: return
-                                 
-                                 dest_host = self._resolver_host_objetivo(m_data)
-                                 if not dest_host: return
-                                 tgt_pg = m_data.get('port_group') or PORT_GROUP
-                                 print(f"[MESH] Enviando LEAVE a {m_data.get('nick')} ({dest_host}:{tgt_pg})", file=sys.stderr)
-                                 self.red.enviar_tcp_priv(dest_host, pkg, port=tgt_pg)
-                             except Exception as e:
-                                 print(f"[MESH_WARN] Error enviando LEAVE a {m_data.get('nick', '?')}: {e}", file=sys.stderr)
-
-                         for m in m_list:
-                             threading.Thread(target=_send_leave_async, args=(m,), daemon=True).start()
+                         for m_data in m_list:
+                             if not isinstance(m_data, dict): continue
+                             if m_data.get('uid') == self.memoria.mi_uid: continue
+                             dest_host = self._resolver_host_objetivo(m_data)
+                             if not dest_host: continue
+                             tgt_pg = m_data.get('port_group') or PORT_GROUP
+                             print(f"[MESH] Enviando LEAVE a {m_data.get('nick')} ({dest_host}:{tgt_pg})", file=sys.stderr)
+                             self.despachador.encolar(dest_host, tgt_pg, leave_pkg)
                          
                          # FULL EXIT: Remove group from memory
                          del self.memoria.grupos_activos[chat_id]
@@ -1701,19 +1788,174 @@ class Motor:
                             dest_host = self._resolver_host_objetivo(peer)
                             p_port = peer.get('port_priv', 44494)
                             print(f"[PRIV] Enviando CHAT_BYE a {peer.get('nick')} ({dest_host}:{p_port})", file=sys.stderr)
-                            def _send_bye_async(dh=dest_host, pp=p_port, pkg=bye_pkg):
-                                try: self.red.enviar_tcp_priv(dh, pkg, port=pp)
-                                except Exception as err:
-                                    print(f"[PRIV_WARN] Error enviando CHAT_BYE: {err}", file=sys.stderr)
+                            def _bye_enviado(ok, dh=dest_host, pp=p_port):
+                                if not ok:
+                                    print(f"[PRIV_WARN] Error enviando CHAT_BYE a {dh}:{pp}", file=sys.stderr)
                                 # Cerrar conexión poolada al terminar el chat
-                                if dh:
-                                    self.red.pool_close(dh, pp)
-                            threading.Thread(target=_send_bye_async, daemon=True).start()
+                                self.red.pool_close(dh, pp)
+                            if dest_host:
+                                self.despachador.encolar(dest_host, p_port, bye_pkg, on_done=_bye_enviado)
                 except Exception as e:
                     print(f"[X] Error en desconexion UI: {e}", file=sys.stderr)
                 
                 return
 
+    def enviar_a_ui(self, chat_id, texto):
+        """Escribe en la UI de un chat (si está abierta). Llamar desde el hilo del bucle."""
+        ui_sess = self.ui_sessions.get(chat_id)
+        if ui_sess:
+            try: ui_sess.sendall(texto.encode('utf-8'))
+            except: pass
+
+    # --- RECEPCION DE ARCHIVOS ---
+
+    def _entrante_de(self, payload, origen, chunk_id=None):
+        """
+        ArchivoEntrante (logica/transferencias.py) de una oferta o chunk; None si no es válido.
+        chunk_id: el del FILE_CHUNK que llega (None para ofertas/consultas).
+        """
+        if payload.get("tid"):
+            return self.transferencias.entrante(payload, origen)
+        # Emisor legado (sin tid): un stream por emisor + nombre + tamaño, chunks de CHUNK_SIZE
+        from ghostwhisperchat.logica.transferencias import CHUNK_SIZE
+        nombre = os.path.basename(str(payload.get("filename") or "archivo"))
+        tid = f"legacy-{origen.get('uid', 'unk')[:8]}-{payload.get('filesize', 0)}-{nombre}"
+        ent = self.transferencias.entrante(dict(payload, tid=tid, chunk_size=CHUNK_SIZE), origen)
+        if ent and chunk_id == 1 and not ent.sha256 and not ent.verificando:
+            # El emisor legado no reanuda: su chunk 1 siempre abre un envío nuevo (antes 'wb').
+            # Sin sha256 nada detectaría un .part mezclado con restos de un envío cortado.
+            ent.reiniciar()
+        return ent
+
+    def _responder_faltantes(self, ent, origen):
+        """FILE_ACCEPT {tid, faltantes}: el emisor solo (re)envía esos chunks."""
+        peer_src = self.memoria.peers.get(origen.get('uid')) or origen
+        dest = self._resolver_host_objetivo(peer_src)
+        if dest:
+            acc = empaquetar("FILE_ACCEPT", {"tid": ent.tid, "faltantes": ent.faltantes()}, self.memoria.get_origen())
+            self.despachador.encolar(dest, peer_src.get('port_priv', 44494), acc)
+
+    def _finalizar_archivo_recibido(self, filename, part_path, origen, f_gid=None):
+        """Mueve el .part a su destino final y notifica (escritorio + UI del chat)."""
+        dest_dir = os.path.dirname(part_path)
+        safe_fname = os.path.basename(str(filename))
+
+        # FIX v2.165: Organizacion Automatica de Fotos
+        # Si es imagen, guardar en subcarpeta 'Fotos_Recibidas'
+        lower_name = safe_fname.lower()
+        es_imagen = lower_name.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff'))
+        
+        if es_imagen:
+            target_subdir = os.path.join(dest_dir, "Fotos_Recibidas")
+            os.makedirs(target_subdir, exist_ok=True)
+            final_path = os.path.join(target_subdir, safe_fname)
+        else:
+            final_path = os.path.join(dest_dir, safe_fname)
+
+        # Avoid overwrite logic (generic): reconstruct path with timestamp
+        if os.path.exists(final_path):
+            base, ext = os.path.splitext(safe_fname)
+            final_path = os.path.join(os.path.dirname(final_path), f"{base}_{int(time.time())}{ext}")
+        
+        os.rename(part_path, final_path)
+        print(f"[FILE] Completado: {final_path}", file=sys.stderr)
+        
+        # Notify User (Desktop)
+        # v2.133: Logic restored. We now check payload 'gid'.
+        noti_title = "PRIV recepcion archivo"
+        if f_gid and f_gid in self.memoria.grupos_activos:
+             g_name = self.memoria.grupos_activos[f_gid]['nombre']
+             noti_title = f"GRUP {g_name} recepcion archivo"
+             
+        noti_body = f"{origen['nick']} te envio un archivo"
+        
+        # FIX v2.166: Personalizacion Foto vs Archivo
+        if es_imagen:
+            noti_title = "Descarga de foto"
+            noti_body = f"{origen['nick']} te mando una foto"
+        
+        from ghostwhisperchat.core.utilidades import enviar_notificacion
+        enviar_notificacion(noti_title, noti_body)
+         
+        # Console Notification - User format
+        try:
+            from ghostwhisperchat.datos.recursos import Colores
+            
+            safe_fname = os.path.basename(final_path)
+            if es_imagen:
+                msg_alert = f"\n{Colores.C_GREEN_NEON}[SISTEMA] [!] Recepcion de foto finalizada: {safe_fname}{Colores.RESET}\n"
+                msg_alert += f"__NATIVE_IMG__{final_path}\n"
+            else:
+                msg_alert = f"\n{Colores.YELLOW}[SISTEMA] [!] {origen['nick']} te ha enviado: {safe_fname}{Colores.RESET}\n"
+            
+            # FIX v2.160.2: Broadcast ONLY to relevant session
+            target_sess_id = f_gid if f_gid else origen['uid']
+            
+            if target_sess_id in self.ui_sessions:
+                 try: self.ui_sessions[target_sess_id].sendall(msg_alert.encode('utf-8'))
+                 except: pass
+            else:
+                 print(f"[FILE] Recibido archivo de {origen['nick']} (UI cerrada)", file=sys.stderr)
+                
+        except Exception as e:
+             print(f"[X] Error notificando archivo: {e}", file=sys.stderr)
+
+    def _iniciar_chunk_binario(self, payload, origen, sock):
+        """Cabecera FILE_CHUNK binaria: los bytes que siguen van con pwrite al offset del chunk."""
+        import hashlib
+        self._cerrar_rx_binario(sock)
+        chunk_id = int(payload.get("chunk_id", 1))
+        ent = self._entrante_de(payload, origen, chunk_id)
+        offset = int(payload.get("offset", 0))
+        if ent and (ent.verificando or ent.tiene(chunk_id) or
+                    not ent.rango_valido(chunk_id, offset, int(payload.get("largo", -1)))):
+            ent = None  # Repetido o fuera de rango: se consumen los bytes sin escribir
+        self.rx_binario[sock] = {"ent": ent, "chunk_id": chunk_id, "offset": offset, "pos": offset,
+                                 "sha": hashlib.sha256() if payload.get("sha256_chunk") else None,
+                                 "sha_esperado": payload.get("sha256_chunk")}
+
+    def manejar_binario_tcp(self, evento, sock):
+        """Eventos de trama binaria (core/tramas.py): los trozos van directo del buffer de recepción a disco."""
+        if evento.tipo == BIN_INI:
+            # La cabecera es un paquete JSON normal (FILE_CHUNK con bin=True)
+            self.manejar_paquete_tcp(evento.datos, sock)
+            return
+
+        st = self.rx_binario.get(sock)
+        if evento.tipo == BIN_DATOS:
+            if st and st["ent"]:
+                try:
+                    st["ent"].escribir(st["pos"], evento.datos)
+                    st["pos"] += len(evento.datos)
+                    if st["sha"]: st["sha"].update(evento.datos)
+                except OSError as e:
+                    print(f"[X] Error escribiendo {st['ent'].part_path}: {e}", file=sys.stderr)
+                    st["ent"] = None
+            return
+
+        # BIN_FIN
+        if not st: return
+        del self.rx_binario[sock]
+        ent = st["ent"]
+        if not ent: return
+        chunk_id = st["chunk_id"]
+        if st["sha"] and st["sha"].hexdigest() != st["sha_esperado"]:
+            # Queda sin marcar: el emisor lo reenvía tras el próximo FILE_STATUS
+            print(f"[FILE] Chunk {chunk_id} de {ent.filename} con sha256 incorrecto, descartado", file=sys.stderr)
+            return
+        try:
+            self.transferencias.chunk_recibido(ent, chunk_id)
+            if chunk_id % 5 == 0:
+                print(f"[FILE] Recibiendo {ent.filename}: {chunk_id}/{ent.total_chunks}", file=sys.stderr)
+        except Exception as e:
+            print(f"[X] Error procesando chunk {chunk_id}: {e}", file=sys.stderr)
+
+    def _cerrar_rx_binario(self, sock):
+        """Conexión cerrada (o nueva cabecera) con un chunk binario a medias: queda sin marcar en el bitmap."""
+        st = self.rx_binario.pop(sock, None)
+        if st and st["ent"]:
+            print(f"[FILE] Chunk {st['chunk_id']} de {st['ent'].filename} incompleto, pendiente de reenvío", file=sys.stderr)
+
     # --- MANEJO RED (UDP + TCP) ---
 
     def manejar_paquete_udp(self, data_bytes, addr):
@@ -1724,6 +1966,7 @@ class Motor:
         if not valid: return
 
         tipo = data.get("tipo")
+        self.reactor.anotar(f"UDP {tipo}")
         origen = data.get("origen")
         if origen:
              print(f"[UDP_DEC] Tipo={tipo} De={origen.get('nick')} Port={origen.get('port_priv')}", file=sys.stderr)
@@ -1733,33 +1976,34 @@ class Motor:
         if origen:
              # Registro dinámico exclusivo en RAM (Volátil para escaneos y radar)
              uid = origen['uid']
+             self.red.registrar_proto(dict(origen, ip=addr[0]))
+             # Un broadcast/unicast UDP recibido confirma que el peer está en nuestra LAN
+             if origen.get('onion') and addr[0] != self.memoria.mi_ip:
+                 self.rutas.confirmar_lan(origen['onion'], addr[0], origen.get('port_priv', 44494))
              port_p = origen.get('port_priv')
              
              with self.memoria._lock:
-                 if uid not in self.memoria.peers:
-                     self.memoria.peers[uid] = {}
-                 
-                 # Update routing info in RAM only
+                 # Update routing info in RAM only (datos + índices en un paso)
                  print(f"[PEER_UPD] Actualizando RAM para {origen.get('nick')} -> Port: {port_p or 'DEFAULT'}", file=sys.stderr)
-                 self.memoria.peers[uid].update({
+                 campos = {
                      "uid": uid,
                      "nick": origen['nick'],
                      "ip": addr[0],
                      "onion": origen.get('onion'),
                      "last_seen": time.time(),
                      "status": "ONLINE"
-                 })
-                 if port_p: self.memoria.peers[uid]['port_priv'] = port_p
+                 }
+                 if port_p: campos['port_priv'] = port_p
+                 self.memoria.refrescar_peer(uid, campos)
 
         if tipo == "SEARCH":
             target_name = payload.get("group_name")
             print(f"[GROUP_DEBUG] Recibido SEARCH para '{target_name}'", file=sys.stderr)
-            for gid, gdata in self.memoria.grupos_activos.items():
-                if gdata['nombre'] == target_name:
-                    print(f"[GROUP_DEBUG] Grupo encontrado localmente. Respondiendo FOUND.", file=sys.stderr)
-                    resp = empaquetar("FOUND", {"type": "GROUP", "name": target_name, "gid": gid}, self.memoria.get_origen())
-                    try: self.red.sock_udp.sendto(resp, addr)
-                    except: pass
+            for gid in self.memoria.grupos_activos.uids("nombre", target_name):
+                print(f"[GROUP_DEBUG] Grupo encontrado localmente. Respondiendo FOUND.", file=sys.stderr)
+                resp = empaquetar("FOUND", {"type": "GROUP", "name": target_name, "gid": gid}, self.memoria.get_origen())
+                try: self.red.sock_udp.sendto(resp, addr)
+                except: pass
 
         elif tipo == "DISCOVER":
             filt = payload.get("filter", "ALL")
@@ -1913,52 +2157,58 @@ class Motor:
                     
                     if gid not in self.memoria.grupos_activos:
                         req_pkg = empaquetar("JOIN_REQ", {"gid": gid, "password_hash": pwd_to_send}, self.memoria.get_origen())
-                        try:
-                            from ghostwhisperchat.core.transporte import PORT_GROUP
-                            target_port = ambassador_port or PORT_GROUP
-                            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                            print(f"[MESH] Conectando a grupo en {ambassador_ip}:{target_port}", file=sys.stderr)
-                            s.connect((ambassador_ip, target_port))
-                            s.sendall(req_pkg + b'\n')
-                            self.red.registrar_socket_tcp(s, f"GRP_OUT_{gid}")
-                        except Exception as e:
-                            print(f"[X] Fallo al conectar con Grupo: {e}", file=sys.stderr)
+                        from ghostwhisperchat.core.transporte import PORT_GROUP
+                        target_port = ambassador_port or PORT_GROUP
+                        print(f"[MESH] Conectando a grupo en {ambassador_ip}:{target_port}", file=sys.stderr)
+                        # Connect + JOIN_REQ en el pool del reactor; el socket se registra en el bucle
+                        self.reactor.ejecutar_en_hilo(
+                            self._conectar_y_enviar, ambassador_ip, target_port, req_pkg,
+                            al_terminar=lambda s, e, gid=gid: self._embajador_conectado(gid, s, e))
 
     def manejar_paquete_tcp(self, data_bytes, sock):
         if len(data_bytes) < 2000:
-             print(f"[TCP_RAW] {data_bytes.strip()}", file=sys.stderr)
+             print(f"[TCP_RAW] {bytes(data_bytes).strip()}", file=sys.stderr)
         else:
              print(f"[TCP_RAW] (Large Packet) {len(data_bytes)} bytes", file=sys.stderr)
 
-        valid, data = desempaquetar(data_bytes)
+        try:
+            sesiones = self.sesiones_rx.setdefault(sock, {})
+        except TypeError:
+            sesiones = None
+        valid, data = desempaquetar(data_bytes, sesiones)
         if not valid: 
-            print("[TCP_ERR] Paquete invalido recibido", file=sys.stderr)
+            print(f"[TCP_ERR] Paquete invalido recibido ({data})", file=sys.stderr)
             return
         
         tipo = data.get("tipo")
+        self.reactor.anotar(f"TCP {tipo}")
         payload = data.get("payload")
         origen = data.get("origen")
         
         # print(f"[TCP_DEBUG] Recibido {tipo} de {origen.get('nick', 'UNK')}", file=sys.stderr)
         
-        if origen:
+        if origen and data.get("compacto") and origen.get('uid') in self.memoria.peers:
+             # Origen repuesto desde la sesión: ya se procesó en el handshake (o en el
+             # último PEER_UPDATE). Solo se refresca la señal de vida, sin tocar la agenda.
+             self.memoria.refrescar_peer(origen['uid'], {"last_seen": time.time(), "status": "ONLINE"})
+        elif origen:
+             self.red.registrar_proto(origen)
              uid = origen.get('uid')
              if uid:
                  with self.memoria._lock:
-                     if uid not in self.memoria.peers:
-                         self.memoria.peers[uid] = {}
-                     self.memoria.peers[uid].update({
+                     campos = {
                          "uid": uid,
                          "nick": origen.get('nick', 'Desconocido'),
                          "ip": origen.get('ip', '?.?.?.?'),
                          "onion": origen.get('onion'),
                          "last_seen": time.time(),
                          "status": "ONLINE"
-                     })
-                     if origen.get('sys_user'): self.memoria.peers[uid]['sys_user'] = origen.get('sys_user')
-                     if origen.get('status_msg') is not None: self.memoria.peers[uid]['status_msg'] = origen.get('status_msg')
-                     if origen.get('port_priv'): self.memoria.peers[uid]['port_priv'] = origen.get('port_priv')
-                     if origen.get('port_group'): self.memoria.peers[uid]['port_group'] = origen.get('port_group')
+                     }
+                     if origen.get('sys_user'): campos['sys_user'] = origen.get('sys_user')
+                     if origen.get('status_msg') is not None: campos['status_msg'] = origen.get('status_msg')
+                     if origen.get('port_priv'): campos['port_priv'] = origen.get('port_priv')
+                     if origen.get('port_group'): campos['port_group'] = origen.get('port_group')
+                     self.memoria.refrescar_peer(uid, campos)
 
              # Solo persistir en la agenda (contacts.json) si es interacción real de chat/grupo/archivo (no escaneo pasivo)
              if tipo not in ["DISCOVER", "FOUND", "SEARCH"]:
@@ -1994,57 +2244,20 @@ class Motor:
              # Actualizar estado de Escritores
 
              # self.typing_states = { chat_id: { uid: (timestamp, nick) } }
-             if not hasattr(self, 'typing_states'): self.typing_states = {}
-             if target_ui_id not in self.typing_states: self.typing_states[target_ui_id] = {}
+             activos = self.typing_states.setdefault(target_ui_id, {})
+             clave = (target_ui_id, sender_uid)
+             t = self._timers_typing.pop(clave, None)
+             if t: t.cancelar()
              
              if status:
-                 self.typing_states[target_ui_id][sender_uid] = (time.time(), sender_nick)
+                 activos[sender_uid] = (time.time(), sender_nick)
+                 # Caduca solo si el emisor deja de refrescarlo (sin limpieza inline)
+                 self._timers_typing[clave] = self.reactor.llamar_en(
+                     TYPING_EXPIRA, self._expirar_typing, target_ui_id, sender_uid)
              else:
-                 if sender_uid in self.typing_states[target_ui_id]:
-                     del self.typing_states[target_ui_id][sender_uid]
-             
-             # Calcular Texto Final
-             active = self.typing_states[target_ui_id]
-             
-             # Limpieza rapida de viejos (>3.5s)
-             now = time.time()
-             to_del = [u for u, (t, n) in active.items() if now - t > 3.5]
-             for u in to_del: del active[u]
-             
-             writers = [n for _, n in active.values()]
-             
-             label = ""
-             if len(writers) == 1:
-                 label = f"{writers[0]} escribiendo..."
-             elif len(writers) == 2:
-                 label = f"{writers[0]} y {writers[1]} escribiendo..."
-             elif len(writers) > 2:
-                 label = "Varios usuarios escribiendo..."
-             
-             # Enviar a la UI correspondiente
-             # FIX v2.151: Smart Lookup (UID vs Nickname mismatch)
-             target_sock = None
-             
-             # 1. Intento directo (Si la UI se abrio con UID)
-             if target_ui_id in self.ui_sessions:
-                 target_sock = self.ui_sessions[target_ui_id]
+                 activos.pop(sender_uid, None)
              
-             # 2. Intento por Nick (Si la UI se abrio con Nick "Pepe")
-             elif not chat_context: # Solo para Privados
-                 # target_ui_id es el sender_uid
-                 # Buscamos en todas las sesiones si alguna coincide con el nick de este UID
-                 expected_nick = sender_nick
-                 for s_id, sock in self.ui_sessions.items():
-                     if s_id == expected_nick:
-                         target_sock = sock
-                         # Actualizamos el target_ui_id ficticio para el diccionario de estados
-                         # (Ojo: esto puede ser chapuza, mejor solo encontramos el socket)
-                         break
-             
-             if target_sock:
-                 cmd = f"__TYPING_UPDATE__ {label}\n"
-                 try: target_sock.sendall(cmd.encode('utf-8'))
-                 except: pass
+             self._pintar_typing(target_ui_id, None if chat_context else sender_nick)
                  
              return # Fin manejo TYPING
 
@@ -2185,14 +2398,10 @@ class Motor:
              if sender_uid in self.ui_sessions:
                  try:
                      self.ui_sessions[sender_uid].sendall(b"\n[SISTEMA] [-] El usuario ha cerrado el chat. Cerrando en 3s...\n")
-                     time.sleep(3) 
-                     try: self.ui_sessions[sender_uid].shutdown(socket.SHUT_RDWR)
-                     except: pass
-                     self.ui_sessions[sender_uid].close()
-                     del self.ui_sessions[sender_uid]
+                     # El cierre va en un temporizador: el bucle sigue atendiendo mientras tanto
+                     self.reactor.llamar_en(3, self._cerrar_ui_chat, sender_uid, self.ui_sessions[sender_uid])
                  except: pass
                  
-                 from ghostwhisperchat.core.utilidades import enviar_notificacion
                  enviar_notificacion("Chat Finalizado", f"{origen['nick']} ha cerrado la sesión.")
 
         elif tipo == "SYNC":
@@ -2204,10 +2413,7 @@ class Motor:
                  g = self.memoria.grupos_activos[gid]
                  if 'miembros' not in g: g['miembros'] = {}
                  
-                 # Prepare ANNOUNCE packet
-                 ann_pkg = empaquetar("ANNOUNCE", {"gid": gid, "user": self.memoria.get_origen()}, self.memoria.get_origen())
-                 from ghostwhisperchat.core.transporte import PORT_GROUP
-
+                 a_conectar = []
                  for m in members:
                      uid = m.get('uid')
                      if uid == self.memoria.mi_uid: continue
@@ -2227,25 +2433,10 @@ class Motor:
                          onion=m.get('onion'),
                          remote_privacy=m.get('privacy_policy', 'AMBOS')
                      )
-                     
-                     target_host = self._resolver_host_objetivo(m)
-                     if not target_host: continue
-                     
-                     print(f"[DEBUG] SYNC: Conectando a {m.get('nick')} ({target_host})...", file=sys.stderr)
-                     try:
-                         tgt_gp = m.get('port_group') or PORT_GROUP
-                         if str(target_host).endswith(".onion"):
-                             s = self.red._conectar_socks5(target_host, tgt_gp, timeout=40.0)
-                         else:
-                             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                             s.settimeout(2.0)
-                             s.connect((target_host, tgt_gp))
-                         
-                         self.red.enviar_tcp(s, ann_pkg)
-                         self.red.registrar_socket_tcp(s, f"GRP_PEER_{gid}_{uid}")
-                         print(f"[MESH] Conectado y anunciado a {m.get('nick')}", file=sys.stderr)
-                     except Exception as e:
-                         print(f"[MESH] Fallo conexion mesh a {target_host}: {e}", file=sys.stderr)
+                     a_conectar.append(uid)
+                 
+                 # Conexión + ANNOUNCE a todos los miembros a la vez, en segundo plano
+                 self._unir_malla(gid, a_conectar)
                  
                  # Feature v2.153: Actualizar UI tras recibir SYNC
                  self._sincronizar_ui_usuarios(gid)
@@ -2293,10 +2484,8 @@ class Motor:
                          self.ui_sessions[gid].sendall(f"\n[SISTEMA] [+] {new_user['nick']} se ha unido al grupo.\n".encode('utf-8'))
                      
                      # Notificacion de Escritorio (Fix Paranoico v2.153.16)
-                     # Usamos import local y sleep igual que en LEAVE por consistencia
-                     time.sleep(0.1) 
-                     from ghostwhisperchat.core.utilidades import enviar_notificacion
-                     enviar_notificacion(f"Grupo {g['nombre']}", f"{new_user['nick']} se unió al grupo.")
+                     # La pausa de 0.1s previa a la notificación va en un temporizador, no en un sleep
+                     self.reactor.llamar_en(0.1, enviar_notificacion, f"Grupo {g['nombre']}", f"{new_user['nick']} se unió al grupo.")
 
         elif tipo == "LEAVE":
              gid = payload.get("gid")
@@ -2310,7 +2499,6 @@ class Motor:
                          # YELLOW INDICATOR [-]
                          self.ui_sessions[gid].sendall(f"\n[SISTEMA] [-] {origen['nick']} abandonó el grupo.\n".encode('utf-8'))
                      
-                     from ghostwhisperchat.core.utilidades import enviar_notificacion
                      enviar_notificacion(f"Grupo {g['nombre']}", f"{origen['nick']} abandonó el grupo.")
                      self._sincronizar_ui_usuarios(gid)
         
@@ -2320,106 +2508,48 @@ class Motor:
             # Descarte silencioso: el chat que fluye normal ya es la confirmacion visual.
             # Solo se actua si el mid existe (evita ACKs duplicados o fantasmas).
             if mid:
-                self.pending_ack.pop(mid, None)
+                self._descartar_ack(mid)
+
+        elif tipo in ("FILE_OFFER", "FILE_STATUS"):
+             # Oferta (o consulta tras un corte): responder qué chunks faltan
+             tid = payload.get("tid")
+             ent = self.transferencias.entrantes.get(tid) if tipo == "FILE_STATUS" else None
+             if tipo == "FILE_OFFER" and tid:
+                 print(f"[FILE] Oferta {tid}: {payload.get('filename')} ({payload.get('filesize')}b) de {origen.get('nick')}", file=sys.stderr)
+                 ent = self._entrante_de(payload, origen)
+             if ent:
+                 self._responder_faltantes(ent, origen)
+
+        elif tipo == "FILE_ACCEPT":
+             faltan = payload.get("faltantes")
+             print(f"[FILE] {origen.get('nick')} aceptó la transferencia {payload.get('tid')} "
+                   f"({len(faltan) if faltan is not None else '?'} parte(s) faltante(s))", file=sys.stderr)
+             self.transferencias.accept_recibido(origen.get('uid'), payload)
 
         elif tipo == "FILE_CHUNK":
+             if payload.get("bin"):
+                 # Cabecera de trama binaria: los bytes llegan a continuación por este socket
+                 self._iniciar_chunk_binario(payload, origen, sock)
+                 return
+
              filename = payload.get("filename")
-             chunk_id = payload.get("chunk_id", 1)
-             total_chunks = payload.get("total_chunks", 1)
+             chunk_id = int(payload.get("chunk_id", 1))
              b64_data = payload.get("data")
              
              import base64
              try:
+                 ent = self._entrante_de(payload, origen, chunk_id)
+                 if not ent or ent.verificando or ent.tiene(chunk_id): return
                  raw_data = base64.b64decode(b64_data)
-                 
-                 # Path Logic
-                 base_dir = os.path.expanduser("~/Escritorio")
-                 if not os.path.exists(base_dir): base_dir = os.path.expanduser("~/Desktop")
-                 if not os.path.exists(base_dir): base_dir = os.path.expanduser("~")
-                 
-                 dest_dir = os.path.join(base_dir, "GhostWhisper_Recibidos")
-                 os.makedirs(dest_dir, exist_ok=True)
-                 
-                 # Temp file strategy for concurrency safe reassembly
-                 # UID + Filename ensures unique stream per sender/file
-                 temp_name = f".{filename}.part.{origen.get('uid', 'unk')}"
-                 part_path = os.path.join(dest_dir, temp_name)
-                 
-                 mode = 'wb' if chunk_id == 1 else 'ab'
-                 with open(part_path, mode) as f:
-                     f.write(raw_data)
-                     
-                 # Completion Check
-                 # Completion Check
-                 if chunk_id == total_chunks:
-                     # FIX v2.165: Organizacion Automatica de Fotos
-                     # Si es imagen, guardar en subcarpeta 'Fotos_Recibidas'
-                     lower_name = filename.lower()
-                     es_imagen = lower_name.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff'))
-                     
-                     if es_imagen:
-                         target_subdir = os.path.join(dest_dir, "Fotos_Recibidas")
-                         os.makedirs(target_subdir, exist_ok=True)
-                         final_path = os.path.join(target_subdir, filename)
-                     else:
-                         final_path = os.path.join(dest_dir, filename)
-
-                     # Avoid overwrite logic (generic)
-                     if os.path.exists(final_path):
-                         base, ext = os.path.splitext(filename)
-                         # We strip path from filename first to be safe
-                         safe_fname = os.path.basename(filename)
-                         base, ext = os.path.splitext(safe_fname)
-                         
-                         # Reconstruct path with timestamp
-                         final_path = os.path.join(os.path.dirname(final_path), f"{base}_{int(time.time())}{ext}")
-                     
-                     os.rename(part_path, final_path)
-                     print(f"[FILE] Completado: {final_path}", file=sys.stderr)
-                     
-                     # Notify User (Desktop)
-                     # v2.133: Logic restored. We now check payload 'gid'.
-                     f_gid = payload.get("gid")
-                     
-                     noti_title = "PRIV recepcion archivo"
-                     if f_gid and f_gid in self.memoria.grupos_activos:
-                          g_name = self.memoria.grupos_activos[f_gid]['nombre']
-                          noti_title = f"GRUP {g_name} recepcion archivo"
-                          
-                     noti_body = f"{origen['nick']} te envio un archivo"
-                     
-                     # FIX v2.166: Personalizacion Foto vs Archivo
-                     if es_imagen:
-                         noti_title = "Descarga de foto"
-                         noti_body = f"{origen['nick']} te mando una foto"
-                     
-                     from ghostwhisperchat.core.utilidades import enviar_notificacion
-                     enviar_notificacion(noti_title, noti_body)
-                      
-                     # Console Notification - User format
-                     try:
-                         from ghostwhisperchat.datos.recursos import Colores
-                         
-                         safe_fname = os.path.basename(final_path)
-                         if es_imagen:
-                             msg_alert = f"\n{Colores.C_GREEN_NEON}[SISTEMA] [!] Recepcion de foto finalizada: {safe_fname}{Colores.RESET}\n"
-                             msg_alert += f"__NATIVE_IMG__{final_path}\n"
-                         else:
-                             msg_alert = f"\n{Colores.YELLOW}[SISTEMA] [!] {origen['nick']} te ha enviado: {safe_fname}{Colores.RESET}\n"
-                         
-                         # FIX v2.160.2: Broadcast ONLY to relevant session
-                         target_sess_id = f_gid if f_gid else origen['uid']
-                         
-                         if target_sess_id in self.ui_sessions:
-                              try: self.ui_sessions[target_sess_id].sendall(msg_alert.encode('utf-8'))
-                              except: pass
-                         else:
-                              print(f"[FILE] Recibido archivo de {origen['nick']} (UI cerrada)", file=sys.stderr)
-                             
-                     except Exception as e:
-                          print(f"[X] Error notificando archivo: {e}", file=sys.stderr)
-                 elif chunk_id % 5 == 0:
-                     print(f"[FILE] Recibiendo {filename}: {chunk_id}/{total_chunks}", file=sys.stderr)
+                 offset = (chunk_id - 1) * ent.chunk_size
+                 if not ent.rango_valido(chunk_id, offset, len(raw_data)):
+                     print(f"[FILE] Chunk {chunk_id} de {filename} fuera de rango, descartado", file=sys.stderr)
+                     return
+                 # Misma ruta que el canal binario: pwrite al offset + bitmap
+                 ent.escribir(offset, raw_data)
+                 self.transferencias.chunk_recibido(ent, chunk_id)
+                 if chunk_id % 5 == 0:
+                     print(f"[FILE] Recibiendo {filename}: {chunk_id}/{ent.total_chunks}", file=sys.stderr)
 
              except Exception as e:
                  print(f"[X] Error procesando chunk {chunk_id}: {e}", file=sys.stderr)
@@ -2665,7 +2795,6 @@ class Motor:
                  noti_title = "Ausente"
                  noti_body = f"{nick} no ha respondido la solicitud."
             
-            from ghostwhisperchat.core.utilidades import enviar_notificacion
             enviar_notificacion(noti_title, noti_body)
             
         elif tipo == "CHAT_BYE":
@@ -2681,7 +2810,6 @@ class Motor:
                  except: pass
                  
              # Notificacion de Escritorio
-             from ghostwhisperchat.core.utilidades import enviar_notificacion
              enviar_notificacion("GhostWhisperChat", f"{nick} dejó el chat privado.")
 
         elif tipo == "MSG":
@@ -2689,6 +2817,16 @@ class Motor:
              gid = payload.get("gid")
              target_id = gid if gid else origen['uid']
              
+             # Gossip: un mid ya visto es un duplicado; uno nuevo se reenvía completo
+             # (mismo origen = el autor, sin la sesión del salto anterior) a `fanout`
+             # miembros al azar y se muestra
+             mid = payload.get("mid")
+             if gid and mid:
+                 if not self.vistos_grupo.registrar(gid, mid):
+                     return
+                 if gid in self.memoria.grupos_activos:
+                     self._enviar_a_grupo(gid, reenviable(data), excluir={origen.get('uid')}, gossip=True)
+             
              # Smart Notification Tracker
              now = time.time()
              last_act = self.last_activity.get(target_id, 0)
@@ -2705,7 +2843,7 @@ class Motor:
              if target_id in self.ui_sessions:
                  # Logic for Mention Detection
                  import re
-                 from ghostwhisperchat.core.utilidades import normalize_text, enviar_notificacion
+                 from ghostwhisperchat.core.utilidades import normalize_text
                  from ghostwhisperchat.datos.recursos import Colores
                  
                  # Nick Color Calculation (Deterministic - Improved v2.113)
@@ -2824,38 +2962,28 @@ class Motor:
                  except: pass
                  
                  # 4. Delivery Receipt: enviar MSG_ACK al emisor (solo chats privados, no grupos)
-                 # El ACK corre en daemon thread para no bloquear la UI del receptor.
-                 # Semaforo (max 2 vuelos simultaneos) evita saturar threads Tor si el
-                 # emisor manda muchos mensajes rapido antes de que el pool inverso este listo.
+                 # El ACK va por el despachador: misma cola FIFO que el resto del tráfico
+                 # hacia ese peer, sin bloquear la UI del receptor ni crear hilos por ACK.
                  mid = payload.get("mid")
                  if mid and not gid:  # Solo privados (grupos no tienen ACK individual)
                      sender_uid = origen.get('uid')
-                     if not hasattr(self, '_ack_semaphore'):
-                         self._ack_semaphore = threading.Semaphore(2)
-                     def _send_ack(uid=sender_uid, m=mid):
-                         if not self._ack_semaphore.acquire(blocking=False):
-                             # Pool ocupado: ACK se descarta. El emisor ya tiene 2 en vuelo.
-                             # Sus otros ACKs llegaran cuando el circuito este libre.
-                             print(f"[ACK] Semaforo lleno, descartando ACK mid={m[:6]}", file=sys.stderr)
-                             return
-                         try:
-                             peer_src = self.memoria.peers.get(uid) or self.memoria.contactos.get(uid)
-                             if peer_src:
-                                 ack_dest = self._resolver_host_objetivo(peer_src)
-                                 ack_port = peer_src.get('port_priv', 44494)
-                             else:
-                                 # Fallback: usar origen del paquete
-                                 ack_dest = origen.get('onion') or origen.get('ip')
-                                 ack_port = origen.get('port_priv', 44494)
-                             if ack_dest:
-                                 ack_pkg = empaquetar("MSG_ACK", {"mid": m}, self.memoria.get_origen())
-                                 self.red.enviar_tcp_priv(ack_dest, ack_pkg, port=ack_port)
-                                 print(f"[ACK] MSG_ACK enviado (mid={m[:6]}) a {ack_dest}", file=sys.stderr)
-                         except Exception as e:
-                             print(f"[ACK_WARN] No se pudo enviar MSG_ACK: {e}", file=sys.stderr)
-                         finally:
-                             self._ack_semaphore.release()
-                     threading.Thread(target=_send_ack, daemon=True).start()
+                     try:
+                         peer_src = self.memoria.peers.get(sender_uid) or self.memoria.contactos.get(sender_uid)
+                         if peer_src:
+                             ack_dest = self._resolver_host_objetivo(peer_src)
+                             ack_port = peer_src.get('port_priv', 44494)
+                         else:
+                             # Fallback: usar origen del paquete
+                             ack_dest = origen.get('onion') or origen.get('ip')
+                             ack_port = origen.get('port_priv', 44494)
+                         if ack_dest:
+                             ack_pkg = empaquetar("MSG_ACK", {"mid": mid}, self.memoria.get_origen())
+                             def _ack_enviado(ok, m=mid, dest=ack_dest):
+                                 if ok: print(f"[ACK] MSG_ACK enviado (mid={m[:6]}) a {dest}", file=sys.stderr)
+                                 else: print(f"[ACK_WARN] No se pudo enviar MSG_ACK (mid={m[:6]})", file=sys.stderr)
+                             self.despachador.encolar(ack_dest, ack_port, ack_pkg, on_done=_ack_enviado)
+                     except Exception as e:
+                         print(f"[ACK_WARN] No se pudo enviar MSG_ACK: {e}", file=sys.stderr)
                       
                  # Smart Notification even if UI Open (AFK Check)
                  if (now - last_act) > 180:
@@ -2865,30 +2993,156 @@ class Motor:
                  if (now - last_act) > 180:
                      enviar_notificacion(noti_title, trunc_text)
 
-    def _hilo_ping(self):
-        while self.running:
-            if not self.memoria.invisible:
-                pkg = empaquetar("DISCOVER", {"filter": "PING"}, self.memoria.get_origen())
-                try: self.red.enviar_udp_broadcast(pkg)
-                except: pass
-            time.sleep(15)
+    def _encolar_chat_req_global(self, target, dest_host, port, req):
+        """Encola un CHAT_REQ vía Tor (conexión fresca) y marca REJECTED si no se entrega."""
+        def _chat_req_enviado(ok):
+            if ok:
+                print(f"[CHAT_WAN] Solicitud entregada exitosamente a {target}.", file=sys.stderr)
+            else:
+                print(f"[CHAT_WAN] [X] No se pudo entregar solicitud a {target}.", file=sys.stderr)
+                self.chat_requests_status[target] = ('REJECTED', target, 'No se pudo conectar vía Global')
+        self.despachador.encolar(dest_host, port, req, force_new=True,
+                                 on_done=lambda ok: self.reactor.llamar_pronto(_chat_req_enviado, ok))
+
+    # --- Temporizadores (reactor.llamar_en) ---
+    # Reemplazan a los hilos que dormían y barrían tablas enteras (_hilo_ping,
+    # _hilo_ack_timeout, _hilo_keepalive_chat, _hilo_tor_watchdog y el
+    # limpiar_peers_inactivos de cada vuelta). Cada vencimiento se agenda por
+    # separado: un peer, un mid, un chat. La actividad no toca el heap: al vencer
+    # se mira el último timestamp y, si hubo tráfico, se re-agenda por lo que falta.
+
+    def _iniciar_temporizadores(self):
+        self.reactor.llamar_en(0, self._ping)
+        self.reactor.llamar_en(INTERVALO_PURGA_POOL, self._purgar_pool)
+        self.reactor.llamar_en(INTERVALO_IP_LOCAL, self._refrescar_ip_local)
+        with self.memoria._lock:
+            uids = list(self.memoria.peers)
+        for uid in uids:
+            self._agendar_expiracion_peer(uid)
+
+    def _ping(self):
+        if not self.running: return
+        if not self.memoria.invisible:
+            pkg = empaquetar("DISCOVER", {"filter": "PING"}, self.memoria.get_origen())
+            try: self.red.enviar_udp_broadcast(pkg)
+            except: pass
+        self.reactor.llamar_en(INTERVALO_PING, self._ping)
+
+    def _purgar_pool(self):
+        # Pool TCP: cerrar conexiones ociosas vencidas
+        self.red.pool_purgar_inactivos()
+        self.reactor.llamar_en(INTERVALO_PURGA_POOL, self._purgar_pool)
+
+    def _refrescar_ip_local(self):
+        # IP local cacheada: re-verificar (cambio de interfaz / DHCP)
+        nueva_ip = self.rutas.refrescar_ip_local()
+        if nueva_ip:
+            self.memoria.mi_ip = nueva_ip
+        self.reactor.llamar_en(INTERVALO_IP_LOCAL, self._refrescar_ip_local)
+
+    def _agendar_expiracion_peer(self, uid, segundos=PEER_TIMEOUT):
+        """Un temporizador por peer (llamable desde cualquier hilo; idempotente)."""
+        t = self._timers_peer.get(uid)
+        if t is not None and t.activo():
+            return
+        self._timers_peer[uid] = self.reactor.llamar_en(segundos, self._vencer_peer, uid)
+
+    def _vencer_peer(self, uid):
+        self._timers_peer.pop(uid, None)
+        restante = self.memoria.expirar_peer(uid, PEER_TIMEOUT)
+        if restante:
+            # Hubo señales de vida desde que se agendó
+            self._agendar_expiracion_peer(uid, restante)
+
+    def _descartar_ack(self, mid):
+        self.pending_ack.pop(mid, None)
+        t = self._timers_ack.pop(mid, None)
+        if t: t.cancelar()
+
+    def _ack_vencido(self, mid):
+        """
+        Un mensaje no recibió MSG_ACK en ACK_TIMEOUT: aviso en la UI del emisor.
+        Solo se activa cuando algo sale mal; el flujo normal no genera ningun mensaje extra.
+        """
+        self._timers_ack.pop(mid, None)
+        pendiente = self.pending_ack.pop(mid, None)
+        if not pendiente: return
+        chat_id, _, preview = pendiente
+        if chat_id in self.ui_sessions:
+            try:
+                from ghostwhisperchat.datos.recursos import Colores
+                self.ui_sessions[chat_id].sendall(
+                    f"{Colores.YELLOW}[!] No se pudo confirmar si llego el mensaje: '{preview}'.{Colores.RESET}\n".encode('utf-8')
+                )
+            except: pass
+        print(f"[ACK_TIMEOUT] Sin ACK para mid={mid[:6]} en chat={chat_id[:8]}", file=sys.stderr)
+
+    def _agendar_keepalive(self, chat_id, segundos=KEEPALIVE_IDLE):
+        t = self._timers_keepalive.get(chat_id)
+        if t is not None and t.activo():
+            return
+        self._timers_keepalive[chat_id] = self.reactor.llamar_en(segundos, self._keepalive_chat, chat_id)
 
-    def _hilo_tor_watchdog(self):
+    def _keepalive_chat(self, chat_id):
         """
-        Watchdog de salud Tor: cada 60s verifica si el proxy SOCKS5 local responde.
-        Si no responde, intenta recuperar circuitos:
+        Vividor de chat: envia un paquete CHAT_KEEP silencioso a los peers del chat
+        si no hubo trafico real en los últimos KEEPALIVE_IDLE segundos.
+        Esto mantiene vivos los circuitos Tor durante pausas de conversación.
+        Solo existe mientras el chat tiene una UI abierta.
+        """
+        self._timers_keepalive.pop(chat_id, None)
+        if chat_id not in self.ui_sessions:
+            return
+        inactivo = time.time() - self.session_last_activity.get(chat_id, 0)
+        if inactivo < KEEPALIVE_IDLE:
+            # Hubo actividad: volver a mirar cuando se cumpla el umbral
+            self._agendar_keepalive(chat_id, KEEPALIVE_IDLE - inactivo)
+            return
+        self._agendar_keepalive(chat_id)
+        if not self.memoria.mi_onion:
+            return  # Sin Tor no hay circuitos que mantener
+
+        # Destinos de este chat: las mismas conexiones del pool que usan sus mensajes
+        _, destinos = self._destinos_chat(chat_id)
+        
+        if not destinos:
+            return
+        
+        # Enviar CHAT_KEEP via despachador (descartable). Si la cola hacia el peer está
+        # ocupada no hace falta: ese tráfico ya mantiene vivo el circuito
+        keep_pkg = empaquetar("CHAT_KEEP", {}, self.memoria.get_origen())
+        for host, port in destinos:
+            def _keep_enviado(ok, cid=chat_id, h=host, p=port):
+                if ok:
+                    self.session_last_activity[cid] = time.time()
+                    print(f"[KEEP] Keepalive enviado a {h}:{p} (chat={cid[:8]})", file=sys.stderr)
+                else:
+                    print(f"[KEEP_WARN] Keepalive no enviado a {h}:{p} (error o cola ocupada)", file=sys.stderr)
+            self.despachador.encolar(host, port, keep_pkg, descartable=True, solo_si_libre=True,
+                                     on_done=lambda ok, f=_keep_enviado: self.reactor.llamar_pronto(f, ok))
+
+    def _vigilar_tor(self):
+        """
+        Watchdog de salud Tor: cada INTERVALO_TOR_WATCHDOG verifica si el proxy SOCKS5 local responde.
+        Las pruebas bloquean (connect con timeout, re-inicio de Tor): corren en un hilo
+        y al terminar re-agendan el próximo chequeo.
+        """
+        if not self.running: return
+        if not self.memoria.mi_onion:
+            # Tor no activo, nada que vigilar
+            self.reactor.llamar_en(INTERVALO_TOR_WATCHDOG, self._vigilar_tor)
+            return
+        threading.Thread(target=self._chequear_tor, daemon=True).start()
+
+    def _chequear_tor(self):
+        """
+        Si el SOCKS5 no responde, intenta recuperar circuitos:
           1. Solicita nuevos circuitos via NEWNYM (stem).
           2. Si persiste, re-inicializa el TorManager completo.
         También limpia sockets TCP muertos del pool de select() para evitar bloqueos.
         """
         import socket as _socket
-        CHECK_INTERVAL = 60  # segundos entre verificaciones
-        
-        while self.running:
-            time.sleep(CHECK_INTERVAL)
-            if not self.running: break
-            if not self.memoria.mi_onion: continue  # Tor no activo, nada que vigilar
-
+        try:
             # --- 1. Test rápido: ¿responde el SOCKS5? ---
             socks_ok = False
             try:
@@ -2899,6 +3153,7 @@ class Motor:
                 socks_ok = True
             except Exception as e:
                 print(f"[TOR_WATCH] SOCKS5 no responde en {self.red.socks_host}:{self.red.socks_port} → {e}", file=sys.stderr)
+            self.rutas.tor_disponible = socks_ok
 
             if socks_ok:
                 # --- 2. SOCKS5 OK: solicitar nuevos circuitos via NEWNYM (previene circuitos viejos) ---
@@ -2910,22 +3165,8 @@ class Motor:
                 except Exception as e:
                     print(f"[TOR_WATCH] NEWNYM fallido (ignorado): {e}", file=sys.stderr)
 
-                # --- 3. Limpiar sockets TCP muertos del pool de select ---
-                dead = []
-                for s in list(self.red.tcp_connections):
-                    try:
-                        # Un socket muerto genera error inmediatamente con fileno() < 0 o getpeername()
-                        if s.fileno() < 0:
-                            dead.append(s)
-                            continue
-                        s.getpeername()
-                    except Exception:
-                        dead.append(s)
-                for s in dead:
-                    try: self.red.cerrar_tcp(s)
-                    except: pass
-                if dead:
-                    print(f"[TOR_WATCH] {len(dead)} socket(s) TCP muerto(s) limpiados.", file=sys.stderr)
+                # --- 3. Limpiar sockets TCP muertos (en el hilo del bucle: toca buffers y reactor) ---
+                self.reactor.llamar_pronto(self._limpiar_sockets_muertos)
             else:
                 # --- 4. SOCKS5 CAÍDO: re-inicializar TorManager ---
                 print("[TOR_WATCH] Intentando re-inicializar Tor...", file=sys.stderr)
@@ -2936,225 +3177,211 @@ class Motor:
                     if self.tor.iniciar():
                         self.memoria.mi_onion = self.tor.onion_address
                         self.red.set_socks_proxy(self.tor.socks_host, self.tor.socks_port)
+                        self.rutas.tor_disponible = True
                         self.memoria.guardar_configuracion()
                         print(f"[TOR_WATCH] Tor re-inicializado OK → {self.tor.onion_address}", file=sys.stderr)
                     else:
                         print(f"[TOR_WATCH] Re-inicialización fallida: {self.tor.status_message}", file=sys.stderr)
                 except Exception as e:
                     print(f"[TOR_WATCH] Error en re-inicialización: {e}", file=sys.stderr)
+        finally:
+            if self.running:
+                self.reactor.llamar_en(INTERVALO_TOR_WATCHDOG, self._vigilar_tor)
 
-    def _hilo_ack_timeout(self):
-        """
-        Vigila los mensajes pendientes de confirmacion (pending_ack).
-        Si un mensaje no recibe MSG_ACK en 60s, muestra un aviso en la UI del emisor.
-        Solo se activa cuando algo sale mal; el flujo normal no genera ningun mensaje extra.
-        """
-        ACK_TIMEOUT = 60.0   # 60s: ida Tor (~15-30s) + ACK de vuelta (~15-30s) + margen
-        CHECK_INTERVAL = 10.0
-        
-        while self.running:
-            time.sleep(CHECK_INTERVAL)
-            if not self.running: break
-            if not self.pending_ack: continue
-            
-            now = time.time()
-            expired = [
-                (mid, chat_id, preview)
-                for mid, (chat_id, sent_at, preview) in list(self.pending_ack.items())
-                if now - sent_at > ACK_TIMEOUT
-            ]
-            
-            for mid, chat_id, preview in expired:
-                self.pending_ack.pop(mid, None)
-                if chat_id in self.ui_sessions:
-                    try:
-                        from ghostwhisperchat.datos.recursos import Colores
-                        self.ui_sessions[chat_id].sendall(
-                            f"{Colores.YELLOW}[!] No se pudo confirmar si llego el mensaje: '{preview}'.{Colores.RESET}\n".encode('utf-8')
-                        )
-                    except: pass
-                print(f"[ACK_TIMEOUT] Sin ACK para mid={mid[:6]} en chat={chat_id[:8]}", file=sys.stderr)
+    def _limpiar_sockets_muertos(self):
+        dead = []
+        for s in list(self.red.tcp_connections):
+            try:
+                # Un socket muerto genera error inmediatamente con fileno() < 0 o getpeername()
+                if s.fileno() < 0:
+                    dead.append(s)
+                    continue
+                s.getpeername()
+            except Exception:
+                dead.append(s)
+        for s in dead:
+            self.tcp_buffers.pop(s, None)
+            self._cerrar_rx_binario(s)
+            try: self.red.cerrar_tcp(s)
+            except: pass
+        if dead:
+            print(f"[TOR_WATCH] {len(dead)} socket(s) TCP muerto(s) limpiados.", file=sys.stderr)
 
-    def _hilo_keepalive_chat(self):
+    def _propagar_actualizacion_perfil(self, context_ui=None):
         """
-        Vividor de chat: envia un paquete CHAT_KEEP silencioso a cada peer activo
-        si no hubo trafico real en los últimos IDLE_THRESHOLD segundos.
-        Esto mantiene vivos los circuitos Tor durante pausas de conversación.
-        Solo actua sobre sesiones que realmente tienen una UI abierta (chat activo).
+        Difunde PEER_UPDATE a todos (miembros de grupos + peers online), una vez por uid.
+        Sale por el despachador (pool LAN y Tor, onion incluido) y retorna en el acto
+        con la cantidad de destinos encolados. Entregados/fallidos se informan al
+        terminar en la UI del chat desde donde se pidió (o en las UIs abiertas).
         """
-        IDLE_THRESHOLD = 45.0   # segundos sin trafico antes de enviar keepalive
-        CHECK_INTERVAL = 15.0   # frecuencia de revision del hilo
-        
-        while self.running:
-            time.sleep(CHECK_INTERVAL)
-            if not self.running: break
-            if not self.ui_sessions: continue  # Sin sesiones activas, nada que hacer
-
-            now = time.time()
-            keep_pkg = empaquetar("CHAT_KEEP", {}, self.memoria.get_origen())
-            
-            for chat_id in list(self.ui_sessions.keys()):
-                last = self.session_last_activity.get(chat_id, 0)
-                if now - last < IDLE_THRESHOLD:
-                    continue  # Hubo actividad reciente, no necesita keepalive
-                
-                # Determinar destinos de este chat (privado o grupo)
-                destinos = []  # lista de (host, port)
-                
-                if chat_id in self.memoria.grupos_activos:
-                    g = self.memoria.grupos_activos[chat_id]
-                    for m in g.get('miembros', {}).values():
-                        if m.get('uid') == self.memoria.mi_uid: continue
-                        host = self._resolver_host_objetivo(m)
-                        if host:
-                            destinos.append((host, m.get('port_priv', 44494)))
-                else:
-                    # Chat privado: buscar peer por uid (chat_id)
-                    p = self.memoria.peers.get(chat_id) or self.memoria.contactos.get(chat_id)
-                    if p:
-                        host = self._resolver_host_objetivo(p)
-                        if host:
-                            destinos.append((host, p.get('port_priv', 44494)))
-                
-                if not destinos:
-                    continue
-                
-                # Enviar CHAT_KEEP de forma async (no bloquear el hilo watchdog)
-                def _send_keep(targets, pkg=keep_pkg, cid=chat_id):
-                    for host, port in targets:
-                        try:
-                            ok = self.red.enviar_tcp_priv(host, pkg, port=port)
-                            if ok:
-                                self.session_last_activity[cid] = time.time()
-                                print(f"[KEEP] Keepalive enviado a {host}:{port} (chat={cid[:8]})", file=sys.stderr)
-                        except Exception as e:
-                            print(f"[KEEP_WARN] Error enviando keepalive a {host}:{port}: {e}", file=sys.stderr)
-                
-                threading.Thread(target=_send_keep, args=(destinos,), daemon=True).start()
-
-    def tareas_mantenimiento(self):
-        self.memoria.limpiar_peers_inactivos()
-
-    def _propagar_actualizacion_perfil(self):
-        """Helper to broadcast PEER_UPDATE packet to everyone (Group + Peers)"""
         pkg = empaquetar("PEER_UPDATE", {}, self.memoria.get_origen())
         from ghostwhisperchat.core.transporte import PORT_GROUP
         
-        processed = 0
-        sent_uids = set()
+        destinos = {}   # uid -> (host, port)
         
-        # 1. Groups
+        # 1. Groups (por su port_group: la conexión que ya usa el grupo)
         for gid, g in self.memoria.grupos_activos.items():
             members = g.get('miembros', {})
             m_list = list(members.values()) if isinstance(members, dict) else members
             for m in m_list:
                 uid_member = m.get('uid')
-                if uid_member == self.memoria.mi_uid: continue
-                if uid_member in sent_uids: continue
-                
-                ip = m.get('ip')
-                if not ip: continue
-                
-                try:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.settimeout(0.5) 
-                    port_g = m.get('port_group', PORT_GROUP)
-                    s.connect((ip, port_g))
-                    s.sendall(pkg + b'\n') 
-                    s.close()
-                    processed += 1
-                    sent_uids.add(uid_member)
-                except: pass
+                if uid_member == self.memoria.mi_uid or uid_member in destinos: continue
+                host = self._resolver_host_objetivo(m)
+                if host:
+                    destinos[uid_member] = (host, m.get('port_group') or PORT_GROUP)
         
         # 2. Direct Peers (Private)
-        all_peers = list(self.memoria.peers.values())
-        for p in all_peers:
-            uid_p = p.get('uid')
-            if uid_p == self.memoria.mi_uid: continue
-            if uid_p in sent_uids: continue 
-            
+        for uid_p, p in list(self.memoria.peers.items()):
+            if uid_p == self.memoria.mi_uid or uid_p in destinos: continue
             if p.get('status') == 'ONLINE' or uid_p in self.ui_sessions:
-                 ip = p.get('ip')
-                 if not ip: continue
-                 
-                 try:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.settimeout(0.5) 
-                    port_p = p.get('port_priv', 44494) 
-                    s.connect((ip, port_p))
-                    s.sendall(pkg + b'\n') 
-                    s.close()
-                    processed += 1
-                    sent_uids.add(uid_p)
-                 except: pass
-                 
-        return processed
+                host = self._resolver_host_objetivo(p)
+                if host:
+                    destinos[uid_p] = (host, p.get('port_priv', 44494))
+        
+        if not destinos:
+            return 0
+        
+        progreso = {"pendientes": len(destinos), "ok": 0, "fallidos": 0,
+                    "ui": context_ui[1] if context_ui else None}
+        for host, port in destinos.values():
+            # on_done corre en un worker del despachador (o en el acto si la cola está llena):
+            # el conteo vuelve al bucle
+            self.despachador.encolar(
+                host, port, pkg, on_done=lambda ok: self.reactor.llamar_pronto(self._perfil_entregado, progreso, ok))
+        print(f"[PERFIL] PEER_UPDATE encolado para {len(destinos)} nodos", file=sys.stderr)
+        return len(destinos)
+
+    def _perfil_entregado(self, progreso, ok):
+        progreso["ok" if ok else "fallidos"] += 1
+        progreso["pendientes"] -= 1
+        if progreso["pendientes"] > 0:
+            return
+        
+        resumen = f"Perfil propagado: {progreso['ok']} entregados, {progreso['fallidos']} fallidos."
+        print(f"[PERFIL] {resumen}", file=sys.stderr)
+        chat_id = progreso["ui"]
+        socks = [self.ui_sessions[chat_id]] if chat_id in self.ui_sessions else list(self.ui_sessions.values())
+        for s in socks:
+            try: s.sendall(f"\n[SISTEMA] [*] {resumen}\n".encode('utf-8'))
+            except: pass
+
+
+    def _expirar_typing(self, chat_id, uid):
+        """Temporizador: el peer dejó de refrescar su TYPING (o perdimos el STOP)."""
+        self._timers_typing.pop((chat_id, uid), None)
+        activos = self.typing_states.get(chat_id, {})
+        previo = activos.pop(uid, None)
+        if not activos:
+            self.typing_states.pop(chat_id, None)
+        if previo:
+            # En privado chat_id es el uid del peer: la UI puede estar abierta por nick
+            self._pintar_typing(chat_id, previo[1] if chat_id == uid else None)
+
+    def _pintar_typing(self, chat_id, nick_privado=None):
+        """Manda a la UI del chat la etiqueta 'X escribiendo...' según typing_states."""
+        writers = [n for _, n in self.typing_states.get(chat_id, {}).values()]
+        
+        label = ""
+        if len(writers) == 1:
+            label = f"{writers[0]} escribiendo..."
+        elif len(writers) == 2:
+            label = f"{writers[0]} y {writers[1]} escribiendo..."
+        elif len(writers) > 2:
+            label = "Varios usuarios escribiendo..."
+        
+        # FIX v2.151: Smart Lookup (UID vs Nickname mismatch)
+        # 1. Intento directo (Si la UI se abrio con UID)
+        # 2. Intento por Nick (Si la UI se abrio con Nick "Pepe"), solo para Privados
+        target_sock = self.ui_sessions.get(chat_id)
+        if target_sock is None and nick_privado:
+            target_sock = self.ui_sessions.get(nick_privado)
+        
+        if target_sock:
+            cmd = f"__TYPING_UPDATE__ {label}\n"
+            try: target_sock.sendall(cmd.encode('utf-8'))
+            except: pass
+
+    def _destinos_chat(self, chat_id):
+        """
+        (gid, [(host, port)]) de los peers de un chat: miembros del grupo por su port_group
+        (la misma conexión del pool que usan los MSG del grupo) o el peer privado por port_priv.
+        gid es None si el chat es privado.
+        """
+        from ghostwhisperchat.core.transporte import PORT_GROUP
+        
+        # --- FIX v2.152: Resolver Nombre Grupo -> GID ---
+        real_gid = None
+        if chat_id in self.memoria.grupos_activos:
+            real_gid = chat_id
+        else:
+            real_gid = next(iter(self.memoria.grupos_activos.uids("nombre", chat_id)), None)
+        
+        destinos = []
+        if real_gid:
+            g = self.memoria.grupos_activos[real_gid]
+            for uid, m in g.get('miembros', {}).items():
+                if uid == self.memoria.mi_uid: continue
+                dest = self._resolver_host_objetivo(m)
+                if dest:
+                    destinos.append((dest, m.get('port_group') or PORT_GROUP))
+        else:
+            p = self.memoria.buscar_peer(chat_id)
+            if not p and chat_id in self.memoria.contactos:
+                p = self.memoria.contactos[chat_id]
+            if p:
+                dest = self._resolver_host_objetivo(p)
+                if dest:
+                    destinos.append((dest, p.get('port_priv', 44494)))
+        return real_gid, destinos
 
     # FIX v2.169: Helper para difundir estado de escritura (Fire & Forget)
     def _difundir_typing(self, target_id, status):
-        """Envia paquete ligero TYPING a la red con timeout corto"""
+        """
+        Estado de escritura local hacia los peers del chat, coalescido por chat:
+        - un STOP tras un START sale en el acto (así llega antes que el MSG que le sigue);
+        - START repetidos o cambios más seguidos que TYPING_INTERVALO_MIN se juntan y
+          sale solo el último estado al cumplirse el intervalo.
+        """
+        st = self.typing_salida.setdefault(target_id, {"enviado": False, "t": 0.0, "pendiente": None, "timer": None})
+        espera = st["t"] + TYPING_INTERVALO_MIN - time.time()
+        
+        if status == st["enviado"] and (not status or espera > 0):
+            st["pendiente"] = None      # Nada nuevo que contar (o ya refrescado hace poco)
+            return False
+        if status and espera > 0:
+            st["pendiente"] = status
+            if not (st["timer"] and st["timer"].activo()):
+                st["timer"] = self.reactor.llamar_en(espera, self._typing_coalescido, target_id)
+            return False
+        self._enviar_typing(target_id, status)
+        return True
+
+    def _typing_coalescido(self, target_id):
+        st = self.typing_salida.get(target_id)
+        if not st: return
+        st["timer"] = None
+        pendiente, st["pendiente"] = st["pendiente"], None
+        if pendiente is not None and pendiente != st["enviado"]:
+            self._enviar_typing(target_id, pendiente)
+
+    def _enviar_typing(self, target_id, status):
+        """Encola TYPING por el pool; si la cola hacia un peer está ocupada se descarta para ese peer."""
+        st = self.typing_salida[target_id]
+        st["enviado"], st["t"] = status, time.time()
+        if not status and st["timer"]:
+            st["timer"].cancelar()
+            st["timer"], st["pendiente"] = None, None
         try:
-            from ghostwhisperchat.core.protocolo import empaquetar
-            from ghostwhisperchat.core.transporte import PORT_GROUP
-            import socket
-            import sys
-            
+            real_gid, destinos = self._destinos_chat(target_id)
             payload = {"status": status}
-            targets = []
-            
-            # --- FIX v2.152: Resolver Nombre Grupo -> GID ---
-            real_gid = None
-            if target_id in self.memoria.grupos_activos:
-                real_gid = target_id
-            else:
-                for g_gid, g_data in self.memoria.grupos_activos.items():
-                    if g_data.get('nombre') == target_id:
-                        real_gid = g_gid
-                        break
-             
-            # Caso 1: Grupo (Si encontramos GID valido)
             if real_gid:
-                 payload["gid"] = real_gid
-                 pkg = empaquetar("TYPING", payload, self.memoria.get_origen())
-                 
-                 g = self.memoria.grupos_activos[real_gid]
-                 members = g.get('miembros', {})
-                 
-                 for uid, m in members.items():
-                     if uid == self.memoria.mi_uid: continue
-                     dest = self._resolver_host_objetivo(m)
-                     if dest:
-                         port = m.get('port_priv', 44494)
-                         targets.append((dest, port))
+                payload["gid"] = real_gid
+            pkg = empaquetar("TYPING", payload, self.memoria.get_origen())
+            for dest, port in destinos:
+                self.despachador.encolar(dest, port, pkg, descartable=True, solo_si_libre=True)
+        except Exception as e:
+            print(f"[TYPING] Error difundiendo typing de {target_id}: {e}", file=sys.stderr)
 
-            # Caso 2: Privado (Solo si no era grupo)
-            else:
-                 p = self.memoria.buscar_peer(target_id)
-                 if not p and target_id in self.memoria.contactos:
-                     p = self.memoria.contactos[target_id]
-                 
-                 if p:
-                     pkg = empaquetar("TYPING", payload, self.memoria.get_origen())
-                     dest = self._resolver_host_objetivo(p)
-                     if dest:
-                         targets.append((dest, p.get('port_priv', 44494)))
-            
-            # Sending Loop (Tor Onion o LAN segun dest)
-            def _send_typing_async(targets_list, pkt):
-                for dest, port in targets_list:
-                    try:
-                        if str(dest).endswith('.onion'):
-                            s = self.red._conectar_socks5(dest, port, timeout=5.0)
-                        else:
-                            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                            s.settimeout(0.5)
-                            s.connect((dest, port))
-                        s.sendall(pkt + b'\n')
-                        s.close()
-                    except: pass
-            if targets:
-                threading.Thread(target=_send_typing_async, args=(targets, pkg), daemon=True).start()
-        except: pass
 
 if __name__ == "__main__":
     motor = Motor()
@@ -0,0 +1,547 @@
+# /usr/lib/ghostwhisperchat/logica/transferencias.py
+# Gestor de Transferencias de Archivos (--archivo / --foto-bg)
+#
+# ENVÍO: el bucle principal solo ENCOLA la transferencia y responde al instante.
+# Comprimir carpetas, hashear, leer y enviar cada chunk corre en hilos propios
+# (acotados), con estado por transferencia. El progreso para la UI no se escribe
+# desde estos hilos: se publica como evento en el reactor (llamar_pronto) y lo
+# entrega el hilo del bucle, así nunca se intercala con otra escritura a la UI.
+#
+# Reanudación: el id de red (tid) se deriva del emisor + sha256 del archivo, así
+# que reenviar el mismo archivo continúa la transferencia anterior.
+#   Emisor -> FILE_OFFER {tid, sha256, chunk_size...}
+#   Receptor -> FILE_ACCEPT {tid, faltantes: [chunk_id, ...]}
+#   Emisor -> FILE_CHUNK solo de los faltantes (cabecera con sha256_chunk)
+#   Emisor -> FILE_STATUS {tid} si se cortó la conexión (respuesta: FILE_ACCEPT)
+#
+# RECEPCIÓN (ArchivoEntrante): el .part se preasigna (sparse) con el tamaño final,
+# cada chunk se escribe con pwrite en su offset (orden de llegada indiferente),
+# se verifica su sha256 y se marca en un bitmap persistido en <part>.map.
+# Al completar el bitmap se verifica el sha256 del archivo entero (en un hilo).
+
+import os
+import sys
+import time
+import json
+import math
+import queue
+import hashlib
+import threading
+
+MAX_HILOS = 2                       # Transferencias simultáneas
+CHUNK_SIZE = 10 * 1024 * 1024       # 10MB
+MAX_SIZE = 2 * 1024 * 1024 * 1024   # 2GB
+HISTORIAL_MAX = 20                  # Transferencias terminadas que se siguen listando
+ESPERA_ACCEPT_LAN = 10.0            # Segundos esperando FILE_ACCEPT (LAN)
+ESPERA_ACCEPT_ONION = 60.0          # Idem Tor
+REINTENTOS = 3                      # Rondas FILE_STATUS + reenvío de faltantes tras un corte
+ENTRANTE_INACTIVO = 600.0           # Recepción sin datos: se suelta (fd cerrado; .part y .map quedan para reanudar)
+
+EN_COLA = "EN COLA"
+PREPARANDO = "PREPARANDO"
+ENVIANDO = "ENVIANDO"
+COMPLETADA = "COMPLETADA"
+CANCELADA = "CANCELADA"
+FALLIDA = "FALLIDA"
+TERMINALES = (COMPLETADA, CANCELADA, FALLIDA)
+
+
+class Transferencia:
+    def __init__(self, tid, chat_id, ruta, silenciosa):
+        self.tid = tid
+        self.chat_id = chat_id
+        self.ruta = ruta
+        self.filename = os.path.basename(ruta.rstrip(os.sep))
+        self.silenciosa = silenciosa
+        self.estado = EN_COLA
+        self.size = 0
+        self.enviados = 0          # Bytes del archivo ya enviados (a todos los destinos)
+        self.chunk = 0
+        self.total_chunks = 0
+        self.destinos = 0
+        self.error = None
+        self.t_inicio = time.time()
+        self.t_fin = None
+        self.cancelar = threading.Event()
+
+    def porcentaje(self):
+        if not self.size:
+            return 100 if self.estado == COMPLETADA else 0
+        return int(self.enviados * 100 / self.size)
+
+
+class GestorTransferencias:
+    def __init__(self, motor, max_hilos=MAX_HILOS):
+        self.motor = motor
+        self.max_hilos = max_hilos
+        self._cola = queue.Queue()
+        self._hilos = []
+        self._lock = threading.Lock()
+        self.transferencias = {}   # tid -> Transferencia (activas + últimas terminadas)
+        self._esperas = {}         # (tid_red, uid) -> [threading.Event, faltantes | None]
+        self.entrantes = {}        # tid_red -> ArchivoEntrante (recepción, hilo del bucle)
+
+    # --- API (hilo del bucle) ---
+
+    def encolar(self, chat_id, ruta, silenciosa=False):
+        """Registra una transferencia y la deja en cola. Retorna la Transferencia."""
+        tid = hashlib.sha1(f"{self.motor.memoria.mi_uid}{ruta}{time.time()}".encode()).hexdigest()[:8]
+        t = Transferencia(tid, chat_id, ruta, silenciosa)
+        with self._lock:
+            self.transferencias[tid] = t
+            self._podar()
+            if len(self._hilos) < self.max_hilos:
+                h = threading.Thread(target=self._worker, daemon=True, name=f"transferencias-{len(self._hilos)}")
+                self._hilos.append(h)
+                h.start()
+        self._cola.put(t)
+        return t
+
+    def cancelar(self, tid_prefijo):
+        """Cancela una transferencia por tid (o prefijo). Retorna la Transferencia o None."""
+        with self._lock:
+            candidatas = [t for tid, t in self.transferencias.items()
+                          if tid.startswith(tid_prefijo) and t.estado not in TERMINALES]
+        if len(candidatas) != 1:
+            return None
+        candidatas[0].cancelar.set()
+        return candidatas[0]
+
+    def cancelar_todas(self):
+        with self._lock:
+            for t in self.transferencias.values():
+                t.cancelar.set()
+
+    def activas(self):
+        with self._lock:
+            return [t for t in self.transferencias.values() if t.estado not in TERMINALES]
+
+    def listar(self):
+        """Tabla de transferencias para --transferencias."""
+        from ghostwhisperchat.datos.recursos import Colores
+        with self._lock:
+            lista = sorted(self.transferencias.values(), key=lambda t: t.t_inicio)
+        if not lista:
+            return "[*] No hay transferencias."
+        colores = {COMPLETADA: Colores.GREEN, CANCELADA: Colores.YELLOW, FALLIDA: Colores.RED}
+        res = f"\n{Colores.BOLD}📦 TRANSFERENCIAS:{Colores.RESET}\n"
+        for t in lista:
+            color = colores.get(t.estado, Colores.CYAN)
+            partes = f"{t.chunk}/{t.total_chunks}" if t.total_chunks else "-"
+            res += (f"   {Colores.GREY}{t.tid}{Colores.RESET}  {color}{t.estado:<10}{Colores.RESET} "
+                    f"{t.porcentaje():>3}%  {partes:>7}  {t.size / 1024 / 1024:>8.1f}MB  {t.filename}")
+            if t.error:
+                res += f"  {Colores.RED}({t.error}){Colores.RESET}"
+            res += "\n"
+        res += f"{Colores.GREY}   Cancelar: --cancelar <ID>{Colores.RESET}\n"
+        return res
+
+    def _podar(self):
+        """Descarta las terminadas más viejas (llamar con _lock tomado)."""
+        terminadas = sorted((t for t in self.transferencias.values() if t.estado in TERMINALES),
+                            key=lambda t: t.t_fin or 0)
+        for t in terminadas[:max(0, len(terminadas) - HISTORIAL_MAX)]:
+            del self.transferencias[t.tid]
+
+    # --- Eventos hacia la UI (se entregan en el hilo del bucle) ---
+
+    def _ui(self, t, texto):
+        if not t.silenciosa:
+            self.motor.reactor.llamar_pronto(self.motor.enviar_a_ui, t.chat_id, texto)
+
+    # --- Worker ---
+
+    def _worker(self):
+        while True:
+            t = self._cola.get()
+            temp_zip = None
+            try:
+                if t.cancelar.is_set():
+                    t.estado = CANCELADA
+                    continue
+                t.estado = PREPARANDO
+                ruta = t.ruta
+                # Handle Directory -> Zip (ya no bloquea el bucle principal)
+                if os.path.isdir(ruta):
+                    import shutil
+                    import tempfile
+                    base = os.path.join(tempfile.gettempdir(), f"{t.filename}_{t.tid}")
+                    temp_zip = shutil.make_archive(base, 'zip', ruta)
+                    t.filename = t.filename + ".zip"
+                    ruta = temp_zip
+
+                t.size = os.path.getsize(ruta)
+                if t.size > MAX_SIZE:
+                    raise ValueError(f"Archivo muy grande ({t.size/1024/1024:.1f}MB). Max 2GB.")
+
+                self._enviar(t, ruta)
+            except Exception as e:
+                t.estado = FALLIDA
+                t.error = str(e)
+                print(f"[TRANSFER] {t.tid} falló: {e}", file=sys.stderr)
+                self._ui(t, f"\n[SISTEMA] [X] Error enviando archivo '{t.filename}': {e}\n")
+            finally:
+                t.t_fin = time.time()
+                # Cleanup temp zip
+                if temp_zip and os.path.exists(temp_zip):
+                    os.unlink(temp_zip)
+
+    def _destinos(self, chat_id):
+        """(host, port, uid) de cada destinatario del chat (Soporta IP LAN y Onion WAN)."""
+        m = self.motor
+        targets = []
+        if chat_id in m.memoria.grupos_activos:
+            g = m.memoria.grupos_activos[chat_id]
+            for uid, miembro in list(g['miembros'].items()):
+                if uid == m.memoria.mi_uid: continue
+                target = m._resolver_host_objetivo(miembro)
+                if target:
+                    targets.append((target, miembro.get('port_priv', 44494), uid))
+        else:
+            peer = m.memoria.buscar_peer(chat_id) or m.memoria.contactos.get(chat_id)
+            if peer:
+                target = m._resolver_host_objetivo(peer)
+                if target:
+                    targets.append((target, peer.get('port_priv', 44494), peer.get('uid', chat_id)))
+        return targets
+
+    def _hashear(self, t, ruta):
+        """sha256 de cada chunk y del archivo completo (una sola lectura)."""
+        total = hashlib.sha256()
+        por_chunk = []
+        with open(ruta, 'rb') as f:
+            for _ in range(t.total_chunks):
+                if t.cancelar.is_set():
+                    return None, None
+                bloque = f.read(CHUNK_SIZE)
+                total.update(bloque)
+                por_chunk.append(hashlib.sha256(bloque).hexdigest())
+        return por_chunk, total.hexdigest()
+
+    # --- Negociación de faltantes (FILE_OFFER / FILE_STATUS -> FILE_ACCEPT) ---
+
+    def accept_recibido(self, uid, payload):
+        """FILE_ACCEPT de un receptor (hilo del bucle): despierta al emisor que lo espera."""
+        espera = self._esperas.get((payload.get("tid"), uid))
+        if espera:
+            espera[1] = payload.get("faltantes")
+            espera[0].set()
+
+    def _negociar(self, tipo, info, destinos, previos):
+        """
+        Envía FILE_OFFER / FILE_STATUS a cada destino y espera su FILE_ACCEPT.
+        Retorna {destino: set(chunk_ids faltantes)}. Sin respuesta: se mantienen `previos`.
+        """
+        m = self.motor
+        from ghostwhisperchat.core.protocolo import empaquetar
+        tid = info["tid"]
+        pkg = empaquetar(tipo, info if tipo == "FILE_OFFER" else {"tid": tid}, m.memoria.get_origen())
+        esperas = {}
+        for d in destinos:
+            esperas[d] = self._esperas[(tid, d[2])] = [threading.Event(), None]
+            m.red.enviar_tcp_priv(d[0], pkg, port=d[1])
+
+        resultado = {}
+        for d, espera in esperas.items():
+            limite = ESPERA_ACCEPT_ONION if str(d[0]).endswith(".onion") else ESPERA_ACCEPT_LAN
+            if espera[0].wait(limite) and espera[1] is not None:
+                resultado[d] = set(int(c) for c in espera[1])
+            else:
+                print(f"[TRANSFER] {tid}: sin {tipo} -> FILE_ACCEPT de {d[0]}, se asume {len(previos[d])} faltante(s)", file=sys.stderr)
+                resultado[d] = set(previos[d])
+            self._esperas.pop((tid, d[2]), None)
+        return resultado
+
+    def _enviar(self, t, ruta):
+        import base64
+        from ghostwhisperchat.core.protocolo import empaquetar
+        from ghostwhisperchat.datos.recursos import Colores
+        m = self.motor
+
+        t.total_chunks = max(1, math.ceil(t.size / CHUNK_SIZE))
+        gid_ctx = t.chat_id if t.chat_id in m.memoria.grupos_activos else None # Inject Context
+        targets = self._destinos(t.chat_id)
+        if not targets:
+            raise ValueError("Sin destinatarios alcanzables")
+        t.destinos = len(targets)
+
+        # Peers v4: canal binario (cabecera JSON + bytes crudos via sendfile), reanudable.
+        # El resto sigue recibiendo FILE_CHUNK con base64 (legado).
+        bin_targets = [d for d in targets if m.red.soporta_binario(d[0], d[1])]
+        legacy_targets = [d for d in targets if d not in bin_targets]
+
+        hashes, sha_total = self._hashear(t, ruta) if bin_targets else ([], None)
+        if hashes is None:
+            return self._cancelada(t, 0)
+        # tid de red determinístico: el mismo archivo reanuda la transferencia previa
+        tid_red = hashlib.sha1(f"{m.memoria.mi_uid}:{t.filename}:{sha_total or t.tid}".encode()).hexdigest()[:12]
+        info = {
+            "tid": tid_red,
+            "filename": t.filename,
+            "filesize": t.size,
+            "total_chunks": t.total_chunks,
+            "chunk_size": CHUNK_SIZE,
+            "sha256": sha_total,
+            "gid": gid_ctx
+        }
+        todos = set(range(1, t.total_chunks + 1))
+        t.estado = ENVIANDO
+        pendientes = {d: todos for d in bin_targets}
+        if bin_targets:
+            pendientes = self._negociar("FILE_OFFER", info, bin_targets, pendientes)
+            for d, faltan in pendientes.items():
+                if len(faltan) < t.total_chunks:
+                    print(f"[TRANSFER] {tid_red}: {d[0]} ya tiene {t.total_chunks - len(faltan)}/{t.total_chunks} partes, reanudando", file=sys.stderr)
+
+        with open(ruta, 'rb') as f:
+            ronda = 0
+            while True:
+                cortados = set()
+                for i in range(t.total_chunks):
+                    if t.cancelar.is_set():
+                        return self._cancelada(t, i)
+
+                    chunk_id = i + 1
+                    offset = i * CHUNK_SIZE
+                    largo = min(CHUNK_SIZE, t.size - offset)
+
+                    destinos_chunk = [d for d, faltan in pendientes.items() if chunk_id in faltan and d not in cortados]
+                    if destinos_chunk:
+                        cabecera = empaquetar("FILE_CHUNK", dict(info, chunk_id=chunk_id, offset=offset, largo=largo,
+                                                                 sha256_chunk=hashes[i], bin=True),
+                                              m.memoria.get_origen())
+                        for d in destinos_chunk:
+                            if m.red.enviar_archivo_bin(d[0], cabecera, f, offset, largo, port=d[1]):
+                                pendientes[d] = pendientes[d] - {chunk_id}
+                            else:
+                                cortados.add(d)  # No insistir en esta ronda: se negocia de nuevo al final
+
+                    if legacy_targets and ronda == 0:
+                        f.seek(offset)
+                        raw = f.read(largo)
+                        pkg = empaquetar("FILE_CHUNK", {
+                            "filename": t.filename,
+                            "chunk_id": chunk_id,
+                            "total_chunks": t.total_chunks,
+                            "data": base64.b64encode(raw).decode('ascii'),
+                            "filesize": t.size,
+                            "gid": gid_ctx
+                        }, m.memoria.get_origen())
+                        del raw
+                        for d in legacy_targets:
+                            try: m.red.enviar_tcp_priv(d[0], pkg, port=d[1])
+                            except: pass
+                        del pkg
+
+                    if ronda == 0:
+                        t.chunk = chunk_id
+                        t.enviados = offset + largo
+                        self._ui(t, f"\r[SISTEMA] [*] Enviando '{t.filename}': {t.porcentaje()}% (Parte {chunk_id}/{t.total_chunks})")
+
+                incompletos = [d for d, faltan in pendientes.items() if faltan]
+                if not incompletos:
+                    break
+                ronda += 1
+                if ronda > REINTENTOS:
+                    raise ValueError(f"{len(incompletos)} destino(s) sin completar tras {REINTENTOS} reintentos")
+                # Conexión cortada: preguntar qué falta y reenviar solo eso
+                time.sleep(min(2 ** ronda, 10))
+                print(f"[TRANSFER] {tid_red}: ronda {ronda}, consultando faltantes a {len(incompletos)} destino(s)", file=sys.stderr)
+                nuevos = self._negociar("FILE_STATUS", info, incompletos, pendientes)
+                pendientes = {d: nuevos.get(d, set()) for d in incompletos}
+
+        t.estado = COMPLETADA
+        print(f"[TRANSFER] {t.tid} completada: {t.filename} ({t.size}b a {t.destinos} destino(s))", file=sys.stderr)
+        # Estilo ligero: Verde Texto (sin background)
+        self._ui(t, f"\n\n{Colores.C_GREEN_NEON} [SISTEMA] Archivo enviado correctamente: {t.filename} {Colores.RESET}\n")
+
+    def _cancelada(self, t, i):
+        t.estado = CANCELADA
+        print(f"[TRANSFER] {t.tid} cancelada en parte {i}/{t.total_chunks}", file=sys.stderr)
+        self._ui(t, f"\n[SISTEMA] [!] Transferencia cancelada: {t.filename}\n")
+
+    # --- Recepción (hilo del bucle) ---
+
+    def entrante(self, info, origen):
+        """
+        ArchivoEntrante para un tid (FILE_OFFER / FILE_STATUS / cabecera FILE_CHUNK).
+        Si existe un .part + .map previo del mismo tid, se reanuda desde ahí.
+        Retorna None si la metadata no es válida.
+        """
+        tid = str(info.get("tid") or "")
+        ent = self.entrantes.get(tid)
+        if ent is not None or not tid:
+            return ent
+        try:
+            size = int(info.get("filesize", 0))
+            chunk_size = int(info.get("chunk_size") or CHUNK_SIZE)
+            total = int(info.get("total_chunks", 1))
+        except (TypeError, ValueError):
+            return None
+        if size < 0 or size > MAX_SIZE or chunk_size <= 0 or total != max(1, math.ceil(size / chunk_size)):
+            print(f"[FILE] Metadata inválida para {tid}: {size}b / {chunk_size} / {total}", file=sys.stderr)
+            return None
+        safe_tid = "".join(c for c in tid if c.isalnum() or c in "-_")[:64]
+        filename = os.path.basename(str(info.get("filename") or "archivo"))
+        part_path = os.path.join(directorio_recepcion(), f".{filename}.{safe_tid}.part")
+        ent = ArchivoEntrante(tid, filename, size, chunk_size, total, info.get("sha256"),
+                              info.get("gid"), origen, part_path)
+        self.entrantes[tid] = ent
+        self.motor.reactor.llamar_en(ENTRANTE_INACTIVO, self._expirar_entrante, tid)
+        return ent
+
+    def _expirar_entrante(self, tid):
+        """Temporizador de inactividad: una recepción cortada no retiene su fd ni su entrada."""
+        ent = self.entrantes.get(tid)
+        if ent is None or ent.verificando:
+            return
+        resto = ent.t_actividad + ENTRANTE_INACTIVO - time.time()
+        if resto > 0:
+            self.motor.reactor.llamar_en(resto, self._expirar_entrante, tid)
+            return
+        del self.entrantes[tid]
+        ent.cerrar()
+        print(f"[FILE] Recepción de {ent.filename} inactiva, liberada ({sum(ent.recibidos)}/{ent.total_chunks} partes)", file=sys.stderr)
+
+    def chunk_recibido(self, ent, chunk_id):
+        """Marca un chunk verificado; al completar, verifica el archivo entero en un hilo."""
+        ent.marcar(chunk_id)
+        if not ent.completo() or ent.verificando:
+            return
+        ent.verificando = True
+        ent.cerrar()
+        threading.Thread(target=self._verificar, args=(ent,), daemon=True).start()
+
+    def _verificar(self, ent):
+        ok = True
+        if ent.sha256:
+            h = hashlib.sha256()
+            try:
+                with open(ent.part_path, 'rb') as f:
+                    for bloque in iter(lambda: f.read(1024 * 1024), b""):
+                        h.update(bloque)
+                ok = (h.hexdigest() == ent.sha256)
+            except OSError:
+                ok = False
+        self.motor.reactor.llamar_pronto(self._verificado, ent, ok)
+
+    def _verificado(self, ent, ok):
+        self.entrantes.pop(ent.tid, None)
+        if not ok:
+            # Los chunks pasaron su hash pero el total no: empezar de cero
+            print(f"[FILE] sha256 de {ent.filename} no coincide, descartando {ent.part_path}", file=sys.stderr)
+            ent.descartar()
+            return
+        try: os.unlink(ent.map_path)
+        except OSError: pass
+        self.motor._finalizar_archivo_recibido(ent.filename, ent.part_path, ent.origen, ent.gid)
+
+
+def directorio_recepcion():
+    """~/Escritorio/GhostWhisper_Recibidos (o ~/Desktop, o ~)."""
+    base_dir = os.path.expanduser("~/Escritorio")
+    if not os.path.exists(base_dir): base_dir = os.path.expanduser("~/Desktop")
+    if not os.path.exists(base_dir): base_dir = os.path.expanduser("~")
+    dest_dir = os.path.join(base_dir, "GhostWhisper_Recibidos")
+    os.makedirs(dest_dir, exist_ok=True)
+    return dest_dir
+
+
+class ArchivoEntrante:
+    """Archivo en recepción: .part preasignado + bitmap de chunks en <part>.map."""
+
+    def __init__(self, tid, filename, size, chunk_size, total_chunks, sha256, gid, origen, part_path):
+        self.tid = tid
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.total_chunks = total_chunks
+        self.sha256 = sha256
+        self.gid = gid
+        self.origen = origen
+        self.part_path = part_path
+        self.map_path = part_path + ".map"
+        self.recibidos = bytearray(total_chunks)
+        self.verificando = False
+        self.t_actividad = time.time()
+        self._fd = None
+        self._cargar_mapa()
+
+    def _cargar_mapa(self):
+        try:
+            with open(self.map_path, 'r', encoding='utf-8') as f:
+                mapa = json.load(f)
+            if (mapa.get("tid") == self.tid and mapa.get("filesize") == self.size and
+                    mapa.get("chunk_size") == self.chunk_size and os.path.exists(self.part_path)):
+                bits = bytearray.fromhex(mapa.get("recibidos", ""))
+                if len(bits) == self.total_chunks:
+                    self.recibidos = bits
+                    print(f"[FILE] Reanudando {self.filename}: {sum(bits)}/{self.total_chunks} partes en disco", file=sys.stderr)
+        except (OSError, ValueError):
+            pass
+
+    def guardar_mapa(self):
+        tmp = self.map_path + ".tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"tid": self.tid, "filename": self.filename, "filesize": self.size,
+                           "chunk_size": self.chunk_size, "sha256": self.sha256,
+                           "recibidos": self.recibidos.hex()}, f)
+            os.replace(tmp, self.map_path)
+        except OSError as e:
+            print(f"[FILE] Error guardando {self.map_path}: {e}", file=sys.stderr)
+
+    def faltantes(self):
+        return [i + 1 for i, b in enumerate(self.recibidos) if not b]
+
+    def tiene(self, chunk_id):
+        return 1 <= chunk_id <= self.total_chunks and self.recibidos[chunk_id - 1] == 1
+
+    def completo(self):
+        return all(self.recibidos)
+
+    def rango_valido(self, chunk_id, offset, largo):
+        return (1 <= chunk_id <= self.total_chunks and offset == (chunk_id - 1) * self.chunk_size and
+                largo == min(self.chunk_size, self.size - offset))
+
+    def _abrir(self):
+        if self._fd is None:
+            nuevo = not os.path.exists(self.part_path)
+            self._fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o600)
+            if nuevo or os.fstat(self._fd).st_size != self.size:
+                # Preasignación sparse: el archivo ya tiene su tamaño final, sin escribir ceros
+                os.ftruncate(self._fd, self.size)
+                if nuevo:
+                    self.recibidos = bytearray(self.total_chunks)
+                self.guardar_mapa()
+        return self._fd
+
+    def escribir(self, offset, datos):
+        """pwrite en el offset (sin seek ni reabrir el archivo por chunk)."""
+        fd = self._abrir()
+        self.t_actividad = time.time()
+        with memoryview(datos) as mv:
+            escrito = 0
+            while escrito < len(mv):
+                escrito += os.pwrite(fd, mv[escrito:], offset + escrito)
+
+    def marcar(self, chunk_id):
+        self.recibidos[chunk_id - 1] = 1
+        self.guardar_mapa()
+
+    def reiniciar(self):
+        """Bitmap a cero (el .part se sobrescribe): un stream legado vuelve a empezar."""
+        self.recibidos = bytearray(self.total_chunks)
+        self.guardar_mapa()
+
+    def cerrar(self):
+        if self._fd is not None:
+            try: os.close(self._fd)
+            except OSError: pass
+            self._fd = None
+
+    def descartar(self):
+        self.cerrar()
+        for ruta in (self.part_path, self.map_path):
+            try: os.unlink(ruta)
+            except OSError: pass